@@ -1,23 +1,24 @@
 import json
 import logging
+import os
 import re
 import sys
 import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import astuple, fields
 from pathlib import Path
-from typing import Any, Dict, List, NamedTuple, Optional, Tuple, Union
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple, Union
 
 import requests
 import pandas
 from bs4 import BeautifulSoup
 from inflection import underscore # camelCase to snake_case
-from selenium import webdriver
-from selenium.common.exceptions import WebDriverException
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.ui import Select, WebDriverWait
-from webdriver_manager.chrome import ChromeDriverManager
+
+from util.http import FetchError, RateLimiter, ThreadLocalSession, get_with_backoff
+from util.instrumentation import StageRun
+from util.jsonl import JsonlSink, read_jsonl
+
+logger = logging.getLogger(__name__)
 
 
 class _CustomWaitForAllData:
@@ -39,6 +40,9 @@ class _CustomWaitForChange:
         self.prev = prev
 
     def __call__(self, driver):
+        from selenium.common.exceptions import WebDriverException
+        from selenium.webdriver.support import expected_conditions as EC
+
         try:
             elements = EC.presence_of_all_elements_located(
                 self.locator)(driver)
@@ -53,7 +57,14 @@ class _CustomWaitForChange:
 class AsoprsBasicDataApi:
     @classmethod
     def get_asoprs_lst(cls) -> pandas.DataFrame:
-        all_asoprs = pandas.DataFrame(columns=["name", "photo_url"])
+        """The directory is an Angular app without a documented search API, so this needs a browser."""
+        from selenium import webdriver
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.support.ui import Select, WebDriverWait
+        from webdriver_manager.chrome import ChromeDriverManager
+
+        rows = []
 
         driver = webdriver.Chrome(ChromeDriverManager().install())
         driver.get(
@@ -101,7 +112,7 @@ class AsoprsBasicDataApi:
                 img_url = elem.find_element_by_css_selector(
                     '.ds-avatar > img').get_attribute('src')  # contains profile link
 
-                all_asoprs.loc[len(all_asoprs), :] = [name, img_url]
+                rows.append([name, img_url])
                 logger.debug(f"name: {name}, img_url: {img_url}")
 
             prev = profiles
@@ -109,75 +120,102 @@ class AsoprsBasicDataApi:
 
             logger.debug('button clicked')
 
-        return all_asoprs
+        return pandas.DataFrame(rows, columns=["name", "photo_url"])
+
+
+class FetchFailure(NamedTuple):
+    id: int
+    error: str
+    attempts: int
+    status: Optional[int]
 
 
 class AsoprsAdvancedDataApi:
+    PROFILE_URL = 'https://www.asoprs.org/index.php?option=com_community&view=profile&userid={idx}'
     GET_JSON = re.compile('attributesView\s*:\s*(\{.+\})')
     EXCLUDED_LABELS = ['label', 'type', 'typeLabelId', 'attributeId', 'displayType', 'maxLength']
 
     @classmethod
-    def get_detailed_asoprs_data(cls, df: pandas.DataFrame, id_column_name: str, workers: int, sleep_time: float) -> pandas.DataFrame:
+    def get_detailed_asoprs_data(cls, df: pandas.DataFrame, id_column_name: str, workers: int, sleep_time: float,
+                                 requests_per_second: Optional[float] = None, max_retries: int = 5,
+                                 sink_path: str = 'data/raw/_asoprs_profiles.jsonl'
+                                 ) -> Tuple[pandas.DataFrame, List[FetchFailure]]:
+        """
+        `sleep_time` is the base of the exponential backoff, and `requests_per_second`
+        is shared by all workers. Ids that still fail are returned as `FetchFailure`s.
+
+        Each profile is appended to `sink_path` as it arrives, and ids already in it
+        aren't fetched again. The wide frame is pivoted from all records once at the end.
+        """
         df = df.copy()
         df[id_column_name] = df[id_column_name].astype(int)
         df.index = df[id_column_name
         ]
+
+        records = {rec['id']: rec['attrs'] for rec in read_jsonl(sink_path)}
+        todo = [i for i in df.index if i not in records]
+        logger.info(f"{len(df) - len(todo)} profiles already in {sink_path}, fetching {len(todo)}")
+
+        sessions = ThreadLocalSession(workers)
+        rate_limiter = RateLimiter(requests_per_second, burst=workers)
         tpe = ThreadPoolExecutor(max_workers=workers)
 
         futs_to_idxs = {tpe.submit(
-            cls._worker_get_detailed, i, sleep_time): i for i in df.index}
+            cls._worker_get_detailed, i, sessions.get, rate_limiter, sleep_time, max_retries): i for i in todo}
 
+        failures = []
+        start = time.perf_counter()
         i = 0
-        for fut in as_completed(futs_to_idxs):
-            res = fut.result()
-            
-            idx = futs_to_idxs[fut]
+        with JsonlSink(sink_path) as sink:
+            for fut in as_completed(futs_to_idxs):
+                idx = futs_to_idxs[fut]
+                i += 1
+
+                try:
+                    res = fut.result()
+                except FetchError as e:
+                    failures.append(FetchFailure(idx, e.reason or str(e), e.attempts, e.status))
+                    logger.error(f"giving up on {idx}: {e}")
+                    continue
+                except Exception as e:
+                    failures.append(FetchFailure(idx, repr(e), 1, None))
+                    logger.error(f"couldn't parse profile {idx}: {e!r}")
+                    continue
+
+                logger.debug(f"{len(res)} attributes for {idx}")
 
-            logger.debug(f"result recieved: {res} for {idx}")
+                sink.append({'id': int(idx), 'attrs': res})
+                records[idx] = res
 
-            for k, v in res.items():
-                df.at[idx, k] = v
-            df.to_csv('data/raw/_asoprs_raw.csv')
-                
-            i += 1
+                if i % 50 == 0 or i == len(todo):
+                    logger.info(f"Done with {i}/{len(todo)} ({i / (time.perf_counter() - start):.2f} pages/sec)")
 
-            logger.info(f"Done with {i}/{len(df)}")
+        tpe.shutdown()
 
-        return df
+        wide = pandas.DataFrame.from_dict(records, orient='index')
+        df = df.join(wide.drop(columns=df.columns, errors='ignore'))
+        return df, failures
 
     @classmethod
-    def _worker_get_detailed(cls, idx: str, sleep_time: float) -> Dict[str, Any]:
-        url = f'https://www.asoprs.org/index.php?option=com_community&view=profile&userid={idx}'
-
-        logger.info(f"Getting url: {url}")
-
-        while True:  # rate limit
-            resp = None
-            try:
-                resp = requests.get(url)
-            except Exception as e:
-                logger.error(f"sleeping because exception trying to access {url}")
-                time.sleep(sleep_time)
-                continue
-
-            status = resp.status_code
-            if status in [429, 443]:
-                logger.warning(f"sleeping because of status: {status} trying to access {url}")
-                time.sleep(sleep_time)
-                continue
-            break
-        
-        logger.debug(f"resp.text: {resp.text} trying to access {url}")
-
-        match = cls.GET_JSON.search(resp.text)
-        d = json.loads(match.group(1))
+    def _worker_get_detailed(cls, idx: str, get_session: Callable[[], requests.Session],
+                             rate_limiter: RateLimiter, sleep_time: float, max_retries: int) -> Dict[str, Any]:
+        url = cls.PROFILE_URL.format(idx=idx)
 
-        
-        logger.info(f"network success, got dict d: {d} trying to access {url}")
+        resp = get_with_backoff(get_session(), url, rate_limiter, max_retries=max_retries, backoff=sleep_time)
 
-        attrs = d['builtInAttributes'] + d['customAttributes']
+        logger.debug(f"{url}: {resp.status_code}, {len(resp.text)} characters")
+
+        return cls.parse_profile(resp.text, url)
 
-        logger.debug(f"attrs: {attrs} trying to access {url}")
+    @classmethod
+    def parse_profile(cls, html: str, url: str = '') -> Dict[str, Any]:
+        """`<label>_<field>` -> value for every attribute in a profile page's attributesView."""
+        match = cls.GET_JSON.search(html)
+        if match is None:
+            raise ValueError(f"no attributesView in {url}")
+        d = json.loads(match.group(1))
+
+        attrs = d['builtInAttributes'] + d['customAttributes']
 
         formatted_attrs = {}
 
@@ -198,18 +236,25 @@ class AsoprsAdvancedDataApi:
 
         return formatted_attrs
 
-logging.basicConfig()
-logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
-
 if __name__ == '__main__':
-    # basic_df = AsoprsBasicDataApi.get_asoprs_lst()
-    # basic_df.to_csv('data/raw/_basic_asoprs_raw.csv')
+    logging.basicConfig(level=logging.INFO)
 
-    basic_df = pandas.read_csv('data/raw/_basic_asoprs_raw.csv', index_col=0)
+    BASIC_CSV_PATH = 'data/raw/_basic_asoprs_raw.csv'
+    # the member list rarely changes and needs a browser, so it's only scraped when missing
+    if not os.path.exists(BASIC_CSV_PATH):
+        AsoprsBasicDataApi.get_asoprs_lst().to_csv(BASIC_CSV_PATH)
+
+    basic_df = pandas.read_csv(BASIC_CSV_PATH, index_col=0)
     ids = basic_df['photo_url'].apply(lambda s: s.split('/')[-2])
     basic_df['idx'] = ids
 
-    advanced_df = AsoprsAdvancedDataApi.get_detailed_asoprs_data(basic_df, 'idx', 5, 10)
-    
-    advanced_df.to_csv('data/raw/_asoprs_raw.csv')
+    with StageRun('asoprs') as run:
+        advanced_df, failures = AsoprsAdvancedDataApi.get_detailed_asoprs_data(
+            basic_df, 'idx', 5, 10, requests_per_second=2)
+        run.rows(len(advanced_df))
+        run.metrics.incr('failures', len(failures))
+
+        advanced_df.to_csv('data/raw/_asoprs_raw.csv')
+        if failures:
+            pandas.DataFrame(failures).to_csv('data/raw/_asoprs_failures.csv', index=False)
+            logger.warning(f"{len(failures)} profiles failed, see data/raw/_asoprs_failures.csv")
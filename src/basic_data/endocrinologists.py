@@ -1,9 +1,20 @@
+import itertools
+import logging
 import re
-from typing import Any, Dict, List, Optional, Type, Union
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple, Type, Union
 
+import lxml.html
 import pandas
-import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, Comment, Tag
+from lxml import etree
+
+from util.html import has_class
+from util.http import RateLimiter, ThreadLocalSession, get_with_backoff
+from util.instrumentation import StageRun
+
+logger = logging.getLogger(__name__)
 
 
 class RE_CONSTANTS:
@@ -38,7 +49,7 @@ class EndocrinologistApi:
             try:
                 res = func()
             except Exception as e:
-                print(field, e)
+                logger.debug(f'no {field}: {e!r}')
                 res = None
 
             if isinstance(res, dict):
@@ -118,8 +129,11 @@ class EndocrinologistApi:
                     class_='endocrinologist-list-item__description')
                 break
 
+        # text for text nodes and for any inline elements; comments dropped
         concentrations = [
-            i for i in concentrations_elem.children if str(i) != '<br/>']
+            i.get_text() if isinstance(i, Tag) else str(i)
+            for i in concentrations_elem.children
+            if str(i) != '<br/>' and not isinstance(i, Comment)]
 
         return concentrations
 
@@ -131,15 +145,242 @@ class EndocrinologistApi:
                 return cert
 
 
-if __name__ == '__main__':
+class EndocrinologistPageParser:
+    """
+    Same fields as `EndocrinologistApi.get_dict`, but the results page is parsed once
+    with lxml and every field comes from a precompiled XPath instead of repeated
+    BeautifulSoup subtree scans and `prettify()`.
+    """
+
+    _ITEMS = etree.XPath(f"//*[{has_class('endocrinologist-list-item')}]")
+    _TITLE = etree.XPath(f".//*[{has_class('endocrinologist-list-item__title')}]")
+    _CONTACT_PS = etree.XPath(f"(.//*[{has_class('endocrinologist-list-item__contact')}])[1]//p")
+    _STRONG = etree.XPath(".//strong")
+    _INFO = etree.XPath(f".//*[{has_class('endocrinologist-list-item__info')}]")
+    _AREA_TITLES = etree.XPath(f".//*[{has_class('endocrinologist-list-item__area-title')}]")
+    _DESCRIPTION = etree.XPath(f".//*[{has_class('endocrinologist-list-item__description')}]")
+    _AREA_DESCRIPTION = etree.XPath(f".//*[{has_class('endocrinologist-list-item__area-description')}]")
+
+    FIELD_GROUPS = EndocrinologistApi.FIELD_GROUPS
+
+    @classmethod
+    def parse(cls, html: Union[str, bytes]) -> List[Dict[str, Any]]:
+        return [cls.get_dict(item) for item in cls._ITEMS(lxml.html.fromstring(html))]
+
+    @classmethod
+    def get_dict(cls, item: etree._Element) -> Dict[str, Any]:
+        d = {}
+        for field in cls.FIELD_GROUPS:
+            try:
+                res = getattr(cls, f'_get_{field}')(item)
+            except Exception as e:
+                logger.debug(f'no {field}: {e!r}')
+                res = None
+
+            if isinstance(res, dict):
+                d.update(res)
+            else:
+                d[field] = res
+
+        for k, v in d.items():
+            if isinstance(v, list):
+                d[k] = [getattr(val, 'strip', lambda: val)() for val in v]
+            else:
+                d[k] = getattr(v, 'strip', lambda: v)()
+        return d
+
+    @classmethod
+    def _get_title(cls, item: etree._Element) -> Dict[str, Union[str, List[str]]]:
+        raw_text = cls._TITLE(item)[0].text_content()
+        match = RE_CONSTANTS.TITLE_REGEX.search(raw_text)
+        assert match, raw_text
+        prefix, first, middle, last, degrees = match.groups()
+
+        return {
+            'full_name': raw_text,
+            'prefix': prefix,
+            'first_name': first,
+            'middle_name': middle.strip().split(' ') if middle else [],
+            'last_name': last.strip().split(' ') if last else [],
+            'degrees': degrees.replace(' ', '').split(',') if degrees else []
+        }
 
-    df = pandas.DataFrame(columns=[
-                          'full_name', 'prefix', 'first_name', 'middle_name', 'last_name', 'degrees', 'zipcode'])
-    r = requests.get(EndocrinologistApi.URL)
-    base_soup = BeautifulSoup(r.text, features='lxml')
-    for soup in base_soup.find_all(class_='endocrinologist-list-item'):
-        api = EndocrinologistApi()
-        d = api.get_dict(soup)
+    @classmethod
+    def _get_info(cls, item: etree._Element) -> Dict[str, str]:
+        d = {}
+        for elem in cls._CONTACT_PS(item):
+            k = cls._STRONG(elem)[0].text_content()
+            v = elem.text_content().strip(k)
+            k = k.strip(':').lower()
+
+            if k == 'languages':
+                v = v.split(', ')
+
+            d[k] = v
+        return d
+
+    @classmethod
+    def _get_address(cls, item: etree._Element) -> Dict[str, str]:
+        elem = cls._INFO(item)[0]
+        # one text node per line, like the prettify() output the regex was written against
+        source = '\n'.join(elem.itertext())
+
+        match = RE_CONSTANTS.LOCATION_REGEX.search(source)
+        assert match, source
+        city, state, zip_ = match.groups()
 
-        df = df.append(d, ignore_index=True)
-        df.to_csv('data/raw/_endocrinologists_raw.csv')
+        return {
+            'address_and_occupation': NotImplemented,
+            'city': city,
+            'state': state,
+            'zipcode': zip_
+        }
+
+    @classmethod
+    def _area(cls, item: etree._Element, title: str) -> Optional[etree._Element]:
+        for elem in cls._AREA_TITLES(item):
+            if elem.text_content() == title:
+                return elem.getparent()
+        return None
+
+    @classmethod
+    def _get_areas_of_concentration(cls, item: etree._Element) -> List[str]:
+        description = cls._DESCRIPTION(cls._area(item, 'Area of Concentration'))[0]
+
+        concentrations = [description.text] if description.text is not None else []
+        for child in description:
+            if isinstance(child.tag, str) and child.tag != 'br':  # comments' tags aren't strings
+                concentrations.append(child.text_content())
+            if child.tail is not None:
+                concentrations.append(child.tail)
+        return concentrations
+
+    @classmethod
+    def _get_board_cert(cls, item: etree._Element) -> Optional[str]:
+        area = cls._area(item, 'General Board Certification')
+        if area is None:
+            return None
+        return cls._AREA_DESCRIPTION(area)[0].text_content()
+
+
+def compare_parsers(html: str) -> List[Tuple[int, str, Any, Any]]:
+    """`(item, field, BeautifulSoup value, lxml value)` for every field where the two parsers disagree."""
+    fast = EndocrinologistPageParser.parse(html)
+    slow = [EndocrinologistApi().get_dict(soup) for soup in
+            BeautifulSoup(html, features='lxml').find_all(class_='endocrinologist-list-item')]
+    assert len(fast) == len(slow), (len(fast), len(slow))
+
+    return [(i, k, s.get(k), f.get(k))
+            for i, (s, f) in enumerate(zip(slow, fast))
+            for k in set(s) | set(f) if s.get(k) != f.get(k)]
+
+
+class CrawlResult(NamedTuple):
+    listings: pandas.DataFrame
+    failed_pages: List[Tuple[str, int]]  # (specialty, page) that failed every attempt
+
+
+class EndocrinologistCrawler:
+    """
+    Crawls every results page of every specialty on hormone.org's search, keeping
+    `workers` pages in flight in total and taking the specialties in turn. Each
+    specialty stops at its first empty page. A page that fails is retried up to
+    `page_retries` times and then reported in `CrawlResult.failed_pages`. Point
+    `search_url` at a local server replaying recorded pages to test it.
+    """
+
+    SEARCH_URL = 'https://www.hormone.org/find-an-endocrinologist/find-an-endocrinologist-results'
+    SPECIALTIES = (
+        'Adrenal', 'Diabetes', 'Lipids', 'Menopause', 'Obesity', 'Osteoporosis',
+        'Pediatric Endocrinology', 'Pituitary', 'Reproductive Endocrinology', 'Thyroid',
+        'Transgender Medicine',
+    )
+    DEDUPE_KEYS = ('full_name', 'zipcode', 'phone')
+
+    def __init__(self, search_url: str = SEARCH_URL, specialties: Iterable[str] = SPECIALTIES,
+                 workers: int = 8, requests_per_second: Optional[float] = None, max_pages: int = 1000,
+                 page_retries: int = 2):
+        self.search_url = search_url
+        self.specialties = tuple(specialties)
+        self.workers = workers
+        self.max_pages = max_pages
+        self.page_retries = page_retries
+        self._sessions = ThreadLocalSession(workers)
+        self._rate_limiter = RateLimiter(requests_per_second, burst=workers)
+
+    def _fetch_page(self, specialty: str, page: int) -> List[Dict[str, Any]]:
+        params = {'specialty': specialty, 'country': 'UNITED STATES', 'page': page}
+        resp = get_with_backoff(self._sessions.get(), self.search_url, self._rate_limiter, params=params)
+        resp.raise_for_status()
+        return EndocrinologistPageParser.parse(resp.text)
+
+    def crawl(self) -> CrawlResult:
+        records: Dict[Tuple, Dict[str, Any]] = {}
+        last_page = {s: self.max_pages for s in self.specialties}  # lowered at the first empty page
+        next_page = {s: 0 for s in self.specialties}
+        turns = itertools.cycle(self.specialties)
+        attempts: Counter = Counter()
+        retries: List[Tuple[str, int]] = []
+        failed: List[Tuple[str, int]] = []
+        running: Dict[Future, Tuple[str, int]] = {}
+
+        def next_job() -> Optional[Tuple[str, int]]:
+            while retries:
+                specialty, page = retries.pop()
+                if page < last_page[specialty]:
+                    return specialty, page
+            for _ in self.specialties:
+                specialty = next(turns)
+                if next_page[specialty] < last_page[specialty]:
+                    next_page[specialty] += 1
+                    return specialty, next_page[specialty] - 1
+            return None
+
+        with ThreadPoolExecutor(max_workers=self.workers) as tpe:
+            def fill() -> None:
+                while len(running) < self.workers and (job := next_job()) is not None:
+                    running[tpe.submit(self._fetch_page, *job)] = job
+
+            fill()
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    job = running.pop(fut)
+                    specialty, page = job
+                    try:
+                        items = fut.result()
+                    except Exception as e:
+                        attempts[job] += 1
+                        if attempts[job] <= self.page_retries:
+                            logger.warning(f'failed to fetch {specialty} page {page} ({e!r}), retrying')
+                            retries.append(job)
+                        else:
+                            logger.error(f'giving up on {specialty} page {page}', exc_info=e)
+                            failed.append(job)
+                        continue
+
+                    if not items:
+                        last_page[specialty] = min(last_page[specialty], page)
+                    for d in items:
+                        key = tuple(str(d.get(k)) for k in self.DEDUPE_KEYS)
+                        record = records.setdefault(key, {**d, 'specialties': []})
+                        record['specialties'].append(specialty)
+
+                    logger.info(f'{specialty} page {page}: {len(items)} listings, {len(records)} unique so far')
+                fill()
+
+        # a failed page past a specialty's last page held nothing anyway
+        failed = sorted(job for job in failed if job[1] < last_page[job[0]])
+        return CrawlResult(pandas.DataFrame(list(records.values())), failed)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+
+    with StageRun('endocrinologists') as run:
+        result = EndocrinologistCrawler(requests_per_second=5).crawl()
+        result.listings.to_csv('data/raw/_endocrinologists_raw.csv')
+        run.rows(len(result.listings))
+        run.metrics.incr('failures', len(result.failed_pages))
+    if result.failed_pages:
+        raise SystemExit(f'{len(result.failed_pages)} pages failed: {result.failed_pages}')
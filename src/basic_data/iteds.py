@@ -1,28 +1,56 @@
+import json
+import logging
+import re
 import time
-from typing import Dict, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+
+import lxml.html
 import pandas
-from selenium import webdriver
-from selenium.common.exceptions import (StaleElementReferenceException,
-                                        TimeoutException)
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.ui import WebDriverWait
-from webdriver_manager.chrome import ChromeDriverManager
+
+from util.html import has_class
+from util.http import ThreadLocalSession, get_with_backoff
+from util.instrumentation import METRICS, StageRun
+from util.jsonl import JsonlSink, read_jsonl
+
+logger = logging.getLogger(__name__)
 
 class BasicItedsApi:
     URL = 'https://thyroideyedisease.org/physician-directory-member-list/'
     BASIC_CSV_PATH = 'data/raw/_basic_iteds_raw.csv'
+    BACKENDS = ('http', 'selenium')
+
+    _MEMBER_LINKS = f"//*[{has_class('item-entry')}]//*[{has_class('member-name')}]//a"
+    _PAGE_LINKS = f"//a[{has_class('page-numbers')}]"
+    _NEXT_LINK = f"//a[{has_class('next')} and {has_class('page-numbers')}]"
 
-    def __init__(self):
-        self._driver = webdriver.Chrome(ChromeDriverManager().install())
-        self._df = pandas.DataFrame(columns=['name', 'url'])
+    def __init__(self, backend: str = 'selenium', workers: int = 8):
+        """
+        `backend='selenium'` drives a browser through the directory, as `AsoprsBasicDataApi`
+        does; 'http' reads the same server-rendered pages with lxml and needs no browser.
+        """
+        assert backend in self.BACKENDS, f'invalid backend {backend}: must be in {self.BACKENDS}'
+        self.backend = backend
+        self.workers = workers
+        self._rows: List[List[str]] = []
+        if backend == 'selenium':
+            from selenium import webdriver
+            from webdriver_manager.chrome import ChromeDriverManager
+            self._driver = webdriver.Chrome(ChromeDriverManager().install())
+        else:
+            self._sessions = ThreadLocalSession(workers)
     
         
     def _scrape_page(self) -> None:
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.support.ui import WebDriverWait
+
         doctors = WebDriverWait(self._driver, 10).until(
             EC.presence_of_all_elements_located((By.CLASS_NAME, 'item-entry'))
         )
-        print(len(doctors))
+        logger.debug(f"{len(doctors)} doctors on page")
 
         for d in doctors:
             name = d.find_element_by_class_name('member-name').text
@@ -30,10 +58,18 @@ class BasicItedsApi:
                 .find_element_by_css_selector('a')\
                 .get_attribute('href')
             
-            self._df.loc[len(self._df), :] = [name, url]
+            self._rows.append([name, url])
         
 
     def get_urls_lst(self) -> pandas.DataFrame:
+        if self.backend == 'http':
+            return self._get_urls_lst_http()
+
+        from selenium.common.exceptions import TimeoutException
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.support.ui import WebDriverWait
+
         self._driver.get(self.URL)
         self._scrape_page()
 
@@ -43,7 +79,7 @@ class BasicItedsApi:
                     EC.presence_of_element_located((By.CSS_SELECTOR, '[class="next page-numbers"]'))
                 )
             except TimeoutException:
-                print('not found')
+                logger.debug('no next page')
                 break
 
             next_.click()
@@ -55,27 +91,144 @@ class BasicItedsApi:
 
 
         self._driver.quit()
-        return self._df
+        return pandas.DataFrame(self._rows, columns=['name', 'url'])
+
+    def _get_page(self, url: str) -> lxml.html.HtmlElement:
+        resp = get_with_backoff(self._sessions.get(), url)
+        resp.raise_for_status()
+        return lxml.html.fromstring(resp.text, base_url=url)
+
+    @classmethod
+    def _members(cls, page: lxml.html.HtmlElement) -> List[List[str]]:
+        page.make_links_absolute()
+        return [[a.text_content().strip(), a.get('href')] for a in page.xpath(cls._MEMBER_LINKS)]
+
+    @classmethod
+    def _page_urls(cls, page: lxml.html.HtmlElement) -> Optional[List[str]]:
+        """Pages 2..N, built from the numbered pagination links. None if their urls aren't understood."""
+        links = [a for a in page.xpath(cls._PAGE_LINKS) if a.text_content().strip().isdigit()]
+        if not links:
+            return []
+
+        last = max(int(a.text_content()) for a in links)
+        parsed = urlparse(links[0].get('href'))
+        query = dict(parse_qsl(parsed.query))
+        number = links[0].text_content().strip()
+        params = [k for k, v in query.items() if v == number]
+        if params:
+            return [urlunparse(parsed._replace(query=urlencode({**query, params[0]: i})))
+                    for i in range(2, last + 1)]
+        if re.search(f'/page/{number}/?$', parsed.path):
+            return [urlunparse(parsed._replace(path=re.sub(r'/page/\d+/?$', f'/page/{i}/', parsed.path)))
+                    for i in range(2, last + 1)]
+        return None
+
+    def _get_urls_lst_http(self) -> pandas.DataFrame:
+        first = self._get_page(self.URL)
+        self._rows += self._members(first)
+
+        page_urls = self._page_urls(first)
+        if page_urls is not None:
+            with ThreadPoolExecutor(max_workers=self.workers) as tpe:
+                for page in tpe.map(self._get_page, page_urls):
+                    self._rows += self._members(page)
+        else:  # unrecognized pagination, follow "next" one page at a time
+            page = first
+            while next_ := page.xpath(self._NEXT_LINK):
+                page = self._get_page(next_[0].get('href'))
+                self._rows += self._members(page)
+
+        return pandas.DataFrame(self._rows, columns=['name', 'url'])
+
+def _parse_profile_tables(html: str) -> Dict[str, str]:
+    """First cell -> second cell of every two-column table row, as `read_html(...).set_index(0)[1]` gave."""
+    out = {}
+    for tr in lxml.html.fromstring(html).xpath('//table//tr'):
+        cells = tr.xpath('./td|./th')
+        if len(cells) >= 2:
+            out[cells[0].text_content().strip()] = cells[1].text_content().strip()
+    return out
+
+
+def _is_interesting(out: Dict[str, str]) -> bool:
+    # read_html raised on a page without tables; with no rows parsed there's nothing to keep
+    cleaned_keys = {str(i).upper() for i in set(out.keys())} - {'__DOCTOR_NAME_FROM_CSV'}
+    return bool(cleaned_keys) and cleaned_keys != {'NAME'}
+
+
+_SESSIONS = ThreadLocalSession(pool_size=1)
+
 
 def get_doctor_data(name: str, url: str) -> Tuple[bool, Dict[str, str]]:
     out = {'__DOCTOR_NAME_FROM_CSV': name}
     
     try:
-        for df in pandas.read_html(url):
-            out.update(df.set_index(0)[1].to_dict())
-    except Exception as e:
-        print(name, url)
-        raise e
-    
-    cleaned_keys = {str(i).upper() for i in set(out.keys())}
-    success = cleaned_keys != {'__DOCTOR_NAME_FROM_CSV', 'NAME'}
-    print(name, url, success)
-        
+        resp = get_with_backoff(_SESSIONS.get(), url)
+        resp.raise_for_status()
+        out.update(_parse_profile_tables(resp.text))
+    except Exception:
+        logger.error(f"failed to get {name} from {url}")
+        raise
+
+    success = _is_interesting(out)
+    logger.debug(f"{name} {url}: {'interesting' if success else 'nothing'}")
 
     return success, out
 
+
+class ItedsProfileFetcher:
+    """
+    Batch version of `get_doctor_data`: profile pages are fetched concurrently over
+    pooled sessions, and every result is appended to `cache_path` so reruns (and
+    recomputing `has_interesting_data`) don't touch the network for known urls.
+    """
+
+    CACHE_PATH = 'data/cache/iteds_profiles.jsonl'
+
+    def __init__(self, workers: int = 8, cache_path: str = CACHE_PATH):
+        self.workers = workers
+        self.cache_path = cache_path
+        self._sessions = ThreadLocalSession(workers)
+        self._cache = {rec['url']: rec['attrs'] for rec in read_jsonl(cache_path)}
+
+    def _fetch(self, url: str) -> Dict[str, str]:
+        resp = get_with_backoff(self._sessions.get(), url)
+        resp.raise_for_status()
+        return _parse_profile_tables(resp.text)
+
+    def fetch_all(self, names: pandas.Series, urls: pandas.Series) -> pandas.DataFrame:
+        """`success` and `attributes` (the full dict, as `get_doctor_data` returns) per row of `urls`."""
+        todo = [u for u in urls.unique() if u not in self._cache]
+        METRICS.incr('cache.hits', urls.nunique() - len(todo))
+        METRICS.incr('cache.misses', len(todo))
+
+        with JsonlSink(self.cache_path) as sink, ThreadPoolExecutor(max_workers=self.workers) as tpe:
+            futs_to_urls = {tpe.submit(self._fetch, url): url for url in todo}
+            for fut in as_completed(futs_to_urls):
+                url = futs_to_urls[fut]
+                try:
+                    attrs = fut.result()
+                except Exception as e:
+                    logger.error(f"failed to fetch {url}: {e!r}")
+                    continue
+                sink.append({'url': url, 'attrs': attrs})
+                self._cache[url] = attrs
+
+        attributes = [None if url not in self._cache else {'__DOCTOR_NAME_FROM_CSV': name, **self._cache[url]}
+                      for name, url in zip(names, urls)]
+        return pandas.DataFrame({
+            'success': [None if a is None else _is_interesting(a) for a in attributes],
+            'attributes': attributes,
+        }, index=urls.index)
+
 if __name__ == '__main__':
-    BasicItedsApi().get_urls_lst().to_csv(BasicItedsApi.BASIC_CSV_PATH)
-    df = pandas.read_csv(BasicItedsApi.BASIC_CSV_PATH)
-    df['has_interesting_data'] = df.apply(lambda row: get_doctor_data(row['name'], row['url'] + 'profile/')[0], axis=1)
-    df.to_csv('data/_iteds_raw.csv')
+    logging.basicConfig(level=logging.INFO)
+
+    with StageRun('iteds') as run:
+        BasicItedsApi().get_urls_lst().to_csv(BasicItedsApi.BASIC_CSV_PATH)
+        df = pandas.read_csv(BasicItedsApi.BASIC_CSV_PATH)
+        profiles = ItedsProfileFetcher().fetch_all(df['name'], df['url'] + 'profile/')
+        df['has_interesting_data'] = profiles['success']
+        df['attributes'] = profiles['attributes'].map(json.dumps)
+        df.to_csv('data/_iteds_raw.csv')
+        run.rows(len(df))
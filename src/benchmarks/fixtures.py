@@ -0,0 +1,94 @@
+import logging
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional
+from urllib.parse import parse_qsl, urlparse
+
+import pandas
+
+from benchmarks import synthetic
+from get_npi.cache import CachingTransport, ResponseCache
+from get_npi.nppes_index import NppesTransport, build_index
+from get_npi.resolver import STRATEGIES, NpiResolver
+
+__doc__ = """
+Recorded responses for the network stages, so they're benchmarked without the network.
+
+An NPI fixture is a `ResponseCache` file: any cache written by a real
+`query_npi_database.py` run works, replayed offline. For synthetic rosters one is
+recorded here from a synthetic NPPES index, once per roster size and seed.
+
+The scrapers replay the HTML pages recorded for their tests (`tests/fixtures`) from a
+local server, so fetching, parsing and the crawl's scheduling are all timed.
+"""
+
+logger = logging.getLogger(__name__)
+
+FIXTURE_DIR = 'data/cache/benchmarks'
+RECORDED_PAGES_DIR = 'tests/fixtures'
+
+
+def replay_transport(fixture_path: str) -> CachingTransport:
+    """Answers only from `fixture_path`; a query that was never recorded raises `CacheMiss`."""
+    return CachingTransport(None, ResponseCache(fixture_path, read_only=True), offline=True)
+
+
+def npi_fixture(doctors: pandas.DataFrame, name: str, seed: int = 0, fixture_dir: str = FIXTURE_DIR) -> str:
+    """
+    Path of a fixture answering every query the resolver makes for `doctors` under any
+    strategy, recording it first if there isn't one for `name` yet.
+    """
+    fixture_path = os.path.join(fixture_dir, f'npi_{name}.sqlite')
+    if os.path.exists(fixture_path):
+        return fixture_path
+
+    os.makedirs(fixture_dir, exist_ok=True)
+    csv_path = os.path.join(fixture_dir, f'nppes_{name}.csv')
+    db_path = os.path.join(fixture_dir, f'nppes_{name}.sqlite')
+    synthetic.nppes_csv(csv_path, doctors, seed)
+    build_index(csv_path, db_path)
+
+    tmp_path = f'{fixture_path}.tmp'
+    logger.info(f'recording {fixture_path}')
+    with ResponseCache(tmp_path) as cache:
+        transport = CachingTransport(NppesTransport(db_path), cache)
+        for strategy in STRATEGIES:
+            for _ in NpiResolver(transport, strategy=strategy).resolve(doctors.iterrows()):
+                pass
+    os.replace(tmp_path, fixture_path)
+    os.remove(csv_path)
+    return fixture_path
+
+
+def recorded_page(*path: str) -> str:
+    with open(os.path.join(RECORDED_PAGES_DIR, *path), encoding='utf-8') as f:
+        return f.read()
+
+
+def serve(route: Callable[[str, Dict[str, str]], Optional[str]]) -> str:
+    """
+    Serve `route(path, query)` as HTML from a local port for the rest of the process,
+    404 where it returns None. Returns the server's base url.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            page = route(url.path, dict(parse_qsl(url.query)))
+            if page is None:
+                self.send_error(404)
+                return
+            body = page.encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{httpd.server_port}'
@@ -0,0 +1,277 @@
+import argparse
+import itertools
+import logging
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import pandas
+
+from benchmarks import synthetic
+from benchmarks.fixtures import npi_fixture, recorded_page, replay_transport, serve
+from basic_data.endocrinologists import EndocrinologistCrawler, EndocrinologistPageParser
+from clean_basic_data.clean_all import clean_asoprs, clean_tepezza
+from clean_basic_data.dedupe import drop_near_duplicates
+from get_npi.resolver import NpiResolver
+from link_with_open_payments.join_roster import collapse_roster, join_payments_to_roster
+from util.jsonl import JsonlSink, read_jsonl
+from vizualize.cohort_curves import first_contact_counts, payment_curves, prepare_payments
+
+__doc__ = """
+Time the pipeline's hot paths on synthetic inputs, and the scrapers on recorded
+pages served locally (see `benchmarks/fixtures.py`), and keep the results.
+
+Each benchmark builds its inputs (untimed), runs the stage `--repeat` times for the
+best wall time, then once more under tracemalloc for the peak memory it allocated.
+Every result is appended to `--results` with the commit, so throughput and peak
+memory per stage can be followed over time; `--compare` prints the latest result
+for each stage and size next to the one before it.
+
+Run from the repo root with `PYTHONPATH=src`. Modules with heavy optional dependencies
+are imported by their own benchmarks only: payment_cube needs geopandas and us, and
+the ASOPRS benchmarks need inflection.
+"""
+
+logger = logging.getLogger(__name__)
+
+RESULTS_PATH = 'data/benchmarks/results.jsonl'
+SIZES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+
+
+class Benchmark(NamedTuple):
+    name: str
+    setup: Callable[[int, int], Tuple]  # (rows, seed) -> args for `run`
+    run: Callable[..., Any]
+    max_rows: Optional[int] = None  # skipped above this
+
+
+def _npi_setup(rows: int, seed: int) -> Tuple:
+    doctors = synthetic.roster(rows, seed)
+    return replay_transport(npi_fixture(doctors, f'{rows}_{seed}', seed)), doctors
+
+
+def _resolve_all(strategy: str) -> Callable[..., int]:
+    def run(transport, doctors: pandas.DataFrame) -> int:
+        resolver = NpiResolver(transport, strategy=strategy)
+        for _ in resolver.resolve(doctors.iterrows()):
+            pass
+        return resolver.resolved
+    return run
+
+
+def _join_setup(rows: int, seed: int) -> Tuple:
+    doctors = synthetic.roster(max(rows // 10, 100), seed)
+    return synthetic.open_payments(rows, doctors, seed), collapse_roster(doctors)
+
+
+def _cohort_setup(rows: int, seed: int) -> Tuple:
+    return synthetic.transactions(rows, synthetic.roster(max(rows // 10, 100), seed), seed), \
+        pandas.Timestamp('2017-12-31')
+
+
+def _cohort_curves(df: pandas.DataFrame, start_date: pandas.Timestamp) -> None:
+    df = prepare_payments(df, start_date, exclude_src=['endocrinologists'])
+    first_contact_counts(df, start_date)
+    payment_curves(df, start_date)
+
+
+def _cube_setup(rows: int, seed: int) -> Tuple:
+    from vizualize.payment_cube import build_cube
+    doctors = synthetic.roster(max(rows // 10, 100), seed)
+    return build_cube, synthetic.transactions(rows, doctors, seed), doctors
+
+
+def _call(func: Callable[..., Any], *args) -> Any:
+    return func(*args)
+
+
+ENDOCRINOLOGIST_PAGES = ('results_page_0.html', 'results_page_1.html')
+ITEDS_PROFILES = ('profile.html', 'profile_name_only.html', 'profile_no_tables.html')
+
+
+def _parse_all(parse: Callable[[str], Any], pages: List[str]) -> None:
+    for page in pages:
+        parse(page)
+
+
+def _endocrinologist_pages(rows: int) -> List[str]:
+    """Recorded results pages, cycled until they hold `rows` listings."""
+    pages, listings = [], 0
+    for name in itertools.cycle(ENDOCRINOLOGIST_PAGES):
+        if listings >= rows:
+            return pages
+        pages.append(recorded_page('endocrinologists', name))
+        listings += len(EndocrinologistPageParser.parse(pages[-1]))
+
+
+def _endocrinologist_crawl_setup(rows: int, seed: int) -> Tuple:
+    pages = _endocrinologist_pages(rows)
+    per_specialty = -(-len(pages) // len(EndocrinologistCrawler.SPECIALTIES))
+    empty = recorded_page('endocrinologists', 'results_empty.html')
+    base_url = serve(lambda path, query: pages[int(query['page'])] if int(query['page']) < per_specialty else empty)
+    return EndocrinologistCrawler(f'{base_url}/results'),
+
+
+def _asoprs_parse_setup(rows: int, seed: int) -> Tuple:
+    from basic_data.asoprs import AsoprsAdvancedDataApi
+    return AsoprsAdvancedDataApi.parse_profile, [recorded_page('asoprs', 'profile.html')] * rows
+
+
+def _asoprs_fetch_setup(rows: int, seed: int) -> Tuple:
+    from basic_data.asoprs import AsoprsAdvancedDataApi
+    page = recorded_page('asoprs', 'profile.html')
+
+    class ReplayedApi(AsoprsAdvancedDataApi):
+        PROFILE_URL = serve(lambda path, query: page) + '/profile?userid={idx}'
+
+    return ReplayedApi, pandas.DataFrame({'idx': range(rows)})
+
+
+def _asoprs_fetch(api, df: pandas.DataFrame) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        api.get_detailed_asoprs_data(df, 'idx', workers=8, sleep_time=0.1,
+                                     sink_path=os.path.join(tmp, 'profiles.jsonl'))
+
+
+def _iteds_parse_setup(rows: int, seed: int) -> Tuple:
+    from basic_data.iteds import _parse_profile_tables
+    pages = [recorded_page('iteds', name) for name in ITEDS_PROFILES]
+    return _parse_profile_tables, [pages[i % len(pages)] for i in range(rows)]
+
+
+def _iteds_fetch_setup(rows: int, seed: int) -> Tuple:
+    from basic_data.iteds import ItedsProfileFetcher
+    pages = [recorded_page('iteds', name) for name in ITEDS_PROFILES]
+    base_url = serve(lambda path, query: pages[int(query['id']) % len(pages)])
+    names = pandas.Series([f'Doctor {i}' for i in range(rows)])
+    return ItedsProfileFetcher, names, names.index.map(lambda i: f'{base_url}/members/?id={i}').to_series()
+
+
+def _iteds_fetch(fetcher_cls, names: pandas.Series, urls: pandas.Series) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        fetcher_cls(cache_path=os.path.join(tmp, 'profiles.jsonl')).fetch_all(names, urls)
+
+
+BENCHMARKS: Dict[str, Benchmark] = {b.name: b for b in (
+    Benchmark('clean_asoprs', lambda rows, seed: (synthetic.asoprs_dump(rows, seed),), clean_asoprs),
+    Benchmark('clean_tepezza', lambda rows, seed: (synthetic.tepezza_dump(rows, seed),), clean_tepezza),
+    Benchmark('dedupe', lambda rows, seed: (synthetic.roster(rows, seed),), drop_near_duplicates),
+    Benchmark('npi_linear', _npi_setup, _resolve_all('linear'), max_rows=100_000),
+    Benchmark('npi_bisect', _npi_setup, _resolve_all('bisect'), max_rows=100_000),
+    Benchmark('join_roster', _join_setup, join_payments_to_roster),
+    Benchmark('cohort_curves', _cohort_setup, _cohort_curves),
+    Benchmark('payment_cube', _cube_setup, _call),
+    Benchmark('endocrinologists_parse', lambda rows, seed: (EndocrinologistPageParser.parse,
+                                                            _endocrinologist_pages(rows)),
+              _parse_all, max_rows=100_000),
+    Benchmark('endocrinologists_crawl', _endocrinologist_crawl_setup, EndocrinologistCrawler.crawl,
+              max_rows=10_000),
+    Benchmark('asoprs_parse', _asoprs_parse_setup, _parse_all, max_rows=100_000),
+    Benchmark('asoprs_fetch', _asoprs_fetch_setup, _asoprs_fetch, max_rows=10_000),
+    Benchmark('iteds_parse', _iteds_parse_setup, _parse_all, max_rows=100_000),
+    Benchmark('iteds_fetch', _iteds_fetch_setup, _iteds_fetch, max_rows=10_000),
+)}
+
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure(benchmark: Benchmark, rows: int, seed: int = 0, repeat: int = 3) -> Dict[str, Any]:
+    args = benchmark.setup(rows, seed)
+
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        benchmark.run(*args)
+        seconds.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        baseline, _ = tracemalloc.get_traced_memory()
+        benchmark.run(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    best = min(seconds)
+    return {
+        'stage': benchmark.name,
+        'rows': rows,
+        'seconds': best,
+        'rows_per_second': rows / best if best else None,
+        'peak_mb': (peak - baseline) / 2 ** 20,
+        'repeat': repeat,
+        'seed': seed,
+        'commit': _commit(),
+        'time': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pandas.__version__,
+    }
+
+
+def run(stages: Iterable[str], sizes: Iterable[int], results_path: str = RESULTS_PATH,
+        seed: int = 0, repeat: int = 3) -> List[Dict[str, Any]]:
+    out = []
+    with JsonlSink(results_path) as sink:
+        for name in stages:
+            benchmark = BENCHMARKS[name]
+            for rows in sizes:
+                if benchmark.max_rows is not None and rows > benchmark.max_rows:
+                    logger.info(f'skipping {name} at {rows} rows (max {benchmark.max_rows})')
+                    continue
+                result = measure(benchmark, rows, seed, repeat)
+                sink.append(result)
+                out.append(result)
+                logger.info(f"{name} x {rows}: {result['seconds']:.3f}s, "
+                            f"{result['rows_per_second']:,.0f} rows/s, peak {result['peak_mb']:.1f} MB")
+    return out
+
+
+def compare(results_path: str = RESULTS_PATH) -> pandas.DataFrame:
+    """Latest and previous result for each (stage, rows), with their ratios."""
+    df = pandas.DataFrame(list(read_jsonl(results_path)))
+    if df.empty:
+        return df
+    keys = ['stage', 'rows']
+    df = df.sort_values('time', kind='stable')
+    last = df.groupby(keys).tail(1)
+    latest = last.set_index(keys)
+    previous = df.drop(last.index).groupby(keys).tail(1).set_index(keys)
+
+    out = latest[['commit', 'seconds', 'peak_mb']]\
+        .join(previous[['commit', 'seconds', 'peak_mb']], rsuffix='_previous')
+    out['time_ratio'] = out['seconds'] / out['seconds_previous']
+    out['memory_ratio'] = out['peak_mb'] / out['peak_mb_previous']
+    return out
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('stages', nargs='*', help=f"benchmarks to run (default: all of {', '.join(BENCHMARKS)})")
+    parser.add_argument('--sizes', nargs='+', choices=tuple(SIZES), default=['10k', '100k'])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--results', default=RESULTS_PATH)
+    parser.add_argument('--compare', action='store_true', help='print the comparison instead of running')
+    args = parser.parse_args()
+    unknown = set(args.stages) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f'unknown benchmarks: {sorted(unknown)}')
+
+    if args.compare:
+        with pandas.option_context('display.width', 200, 'display.max_columns', None):
+            print(compare(args.results))
+    else:
+        run(args.stages or list(BENCHMARKS), [SIZES[s] for s in args.sizes], args.results, args.seed, args.repeat)
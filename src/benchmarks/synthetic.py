@@ -0,0 +1,209 @@
+from typing import Optional
+
+import numpy
+import pandas
+
+from clean_basic_data.clean_all import GENERIC_ENDOCRINOLOGY_CODE, GENERIC_OPHTHALMOLOGY_CODE
+from get_npi.nppes_index import NPPES_COLUMNS
+
+__doc__ = """
+Synthetic inputs shaped like the real ones, at any size, from a seed.
+
+Names come from a small first-name pool (with nicknames) and syllable-built last
+names, so common names collide the way they do nationally. A share of roster rows
+are near-duplicates of earlier ones (nickname, dropped letter, ZIP+4, missing city),
+so the dedupe has work to do.
+"""
+
+FIRST_NAMES = [
+    'Robert', 'Bob', 'William', 'Bill', 'James', 'Jim', 'Michael', 'Mike', 'Richard', 'Thomas',
+    'David', 'Daniel', 'Joseph', 'Christopher', 'Steven', 'Anthony', 'Andrew', 'Matthew', 'Nicholas',
+    'Patrick', 'Edward', 'Charles', 'Elizabeth', 'Liz', 'Katherine', 'Kate', 'Susan', 'Margaret',
+    'Jennifer', 'Jeffrey', 'Gregory', 'Mary', 'Patricia', 'Linda', 'Barbara', 'Sarah', 'Karen',
+    'Nancy', 'Lisa', 'Emily', 'Priya', 'Wei', 'Mohammed', 'Ana', 'Hiroshi', 'Olga', 'Kwame', 'Vinay',
+]
+_SYLLABLES = [
+    'an', 'ber', 'cal', 'dor', 'el', 'fen', 'gar', 'har', 'is', 'jon', 'kal', 'lin', 'mor', 'nel',
+    'or', 'per', 'quin', 'ros', 'sten', 'tor', 'ul', 'ver', 'wes', 'yam', 'zel', 'son', 'ski', 'ez',
+]
+CITIES = [
+    'Chicago', 'Boston', 'Houston', 'Phoenix', 'Denver', 'Seattle', 'Atlanta', 'Miami', 'Portland',
+    'Nashville', 'Columbus', 'Baltimore', 'Richmond', 'Omaha', 'Tucson', 'Madison', 'Albany', 'Dayton',
+    'St. Louis', 'New York', 'Los Angeles', 'San Antonio', 'Ann Arbor', 'Salt Lake City',
+]
+STATES = [
+    'AL', 'AZ', 'AR', 'CA', 'CO', 'CT', 'DE', 'DC', 'FL', 'GA', 'ID', 'IL', 'IN', 'IA', 'KS', 'KY',
+    'LA', 'ME', 'MD', 'MA', 'MI', 'MN', 'MS', 'MO', 'MT', 'NE', 'NV', 'NH', 'NJ', 'NM', 'NY', 'NC',
+    'ND', 'OH', 'OK', 'OR', 'PA', 'RI', 'SC', 'SD', 'TN', 'TX', 'UT', 'VT', 'VA', 'WA', 'WV', 'WI', 'WY',
+]
+# mostly names in the NUCC crosswalk (or REPLACEMENTS), plus a few that aren't
+AMA_SPECIALTIES = [
+    'Ophthalmology', 'Endocrinology, Diabetes, & Metabolism', 'Optometry', 'Pediatric Ophthalmology',
+    'OPR', 'Internal Medicine', 'Family Medicine', 'Neurology', 'Oculoplastic Surgery', 'Retina Specialist',
+]
+SOURCES = ['asoprs', 'endocrinologists', 'tepezza']
+MANUFACTURER_IDS = ['100000131389', '100000000186', '100000000223', '100000010741', '100000005455']
+SPECIALTY_CODES = [GENERIC_OPHTHALMOLOGY_CODE, GENERIC_ENDOCRINOLOGY_CODE, '207RE0101X', '152W00000X']
+
+
+def _last_names(rng: numpy.random.Generator, n: int) -> pandas.Series:
+    syllables = numpy.array(_SYLLABLES, dtype=object)
+    parts = [syllables[rng.integers(len(syllables), size=n)] for _ in range(3)]
+    two_syllables = rng.random(n) < 0.4
+    names = pandas.Series(parts[0] + parts[1] + numpy.where(two_syllables, '', parts[2]))
+    return names.str.capitalize()
+
+
+def _zips(rng: numpy.random.Generator, n: int, zip9_share: float = 0.2) -> pandas.Series:
+    zips = pandas.Series(rng.integers(1001, 99951, size=n)).astype(str).str.zfill(5)
+    plus4 = pandas.Series(rng.integers(0, 10000, size=n)).astype(str).str.zfill(4)
+    return zips.where(rng.random(n) >= zip9_share, zips + '-' + plus4)
+
+
+def _choice(rng: numpy.random.Generator, pool, n: int) -> numpy.ndarray:
+    return numpy.asarray(pool, dtype=object)[rng.integers(len(pool), size=n)]
+
+
+def _blank(rng: numpy.random.Generator, ser: pandas.Series, share: float) -> pandas.Series:
+    return ser.where(rng.random(len(ser)) >= share)
+
+
+def roster(n: int, seed: int = 0, duplicate_share: float = 0.1) -> pandas.DataFrame:
+    """A cleaned roster (`clean_all.COLUMNS` plus `src`) of `n` rows, some of them near-duplicates."""
+    rng = numpy.random.default_rng(seed)
+    unique = n - int(n * duplicate_share)
+
+    df = pandas.DataFrame({
+        'first_name': _choice(rng, FIRST_NAMES, unique),
+        'last_name': _last_names(rng, unique),
+        'city': _choice(rng, CITIES, unique),
+        'postal_code': _zips(rng, unique, zip9_share=0),
+        'state': _choice(rng, STATES, unique),
+        'specialty_code': _choice(rng, SPECIALTY_CODES, unique),
+        'src': _choice(rng, SOURCES, unique),
+    })
+
+    dups = df.iloc[rng.integers(unique, size=n - unique)].reset_index(drop=True)
+    typo = rng.random(len(dups)) < 0.3
+    dups.loc[typo, 'last_name'] = dups.loc[typo, 'last_name'].str[:-1]  # a dropped letter
+    dups['city'] = _blank(rng, dups['city'], 0.3)
+    dups['src'] = _choice(rng, SOURCES, len(dups))
+
+    return pandas.concat([df, dups], ignore_index=True)
+
+
+def asoprs_dump(n: int, seed: int = 0, filler_columns: int = 30) -> pandas.DataFrame:
+    """The wide attribute frame `get_detailed_asoprs_data` writes: two address blocks and many unrelated columns."""
+    rng = numpy.random.default_rng(seed)
+    df = pandas.DataFrame({
+        'idx': numpy.arange(n),
+        'Full Name_firstName': _choice(rng, FIRST_NAMES, n),
+        'Full Name_lastName': _last_names(rng, n),
+    })
+    # the practice address is often missing, with the primary one filled in instead
+    for block, missing in (('Address - Practice/Institution', 0.4),
+                           ('Address - Practice/Institution (Primary)', 0.3)):
+        present = rng.random(n) >= missing
+        df[f'{block}_line1'] = pandas.Series(rng.integers(1, 9999, size=n)).astype(str).add(' Main St')\
+            .where(present)
+        df[f'{block}_city'] = pandas.Series(_choice(rng, CITIES, n)).where(present)
+        df[f'{block}_state'] = pandas.Series(_choice(rng, STATES, n)).where(present)
+        df[f'{block}_zip'] = _zips(rng, n).where(present)
+        df[f'{block}_country'] = pandas.Series('United States', index=df.index).where(present)
+    for i in range(filler_columns):
+        df[f'Fellowship Faculty {i + 1}_value'] = _blank(
+            rng, pandas.Series(_last_names(rng, n)), 0.9)
+    return df
+
+
+def tepezza_dump(n: int, seed: int = 0) -> pandas.DataFrame:
+    """Rows shaped like the tepezza locator's export."""
+    rng = numpy.random.default_rng(seed)
+    return pandas.DataFrame({
+        'FIRST_NAME': _choice(rng, FIRST_NAMES, n),
+        'LAST_NAME': _last_names(rng, n),
+        'CITY': _choice(rng, CITIES, n),
+        'ZIP': _zips(rng, n, zip9_share=0.7),
+        'STATE': _choice(rng, STATES, n),
+        'AMA_SPECIALITY': _blank(rng, pandas.Series(_choice(rng, AMA_SPECIALTIES, n)), 0.05),
+    })
+
+
+def open_payments(n: int, doctors: pandas.DataFrame, seed: int = 0, on_roster_share: float = 0.6,
+                  start: str = '2018-01-01', end: str = '2020-12-31') -> pandas.DataFrame:
+    """
+    `n` general payments, `on_roster_share` of them to doctors drawn from `doctors`
+    (a roster), the rest to strangers. Each doctor has one profile id.
+    """
+    rng = numpy.random.default_rng(seed)
+    on_roster = rng.random(n) < on_roster_share
+
+    picks = doctors.iloc[rng.integers(len(doctors), size=n)].reset_index(drop=True)
+    first = picks['first_name'].where(on_roster, pandas.Series(_choice(rng, FIRST_NAMES, n)))
+    last = picks['last_name'].where(on_roster, _last_names(rng, n) + 'x')
+    state = picks['state'].where(on_roster, pandas.Series(_choice(rng, STATES, n)))
+    # one profile id per (first, last, state)
+    profile_ids = pandas.Series(pandas.factorize(first.str.upper() + '|' + last.str.upper() + '|' + state)[0] + 1)
+
+    dates = pandas.to_datetime(start) + pandas.to_timedelta(
+        rng.integers((pandas.to_datetime(end) - pandas.to_datetime(start)).days + 1, size=n), unit='D')
+    manufacturer_ids = _choice(rng, MANUFACTURER_IDS, n)
+    return pandas.DataFrame({
+        'physician_profile_id': profile_ids.astype(str),
+        'physician_first_name': first.str.upper(),
+        'physician_last_name': last.str.upper(),
+        'recipient_city': pandas.Series(_choice(rng, CITIES, n)),
+        'recipient_state': state,
+        'recipient_zip_code': _zips(rng, n),
+        'total_amount_of_payment_usdollars': rng.lognormal(3, 1.5, size=n).round(2),
+        'date_of_payment': dates.strftime('%m/%d/%Y'),
+        'program_year': dates.year,
+        'applicable_manufacturer_or_applicable_gpo_making_payment_id': manufacturer_ids,
+        'applicable_manufacturer_or_applicable_gpo_making_payment_name': pandas.Series(
+            manufacturer_ids).radd('Manufacturer '),
+        'record_id': numpy.arange(n).astype(str),
+    })
+
+
+def transactions(n: int, doctors: pandas.DataFrame, seed: int = 0) -> pandas.DataFrame:
+    """Roster rows right-joined to payments, like `all_transactions.csv` (unpaid doctors have no payment columns)."""
+    payments = open_payments(n, doctors, seed, on_roster_share=1.0)
+    picked = doctors.assign(
+        _key=doctors['first_name'].str.upper() + '|' + doctors['last_name'].str.upper() + '|' + doctors['state'])\
+        .drop_duplicates('_key')
+    payments['_key'] = payments['physician_first_name'] + '|' + payments['physician_last_name'] + '|' \
+        + payments['recipient_state']
+    return picked.merge(payments, on='_key', how='left').drop(columns='_key')
+
+
+def nppes_csv(path: str, doctors: pandas.DataFrame, seed: int = 0, namesake_share: float = 0.3,
+              others: Optional[int] = None) -> None:
+    """
+    An NPPES dissemination-format CSV with every roster doctor in it, namesakes in other
+    states for `namesake_share` of them, and `others` unrelated providers (default: as many as doctors).
+    """
+    rng = numpy.random.default_rng(seed)
+    doctors = doctors.drop_duplicates(['first_name', 'last_name', 'state'])
+    namesakes = doctors.sample(frac=namesake_share, random_state=seed)\
+        .assign(state=lambda df: _choice(rng, STATES, len(df)))
+    others = len(doctors) if others is None else others
+    strangers = roster(others, seed=seed + 1, duplicate_share=0)
+
+    providers = pandas.concat([doctors, namesakes, strangers], ignore_index=True)
+    n = len(providers)
+    out = pandas.DataFrame({
+        'NPI': 1_000_000_000 + numpy.arange(n),
+        'Entity Type Code': '1',
+        'Provider Last Name (Legal Name)': providers['last_name'].str.upper(),
+        'Provider First Name': providers['first_name'].str.upper(),
+        'Provider Business Practice Location Address City Name': providers['city'].str.upper(),
+        'Provider Business Practice Location Address State Name': providers['state'],
+        'Provider Business Practice Location Address Postal Code': providers['postal_code'],
+        'NPI Deactivation Date': None,
+        'NPI Reactivation Date': None,
+        'Healthcare Provider Taxonomy Code_1': providers['specialty_code'],
+    })
+    for col in NPPES_COLUMNS:
+        if col not in out:
+            out[col] = None
+    out.to_csv(path, index=False)
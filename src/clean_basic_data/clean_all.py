@@ -1,44 +1,45 @@
-from difflib import SequenceMatcher
-import functools
+import logging
 from typing import Optional
 import pandas
 
+from clean_basic_data.dedupe import drop_near_duplicates
+from clean_basic_data.specialty_matcher import get_matcher
+from util.instrumentation import StageRun
+from util.schema import ROSTER_SCHEMA, write_table
+
 __doc__ = """Get specialty codes and consolidate data from different sources in basic_data."""
 
 COLUMNS = ['first_name', 'last_name', 'city', 'postal_code', 'state', 'specialty_code']
 GENERIC_OPHTHALMOLOGY_CODE = '207W00000X'
 GENERIC_ENDOCRINOLOGY_CODE = '207RE0101X'
 
+logger = logging.getLogger(__name__)
+
 def _convert_zip9_to_zip5(z: Optional[str]) -> Optional[str]:
     if pandas.isnull(z):
         return
     return z.split('-')[0].zfill(5)
 
+def _convert_zip9_to_zip5_vectorized(ser: pandas.Series) -> pandas.Series:
+    return ser.astype('string').str.split('-').str[0].str.zfill(5)
+
 def clean_asoprs(in_df: pandas.DataFrame) -> pandas.DataFrame:
     out_df: pandas.DataFrame = in_df.loc[:, ['Full Name_firstName', 'Full Name_lastName']]
-    
-    all_address_columns   = {col                for col in in_df.columns if 'address' in col.lower()}
-    all_address_subfields = {col.split('_')[-1] for col in all_address_columns}
 
-    def get_first_address_subfield(row: pandas.Series):
-        out_dict = {i: None for i in all_address_subfields}
-        for col in set(row.index).intersection(all_address_columns):
-            
-            subfield = col.split('_')[-1]
+    all_address_columns = [col for col in in_df.columns if 'address' in col.lower()]
 
-            if not pandas.isnull(value := row[col]) and out_dict[subfield] is None:
-                out_dict[subfield] = row[col]
+    target_cols = ['city', 'zip', 'state']
+    for subfield in target_cols:
+        subfield_columns = [col for col in all_address_columns if col.split('_')[-1] == subfield]
+        if not subfield_columns:
+            out_df[subfield] = None
+            continue
+        # first non-null value across this subfield's columns, in column order. as strings,
+        # so bfill has no object columns to downcast
+        out_df[subfield] = in_df[subfield_columns].astype('string').bfill(axis=1).iloc[:, 0]
 
-        target_cols = ['city', 'zip', 'state']
-        out_dict = {i: out_dict[i] for i in target_cols}
-    
-        return out_dict
-
-    address_data = in_df.apply(get_first_address_subfield, 1, False, 'expand')
-    
-    out_df = pandas.concat([out_df, address_data], 1)
     out_df.loc[:, 'specialty_code'] = GENERIC_OPHTHALMOLOGY_CODE
-    out_df['zip'] = out_df['zip'].apply(_convert_zip9_to_zip5)
+    out_df['zip'] = _convert_zip9_to_zip5_vectorized(out_df['zip'])
 
     out_df.columns = COLUMNS
     return out_df
@@ -71,39 +72,9 @@ def clean_tepezza(in_df: pandas.DataFrame) -> pandas.DataFrame:
         ]
     ]
     
-    REPLACEMENTS = {
-        'Optometry': 'Optometrist',
-        'Pediatric Ophthalmology': 'Pediatric Ophthalmology and Strabismus Specialist',
-        'OPR': 'Ophthalmic Plastic and Reconstructive Surgery'
-    }
-
-    specialty_codes_crosswalk = pandas.read_csv(
-        'data/util/specialty_codes.csv', index_col=0, comment='#')\
-        .loc[:, ['Code', 'Classification', 'Specialization']]
-    
-    @functools.lru_cache(maxsize=None)
-    def get_codes_from_strs(specialty: Optional[str], threshold: float=0.95) -> Optional[str]: # FIXME
-        if pandas.isnull(specialty):
-            return
-        
-        specialty = REPLACEMENTS.get(specialty, specialty)
-
-        for index, row in specialty_codes_crosswalk.iterrows():
-            specialty2 = row['Specialization']
-            if pandas.isnull(specialty2):
-                specialty2 = row['Classification'] 
-                if pandas.isnull(specialty2):
-                    continue
-
-            similarity = SequenceMatcher(None, specialty2, specialty).ratio()
-            if similarity >= threshold:
-                return row['Code']
-
-        return
-    
     out_df['ZIP'] = out_df['ZIP'].apply(_convert_zip9_to_zip5)
 
-    out_df['specialty_code'] = in_df['AMA_SPECIALITY'].apply(get_codes_from_strs, 1)
+    out_df['specialty_code'] = get_matcher().match_series(in_df['AMA_SPECIALITY'])
 
     missed_specialties = {
         i for i in \
@@ -118,41 +89,37 @@ def clean_tepezza(in_df: pandas.DataFrame) -> pandas.DataFrame:
     return out_df
 
 if __name__ == '__main__':
-    import logging
-    logging.basicConfig()
-    logger = logging.getLogger('clean_all')
+    logging.basicConfig(level=logging.INFO)
 
-    all_dfs = []
+    with StageRun('clean') as run:
+        all_dfs = []
 
-    for name in ('asoprs', 'endocrinologists', 'tepezza'):
+        for name in ('asoprs', 'endocrinologists', 'tepezza'):
 
-        df = pandas.read_csv(f'data/raw/_{name}_raw.csv')
-        if name == 'tepezza':
-            df = df.append(pandas.read_csv('data/raw/_tepezza_raw_old.csv'))
-        func = globals()[f'clean_{name}']
+            df = pandas.read_csv(f'data/raw/_{name}_raw.csv')
+            if name == 'tepezza':
+                df = pandas.concat([df, pandas.read_csv('data/raw/_tepezza_raw_old.csv')])
+            func = globals()[f'clean_{name}']
 
-        out_df = func(df)
-        assert out_df.columns.to_list() == COLUMNS
-        out_df['src'] = name
-        out_df.to_csv(f'data/processed/{name}.csv')
-        all_dfs.append(out_df)
+            with run.metrics.timer(f'clean_{name}'):
+                out_df = func(df)
+            assert out_df.columns.to_list() == COLUMNS
+            out_df['src'] = name
+            write_table(out_df, f'data/processed/{name}', ROSTER_SCHEMA)
+            all_dfs.append(out_df)
 
-    concat = pandas.concat(all_dfs)
+        concat = pandas.concat(all_dfs)
 
-    ignore_cols = ['specialty_code', 'src']
-    columns_for_drop_duplicates = [i for i in concat.columns if i not in ignore_cols]
-    
-    full_data = concat\
-    .sort_values(
-        'last_name', 
-        ignore_index=True, 
-        key=lambda ser: ser.apply(lambda s: s.strip('"').lower())
-    )
-    full_data.to_csv('data/processed/all_with_duplicates.csv')
+        full_data = concat\
+        .sort_values(
+            'last_name', 
+            ignore_index=True, 
+            key=lambda ser: ser.str.strip('"').str.lower()
+        )
+        write_table(full_data, 'data/processed/all_with_duplicates', ROSTER_SCHEMA)
 
-    full_data = full_data\
-    .drop_duplicates(
-        columns_for_drop_duplicates, 
-        ignore_index=True)
+        with run.metrics.timer('drop_near_duplicates'):
+            full_data = drop_near_duplicates(full_data).reset_index(drop=True)
     
-    full_data.to_csv('data/processed/all.csv')
\ No newline at end of file
+        write_table(full_data, 'data/processed/all', ROSTER_SCHEMA)
+        run.rows(len(concat))
@@ -0,0 +1,172 @@
+from typing import Dict, List
+
+import numpy
+import pandas
+
+__doc__ = """
+Blocking-based record linkage for the consolidated roster.
+
+Rows are only compared within blocks that share a phonetic last name (each part of a
+hyphenated name counts), the initial of the canonical first name, and either the
+state or the ZIP3. Candidate pairs are scored with vectorized column comparisons,
+linked above a threshold, and each connected cluster keeps one representative.
+"""
+
+EXACT_COLUMNS = ['first_name', 'last_name', 'city', 'postal_code', 'state']
+THRESHOLD = 0.8
+WEIGHTS = {'last_name': 0.35, 'first_name': 0.35, 'postal_code': 0.15, 'city': 0.15}
+
+NICKNAMES: Dict[str, str] = {
+    'BOB': 'ROBERT', 'BOBBY': 'ROBERT', 'ROB': 'ROBERT', 'ROBBIE': 'ROBERT',
+    'BILL': 'WILLIAM', 'BILLY': 'WILLIAM', 'WILL': 'WILLIAM', 'LIAM': 'WILLIAM',
+    'JIM': 'JAMES', 'JIMMY': 'JAMES', 'JAMIE': 'JAMES',
+    'MIKE': 'MICHAEL', 'MICK': 'MICHAEL',
+    'DICK': 'RICHARD', 'RICK': 'RICHARD', 'RICH': 'RICHARD',
+    'TOM': 'THOMAS', 'TOMMY': 'THOMAS',
+    'DAVE': 'DAVID', 'DAN': 'DANIEL', 'DANNY': 'DANIEL',
+    'JOE': 'JOSEPH', 'JOEY': 'JOSEPH',
+    'CHRIS': 'CHRISTOPHER', 'STEVE': 'STEVEN', 'STEPHEN': 'STEVEN',
+    'TONY': 'ANTHONY', 'ANDY': 'ANDREW', 'DREW': 'ANDREW',
+    'MATT': 'MATTHEW', 'NICK': 'NICHOLAS', 'PAT': 'PATRICK',
+    'ED': 'EDWARD', 'TED': 'EDWARD', 'EDDIE': 'EDWARD',
+    'CHUCK': 'CHARLES', 'CHARLIE': 'CHARLES',
+    'LIZ': 'ELIZABETH', 'BETH': 'ELIZABETH', 'BETSY': 'ELIZABETH',
+    'KATE': 'KATHERINE', 'KATHY': 'KATHERINE', 'KATIE': 'KATHERINE', 'CATHERINE': 'KATHERINE',
+    'SUE': 'SUSAN', 'SUZY': 'SUSAN', 'PEGGY': 'MARGARET', 'MEG': 'MARGARET',
+    'JENNY': 'JENNIFER', 'JEN': 'JENNIFER', 'JEFF': 'JEFFREY', 'GREG': 'GREGORY',
+}
+
+_SOUNDEX_CODES = {c: str(d) for d, letters in enumerate(
+    ['AEIOUYHW', 'BFPV', 'CGJKQSXZ', 'DT', 'L', 'MN', 'R']) for c in letters}
+
+
+def soundex(name: str) -> str:
+    if not name:
+        return ''
+    out = name[0]
+    prev = _SOUNDEX_CODES.get(name[0], '')
+    for c in name[1:]:
+        code = _SOUNDEX_CODES.get(c, '')
+        if code and code != '0' and code != prev:
+            out += code
+        if c not in 'HW':
+            prev = code
+    return (out + '000')[:4]
+
+
+def _normalize(ser: pandas.Series) -> pandas.Series:
+    return ser.astype('string').fillna('').str.upper().str.replace(r'[^A-Z\- ]', '', regex=True).str.strip()
+
+
+def _prepare(df: pandas.DataFrame) -> pandas.DataFrame:
+    prepared = pandas.DataFrame(index=pandas.RangeIndex(len(df)))
+    first = _normalize(df['first_name']).str.split(' ').str[0]
+    prepared['first_name'] = first.replace(NICKNAMES).to_numpy()
+    prepared['last_name'] = _normalize(df['last_name']).to_numpy()
+    prepared['city'] = _normalize(df['city']).to_numpy()
+    prepared['state'] = df['state'].astype('string').fillna('').str.upper().str.strip().to_numpy()
+    prepared['postal_code'] = df['postal_code'].astype('string')\
+        .str.replace(r'\.0$', '', regex=True).str.zfill(5).fillna('').to_numpy()
+    prepared['initial'] = prepared['first_name'].str[:1]
+    prepared['zip3'] = prepared['postal_code'].str[:3]
+    return prepared
+
+
+def _blocks(prepared: pandas.DataFrame) -> pandas.DataFrame:
+    """One row per (record, last name part) with that part's phonetic code."""
+    parts = prepared['last_name'].str.split(r'[\- ]+').explode()
+    parts = parts[parts != '']
+    multipart = prepared['last_name'].str.contains(r'[\- ]')
+    whole = prepared.loc[multipart, 'last_name'].str.replace(r'[\- ]', '', regex=True)
+    parts = pandas.concat([parts, whole])
+
+    uniques = parts.unique()
+    codes = dict(zip(uniques, map(soundex, uniques)))
+    blocks = pandas.DataFrame({'row': parts.index.to_numpy(), 'part': parts.to_numpy()})
+    blocks['phonetic'] = blocks['part'].map(codes)
+    return blocks.join(prepared[['initial', 'state', 'zip3']], on='row')
+
+
+def _candidate_pairs(blocks: pandas.DataFrame) -> pandas.DataFrame:
+    pairs = []
+    for second_key in ('state', 'zip3'):
+        keyed = blocks[blocks[second_key] != '']
+        on = ['phonetic', 'initial', second_key]
+        merged = keyed[on + ['row', 'part']].merge(keyed[on + ['row', 'part']], on=on)
+        merged = merged[merged['row_x'] < merged['row_y']]
+        pairs.append(pandas.DataFrame({
+            'a': merged['row_x'].to_numpy(),
+            'b': merged['row_y'].to_numpy(),
+            'same_part': (merged['part_x'] == merged['part_y']).to_numpy(),
+        }))
+    pairs = pandas.concat(pairs)
+    # a pair is as good as its best shared last name part
+    return pairs.groupby(['a', 'b'], as_index=False)['same_part'].max()
+
+
+def score_pairs(prepared: pandas.DataFrame, pairs: pandas.DataFrame) -> numpy.ndarray:
+    a = prepared.iloc[pairs['a'].to_numpy()].reset_index(drop=True)
+    b = prepared.iloc[pairs['b'].to_numpy()].reset_index(drop=True)
+
+    last = numpy.where(pairs['same_part'].to_numpy(), 1.0, 0.7)
+    last = numpy.where(a['last_name'] == b['last_name'], 1.0, last)
+
+    first_initial_only = (a['first_name'].str.len() == 1) | (b['first_name'].str.len() == 1)
+    first = numpy.where(a['first_name'] == b['first_name'], 1.0,
+                        numpy.where(first_initial_only, 0.5, 0.0))
+
+    zip_a, zip_b = a['postal_code'], b['postal_code']
+    mismatches = sum((zip_a.str[i] != zip_b.str[i]).astype(int) for i in range(5))
+    zip_ = numpy.where((zip_a == zip_b) & (zip_a != ''), 1.0,
+                       numpy.where((a['zip3'] == b['zip3']) & (mismatches <= 1), 0.8, 0.0))
+
+    city = ((a['city'] == b['city']) & (a['city'] != '')).astype(float).to_numpy()
+
+    return WEIGHTS['last_name'] * last + WEIGHTS['first_name'] * first \
+        + WEIGHTS['postal_code'] * zip_ + WEIGHTS['city'] * city
+
+
+def _connected_components(n: int, a: numpy.ndarray, b: numpy.ndarray) -> numpy.ndarray:
+    labels = numpy.arange(n)
+    while True:
+        low = numpy.minimum(labels[a], labels[b])
+        new = labels.copy()
+        numpy.minimum.at(new, a, low)
+        numpy.minimum.at(new, b, low)
+        new = new[new]  # pointer jumping
+        if numpy.array_equal(new, labels):
+            return labels
+        labels = new
+
+
+def cluster(df: pandas.DataFrame, threshold: float = THRESHOLD) -> numpy.ndarray:
+    """Cluster id (the position of its first member) for each row of `df`."""
+    prepared = _prepare(df)
+    pairs = _candidate_pairs(_blocks(prepared))
+    linked = pairs[score_pairs(prepared, pairs) >= threshold] if len(pairs) else pairs
+
+    # exact duplicates are always linked, even when missing fields keep them out of every block
+    positions = pandas.Series(numpy.arange(len(df)))
+    exact_groups = df[EXACT_COLUMNS].reset_index(drop=True).groupby(EXACT_COLUMNS, dropna=False, observed=True).ngroup()
+    first_of_group = positions.groupby(exact_groups).transform('min')
+
+    a = numpy.concatenate([linked['a'].to_numpy(dtype=int), positions.to_numpy()])
+    b = numpy.concatenate([linked['b'].to_numpy(dtype=int), first_of_group.to_numpy()])
+    return _connected_components(len(df), a, b)
+
+
+def drop_near_duplicates(df: pandas.DataFrame, threshold: float = THRESHOLD,
+                         columns: List[str] = None) -> pandas.DataFrame:
+    """
+    Keep one row per cluster: the most complete one over `columns`, earliest first on ties.
+    Exact duplicates always score 1, so this drops at least what `drop_duplicates` would.
+    """
+    columns = columns or [c for c in df.columns if c in WEIGHTS or c == 'state']
+    clusters = cluster(df, threshold)
+    completeness = df[columns].notna().sum(axis=1).to_numpy()
+
+    order = pandas.DataFrame({'cluster': clusters, 'completeness': -completeness,
+                              'position': numpy.arange(len(df))})\
+        .sort_values(['cluster', 'completeness', 'position'])
+    keep = numpy.sort(order.drop_duplicates('cluster')['position'].to_numpy())
+    return df.iloc[keep]
@@ -0,0 +1,129 @@
+from collections import Counter
+from difflib import SequenceMatcher
+import functools
+import logging
+from typing import Dict, List, Optional
+
+import numpy
+import pandas
+
+__doc__ = """
+Map free-text specialty names (e.g. AMA specialties) to NUCC taxonomy codes.
+
+Gives the same answer as comparing against every crosswalk row in file order and
+taking the first with `SequenceMatcher.ratio() >= threshold`, but most rows are
+ruled out by cheap upper bounds on the ratio (length, then shared characters)
+before any `SequenceMatcher` is built. A name that is in the crosswalk verbatim
+(directly or through `REPLACEMENTS`) only needs the rows before it checked.
+"""
+
+logger = logging.getLogger(__name__)
+
+SPECIALTY_CODES_PATH = 'data/util/specialty_codes.csv'
+
+REPLACEMENTS = {
+    'Optometry': 'Optometrist',
+    'Pediatric Ophthalmology': 'Pediatric Ophthalmology and Strabismus Specialist',
+    'OPR': 'Ophthalmic Plastic and Reconstructive Surgery'
+}
+
+
+class SpecialtyMatcher:
+    def __init__(self, crosswalk: pandas.DataFrame, threshold: float = 0.95,
+                 replacements: Dict[str, str] = REPLACEMENTS):
+        names = crosswalk['Specialization'].fillna(crosswalk['Classification'])
+        keep = names.notna()
+
+        self.threshold = threshold
+        self.replacements = replacements
+        self._names: List[str] = names[keep].to_list()
+        self._codes: List[str] = crosswalk.loc[keep, 'Code'].to_list()
+        self._lengths = numpy.array([len(n) for n in self._names])
+        self._char_counts = [Counter(n) for n in self._names]
+        self._first_index: Dict[str, int] = {}
+        for i, name in enumerate(self._names):
+            self._first_index.setdefault(name, i)
+        self._cache: Dict[str, Optional[str]] = {}  # per instance, unlike lru_cache on a method
+
+    @classmethod
+    def from_csv(cls, path: str = SPECIALTY_CODES_PATH, **kwargs) -> 'SpecialtyMatcher':
+        crosswalk = pandas.read_csv(path, index_col=0, comment='#')\
+            .loc[:, ['Code', 'Classification', 'Specialization']]
+        return cls(crosswalk, **kwargs)
+
+    def match(self, specialty: Optional[str]) -> Optional[str]:
+        if pandas.isnull(specialty):
+            return None
+        if specialty not in self._cache:
+            self._cache[specialty] = self._match(self.replacements.get(specialty, specialty))
+        return self._cache[specialty]
+
+    def _match(self, specialty: str) -> Optional[str]:
+        n = len(specialty)
+        if n == 0:
+            return None
+
+        # an exact name has ratio 1, so only an earlier row can beat it
+        exact = self._first_index.get(specialty)
+        stop = len(self._names) if exact is None else exact
+
+        # ratio = 2M / (len_a + len_b) and M <= min(len_a, len_b)
+        max_ratio = 2 * numpy.minimum(self._lengths[:stop], n) / (self._lengths[:stop] + n)
+        chars = Counter(specialty)
+
+        for i in numpy.flatnonzero(max_ratio >= self.threshold):
+            # M is also bounded by the characters the strings have in common (quick_ratio)
+            shared = sum((self._char_counts[i] & chars).values())
+            if 2 * shared / (self._lengths[i] + n) < self.threshold:
+                continue
+            if SequenceMatcher(None, self._names[i], specialty).ratio() >= self.threshold:
+                return self._codes[i]
+        return None if exact is None else self._codes[exact]
+
+    def match_series(self, ser: pandas.Series) -> pandas.Series:
+        uniques = ser.dropna().unique()
+        return ser.map({s: self.match(s) for s in uniques})
+
+
+@functools.lru_cache(maxsize=None)
+def get_matcher(path: str = SPECIALTY_CODES_PATH, threshold: float = 0.95) -> SpecialtyMatcher:
+    return SpecialtyMatcher.from_csv(path, threshold=threshold)
+
+
+if __name__ == '__main__':
+    # benchmark against the original row-by-row scan, and check they agree
+    import time
+
+    logging.basicConfig(level=logging.INFO)
+
+    crosswalk = pandas.read_csv(SPECIALTY_CODES_PATH, index_col=0, comment='#')\
+        .loc[:, ['Code', 'Classification', 'Specialization']]
+    specialties = pandas.concat([
+        pandas.read_csv('data/raw/_tepezza_raw_old.csv')['AMA_SPECIALITY'],
+        crosswalk['Classification'],
+        crosswalk['Specialization'],
+    ]).dropna().unique()
+
+    def scan(specialty: str, threshold: float = 0.95) -> Optional[str]:
+        specialty = REPLACEMENTS.get(specialty, specialty)
+        for _, row in crosswalk.iterrows():
+            specialty2 = row['Specialization']
+            if pandas.isnull(specialty2):
+                specialty2 = row['Classification']
+                if pandas.isnull(specialty2):
+                    continue
+            if SequenceMatcher(None, specialty2, specialty).ratio() >= threshold:
+                return row['Code']
+
+    start = time.perf_counter()
+    expected = [scan(s) for s in specialties]
+    scan_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    matcher = SpecialtyMatcher(crosswalk)
+    actual = [matcher.match(s) for s in specialties]
+    matcher_time = time.perf_counter() - start
+
+    assert actual == expected, [(s, a, e) for s, a, e in zip(specialties, actual, expected) if a != e]
+    logger.info(f'{len(specialties)} specialties: scan {scan_time:.3f}s, matcher {matcher_time:.3f}s '
+                f'({scan_time / matcher_time:.0f}x)')
@@ -0,0 +1,157 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, Optional
+
+from get_npi.transport import NpiTransport
+from util.instrumentation import METRICS
+
+__doc__ = """Persistent, content-addressed cache of NPI registry responses."""
+
+logger = logging.getLogger(__name__)
+
+
+class CacheMiss(KeyError):
+    """Raised by an offline `CachingTransport` when a query was never cached."""
+
+
+def canonicalize_params(params: Dict[str, Any]) -> Dict[str, str]:
+    # blank/None params aren't sent by requests, and the registry ignores case and padding
+    return {k: str(v).strip().upper() for k, v in params.items()
+            if v is not None and str(v).strip() != ''}
+
+
+def params_key(params: Dict[str, Any]) -> str:
+    canonical = json.dumps(canonicalize_params(params), sort_keys=True)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class ResponseCache:
+    """
+    SQLite table of zlib-compressed JSON bodies keyed by `params_key`.
+    Entries older than `ttl` seconds are ignored, and once the stored bodies exceed
+    `max_bytes` the least recently read ones are evicted. `read_only` never writes.
+    `clock` is only there for tests.
+    """
+
+    _EVICT_EVERY = 100  # puts between eviction passes
+
+    def __init__(self, path: str, ttl: Optional[float] = None, max_bytes: Optional[int] = None,
+                 read_only: bool = False, clock: Callable[[], float] = time.time):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.read_only = read_only
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+
+        if read_only:
+            self._conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True, check_same_thread=False)
+        else:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS responses '
+                '(key TEXT PRIMARY KEY, body BLOB, size INTEGER, created REAL, accessed REAL)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+            self._conn.commit()
+
+    def _expired(self, created: float, now: float) -> bool:
+        return self.ttl is not None and now - created > self.ttl
+
+    def get(self, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        key = params_key(params)
+        now = self.clock()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT body, created FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None or self._expired(row[1], now):
+                self.misses += 1
+                METRICS.incr('cache.misses')
+                return None
+            if not self.read_only:
+                self._conn.execute('UPDATE responses SET accessed = ? WHERE key = ?', (now, key))
+                self._conn.commit()
+            self.hits += 1
+        METRICS.incr('cache.hits')
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, params: Dict[str, Any], body: Dict[str, Any]) -> None:
+        if self.read_only:
+            return
+        blob = zlib.compress(json.dumps(body).encode())
+        now = self.clock()
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)',
+                (params_key(params), blob, len(blob), now, now))
+            self._conn.commit()
+            self._puts += 1
+            if self._puts % self._EVICT_EVERY == 0:
+                self._evict()
+
+    def evict(self) -> None:
+        if self.read_only:
+            return
+        with self._lock:
+            self._evict()
+
+    def _evict(self) -> None:
+        if self.ttl is not None:
+            self._conn.execute('DELETE FROM responses WHERE created < ?', (self.clock() - self.ttl,))
+
+        if self.max_bytes is not None:
+            total, = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()
+            if total > self.max_bytes:
+                # walk from least recently read, deleting until under budget
+                cutoff = None
+                for accessed, size in self._conn.execute(
+                        'SELECT accessed, size FROM responses ORDER BY accessed'):
+                    total -= size
+                    cutoff = accessed
+                    if total <= self.max_bytes:
+                        break
+                self._conn.execute('DELETE FROM responses WHERE accessed <= ?', (cutoff,))
+
+        self._conn.commit()
+
+    def close(self) -> None:
+        self.evict()
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self) -> 'ResponseCache':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+class CachingTransport:
+    """Wraps another transport. With `offline=True` the inner transport is never called."""
+
+    def __init__(self, inner: Optional[NpiTransport], cache: ResponseCache, offline: bool = False):
+        assert inner is not None or offline, 'an inner transport is required unless offline'
+        self.inner = inner
+        self.cache = cache
+        self.offline = offline
+
+    def get(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        body = self.cache.get(params)
+        if body is not None:
+            return body
+        if self.offline:
+            raise CacheMiss(canonicalize_params(params))
+
+        body = self.inner.get(params)
+        self.cache.put(params, body)
+        return body
@@ -0,0 +1,62 @@
+import logging
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+import pandas
+
+from get_npi.resolver import ResolveResult
+from util.jsonl import JsonlSink, read_jsonl
+
+__doc__ = """
+Append-only journal of resolved rows so an NPI run can be killed and resumed.
+
+Rows that failed (an exception rather than "no unique match") are journaled with
+the error and are not done: a resume tries them again.
+"""
+
+logger = logging.getLogger(__name__)
+
+KEY_COLUMNS = ('first_name', 'last_name', 'city', 'postal_code', 'state')  # what all.csv is deduped on
+
+
+class JournalRecord(NamedTuple):
+    key: str
+    npi: Optional[int]
+    indices: List[int]
+    count: int
+    calls: int = 0
+    error: Optional[str] = None
+
+    @property
+    def done(self) -> bool:
+        return self.error is None
+
+
+def row_keys(df: pandas.DataFrame, key_columns: Sequence[str] = KEY_COLUMNS) -> pandas.Series:
+    parts = [df[c].astype('string').fillna('') for c in key_columns]
+    return parts[0].str.cat(parts[1:], sep='|')
+
+
+class NpiJournal(JsonlSink):
+    """One JSON line per resolved row, flushed and fsynced as it's written. A row's last line wins."""
+
+    def load(self) -> Dict[str, JournalRecord]:
+        records = {}
+        for line in read_jsonl(self.path):
+            try:
+                record = JournalRecord(**line)
+            except TypeError:
+                logger.warning(f'skipping malformed journal record in {self.path}: {line}')
+                continue
+            records[record.key] = record
+        return records
+
+    def done(self) -> Dict[str, JournalRecord]:
+        """Rows not to resolve again: everything but the failures."""
+        return {key: record for key, record in self.load().items() if record.done}
+
+    def append(self, key: str, result: ResolveResult) -> None:
+        super().append(JournalRecord(key, *result)._asdict())
+
+    def __enter__(self) -> 'NpiJournal':
+        super().__enter__()
+        return self
@@ -0,0 +1,182 @@
+import argparse
+import logging
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List
+
+import pandas
+
+from util.instrumentation import StageRun
+from util.schema import normalize_zip5
+
+__doc__ = """
+Offline NPI lookups from the CMS NPPES dissemination file
+(https://download.cms.gov/nppes/NPI_Files.html).
+
+The multi-GB CSV is streamed in chunks into a small SQLite index of individual
+providers keyed on normalized name, state and zip5, plus their taxonomy codes.
+Monthly/weekly update files have the same layout and are applied with the same
+`build_index` call. `NppesTransport` answers `DoctorQuery` params like the
+registry API does, so `NpiResolver` can run against it unchanged.
+"""
+
+logger = logging.getLogger(__name__)
+
+_TAXONOMY_SLOTS = 15
+NPPES_COLUMNS = {
+    'NPI': 'npi',
+    'Entity Type Code': 'entity_type',
+    'Provider Last Name (Legal Name)': 'last_name',
+    'Provider First Name': 'first_name',
+    'Provider Business Practice Location Address City Name': 'city',
+    'Provider Business Practice Location Address State Name': 'state',
+    'Provider Business Practice Location Address Postal Code': 'postal_code',
+    'NPI Deactivation Date': 'deactivation_date',
+    'NPI Reactivation Date': 'reactivation_date',
+    **{f'Healthcare Provider Taxonomy Code_{i}': f'taxonomy_{i}' for i in range(1, _TAXONOMY_SLOTS + 1)}
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS providers (
+    npi INTEGER PRIMARY KEY,
+    last_name TEXT, first_name TEXT, city TEXT, state TEXT, zip5 TEXT
+);
+CREATE TABLE IF NOT EXISTS taxonomies (npi INTEGER, code TEXT);
+CREATE INDEX IF NOT EXISTS providers_name ON providers (last_name, first_name, state, zip5);
+CREATE INDEX IF NOT EXISTS taxonomies_npi ON taxonomies (npi, code);
+"""
+
+
+def normalize_name(ser: pandas.Series) -> pandas.Series:
+    return ser.str.strip().str.upper()
+
+
+def build_index(csv_path: str, db_path: str, chunksize: int = 200_000) -> int:
+    """Stream `csv_path` (full or update file) into `db_path`. Returns providers upserted."""
+    conn = sqlite3.connect(db_path)
+    conn.executescript(_SCHEMA)
+
+    total = 0
+    chunks = pandas.read_csv(
+        csv_path, usecols=lambda c: c in NPPES_COLUMNS, dtype=str, chunksize=chunksize)
+    for chunk in chunks:
+        chunk = chunk.rename(columns=NPPES_COLUMNS)
+
+        # deactivated NPIs come with a blank entity type, so they're found before filtering on it
+        deactivated = chunk['deactivation_date'].notna() & chunk['reactivation_date'].isna()
+        _delete(conn, chunk.loc[deactivated, 'npi'].astype(int))
+        chunk = chunk[~deactivated & (chunk['entity_type'] == '1')]  # individuals (NPI-1)
+
+        providers = pandas.DataFrame({
+            'npi': chunk['npi'].astype(int),
+            'last_name': normalize_name(chunk['last_name']),
+            'first_name': normalize_name(chunk['first_name']),
+            'city': normalize_name(chunk['city']),
+            'state': normalize_name(chunk['state']),
+            'zip5': normalize_zip5(chunk['postal_code']),
+        })
+        taxonomies = chunk\
+            .melt(id_vars='npi', value_vars=[f'taxonomy_{i}' for i in range(1, _TAXONOMY_SLOTS + 1)],
+                  value_name='code')\
+            .dropna(subset=['code'])
+        taxonomies = taxonomies[['npi', 'code']].astype({'npi': int}).drop_duplicates()
+
+        with conn:
+            _delete(conn, providers['npi'])
+            conn.executemany(
+                'INSERT INTO providers VALUES (?, ?, ?, ?, ?, ?)',
+                providers.astype(object).where(providers.notna(), None).itertuples(index=False, name=None))
+            conn.executemany('INSERT INTO taxonomies VALUES (?, ?)',
+                             taxonomies.itertuples(index=False, name=None))
+
+        total += len(providers)
+        logger.info(f'indexed {total} providers from {csv_path}')
+
+    conn.execute('ANALYZE')
+    conn.close()
+    return total
+
+
+def _delete(conn: sqlite3.Connection, npis: Iterable[int]) -> None:
+    rows = [(int(i),) for i in npis]
+    conn.executemany('DELETE FROM providers WHERE npi = ?', rows)
+    conn.executemany('DELETE FROM taxonomies WHERE npi = ?', rows)
+
+
+class NppesTransport:
+    """Answers registry-shaped requests from a `build_index` database."""
+
+    _FILTERS = {
+        'last_name': 'p.last_name = ?',
+        'first_name': 'p.first_name = ?',
+        'city': 'p.city = ?',
+        'state': 'p.state = ?',
+        'postal_code': 'p.zip5 = ?',
+        'specialty_code': 'EXISTS (SELECT 1 FROM taxonomies t WHERE t.npi = p.npi AND t.code = ?)',
+    }
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(f'file:{self.db_path}?mode=ro', uri=True)
+        return conn
+
+    def get(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        where, args = [], []
+        for k, clause in self._FILTERS.items():
+            v = params.get(k)
+            if v is None or str(v).strip() == '':
+                continue
+            v = str(v).strip().upper()
+            if k == 'postal_code':
+                v = normalize_zip5(pandas.Series([v])).iat[0]
+            where.append(clause)
+            args.append(v)
+
+        sql = 'SELECT npi, first_name, last_name, city, state, zip5 FROM providers p'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY npi LIMIT ? OFFSET ?'
+        args += [int(params.get('limit', 10)), int(params.get('skip', 0))]
+
+        conn = self._conn()
+        rows = conn.execute(sql, args).fetchall()
+        codes: Dict[int, List[str]] = {npi: [] for npi, *_ in rows}
+        if codes:  # one query for the whole page's taxonomies
+            placeholders = ', '.join('?' * len(codes))
+            for npi, code in conn.execute(
+                    f'SELECT npi, code FROM taxonomies WHERE npi IN ({placeholders})', list(codes)):
+                codes[npi].append(code)
+
+        results: List[Dict[str, Any]] = []
+        for npi, first, last, city, state, zip5 in rows:
+            results.append({
+                'number': npi,
+                'enumeration_type': 'NPI-1',
+                'basic': {'first_name': first, 'last_name': last},
+                'addresses': [{'address_purpose': 'LOCATION', 'city': city,
+                               'state': state, 'postal_code': zip5}],
+                'taxonomies': [{'code': c} for c in codes[npi]],
+            })
+        return {'result_count': len(results), 'results': results}
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description='Build or update the local NPPES index.')
+    parser.add_argument('csv_paths', nargs='+',
+                        help='full dissemination file and/or update files, applied in order')
+    parser.add_argument('--db', default='data/cache/nppes.sqlite')
+    parser.add_argument('--chunksize', type=int, default=200_000)
+    args = parser.parse_args()
+
+    os.makedirs(os.path.dirname(args.db) or '.', exist_ok=True)
+    with StageRun('nppes_index') as run:
+        for path in args.csv_paths:
+            run.rows(build_index(path, args.db, args.chunksize))
@@ -1,15 +1,14 @@
 from pydantic import BaseModel, validator
-from pydantic.error_wrappers import ValidationError
-import requests
 import logging
-import json
-from typing import Dict, Any, Optional, List, Iterator
+from typing import Dict, Any, Optional, Iterator, Tuple
 import pandas
 
+from get_npi.transport import NPI_REGISTRY_URL, NpiTransport, RequestsTransport
+
 
 class DoctorQuery(BaseModel):
     # TODO: add taxonomy
-    _URL = 'https://npiregistry.cms.hhs.gov/api'
+    _URL = NPI_REGISTRY_URL
     _VALID_VERSIONS = ('2.0', '2.1')
     _VALID_NPI_TYPES = ('NPI-1', 'NPI-2')
 
@@ -39,111 +38,126 @@ class DoctorQuery(BaseModel):
     _MAX_PAGE_SKIP = 1000
     _MAX_DATA_RETURN = _MAX_PAGE_SKIP + max(_PAGE_SIZE_RANGE)
 
-    def query_result_paged(self, page_size: int = 100, stop_after: int = 1200) -> Iterator[Dict[str, Any]]:
+    def query_result_paged(self, page_size: int = 100, stop_after: int = 1200,
+                           transport: Optional[NpiTransport] = None) -> Iterator[Dict[str, Any]]:
         assert page_size in self._PAGE_SIZE_RANGE, \
             f'invalid page_size of {page_size}: must be in {self._PAGE_SIZE}'
         assert stop_after <= self._MAX_DATA_RETURN, \
             f'invalid stop_after of {stop_after}: must be <= {self._MAX_DATA_RETURN}'
 
+        transport = transport or RequestsTransport(self._URL)
         params = self.dict()
         for page_skip in range(0, stop_after+1, page_size):
             params['limit'] = page_size
             params['skip'] = page_skip
 
-            resp = requests.get(self._URL, params=params)
-            res = json.loads(resp.text)
+            res = transport.get(params)
             if res['result_count'] == 0:
                 return
             yield res
 
+    def probe(self, transport: Optional[NpiTransport] = None) -> Dict[str, Any]:
+        """
+        One request that only tells apart 0, 1 and >1 matches. The registry's
+        `result_count` is the number of results returned, so a limit of 1 can't.
+        """
+        transport = transport or RequestsTransport(self._URL)
+        params = self.dict()
+        params['limit'] = 2
+        params['skip'] = 0
+        return transport.get(params)
+
+
+
+# least restrictive to most restrictive query params.
+# multiple elements in a tuple means they are queried together (or not at all)
+DROP_ORDER: Tuple[Tuple[str, ...], ...] = (
+    ('city',),
+    ('postal_code',),
+    ('state',),
+    ('specialty_code',),
+    ('first_name', 'last_name')
+)
+START_IDX = 3  # "bottom" of search
+
+
+def get_query(row: pandas.Series, min_: int, max_: int,
+              drop_order: Tuple[Tuple[str, ...], ...] = DROP_ORDER) -> DoctorQuery:
+    param_names = sum(drop_order[min_: max_], ())
+
+    query_params = {k: v for k, v in row.to_dict().items()
+                    if k in param_names and not pandas.isna(v)}
+    return DoctorQuery(**query_params)
+
 
 if __name__ == '__main__':
-    try:
-        logger = logging.getLogger(__name__)
-        logger.setLevel(logging.INFO)
-        logging.basicConfig()
-
-        DF_SOURCE = 'data/processed/all.csv'
-        DF_DEST = 'data/processed/all_with_npi3.csv'
-        OVERWRITE = True
-
-        df: pandas.DataFrame = pandas.read_csv(DF_SOURCE, index_col=0)
-
-        if 'npi' not in df.columns:
-            df['npi'] = -1
-
-        # least restrictive to most restrictive query params.
-        # multiple elements in a tuple means they are queried together (or not at all)
-        DROP_ORDER = (
-            ('city',),
-            ('postal_code',),
-            ('state',),
-            ('specialty_code',),
-            ('first_name', 'last_name')
+    from get_npi.cache import CachingTransport, ResponseCache
+    from get_npi.checkpoint import NpiJournal, row_keys
+    from util.schema import ROSTER_SCHEMA, read_table, write_table
+    from get_npi.resolver import NpiResolver
+    from util.instrumentation import StageRun
+
+    logger = logging.getLogger(__name__)
+    logging.basicConfig(level=logging.INFO)
+
+    DF_SOURCE = 'data/processed/all'  # .parquet, or .csv if there's no parquet
+    DF_DEST = 'data/processed/all_with_npi3'
+    JOURNAL_PATH = 'data/cache/npi_journal.jsonl'  # delete to start over
+    OVERWRITE = True  # re-resolve rows that already have an npi in DF_SOURCE
+    WORKERS = 8
+    STRATEGY = 'linear'  # 'bisect' isn't faster on real rosters, see NpiResolver
+    REQUESTS_PER_SECOND = 10
+    CACHE_PATH = 'data/cache/npi_responses.sqlite'
+    CACHE_TTL = 30 * 24 * 60 * 60  # registry data changes slowly; a month is fine
+    CACHE_MAX_BYTES = 512 * 1024 * 1024
+    OFFLINE = False  # answer only from CACHE_PATH, never touch the network
+    NPPES_DB = None  # e.g. 'data/cache/nppes.sqlite' (see nppes_index.py) to skip the registry api
+
+    df: pandas.DataFrame = read_table(DF_SOURCE, ROSTER_SCHEMA)
+
+    if 'npi' not in df.columns:
+        df['npi'] = -1
+
+    journal = NpiJournal(JOURNAL_PATH)
+    done = journal.done()  # failed rows are tried again
+    keys = row_keys(df)
+
+    todo = df[~keys.isin(done.keys())]
+    if not OVERWRITE:
+        todo = todo[todo['npi'] == -1]
+    logger.info(f'{len(done)} rows already in {JOURNAL_PATH}, {len(todo)} left to resolve')
+
+    cache = ResponseCache(CACHE_PATH, CACHE_TTL, CACHE_MAX_BYTES, read_only=OFFLINE)
+    if NPPES_DB:
+        from get_npi.nppes_index import NppesTransport
+        transport = NppesTransport(NPPES_DB)
+    else:
+        transport = CachingTransport(
+            None if OFFLINE else RequestsTransport(
+                requests_per_second=REQUESTS_PER_SECOND, pool_size=WORKERS),
+            cache,
+            offline=OFFLINE
         )
-        START_IDX = 3  # "bottom" of search
-
-        def get_queries(row: pandas.Series, min_: int, max_: int) -> DoctorQuery:
-            param_names = sum(DROP_ORDER[min_: max_], ())
-            logger.debug(f'param_names: {param_names}')
-
-            query_params = {k: v for k, v in row.to_dict().items()
-                            if k in param_names}
-            return DoctorQuery(**query_params)
-
-        for df_index, row in df.iterrows():
-            if not OVERWRITE and row['npi'] != -1:
-                continue
-
-            logger.debug(f"finding npi for:\n{row}")
-
-            idx = START_IDX
-            prev_indices = []
-
-            df.at[df_index, 'npi'] = None
-            df.to_csv(DF_DEST)
-
-            while True:
-                try:
-                    if idx in prev_indices:
-                        logger.warning(
-                            f'no solution found for:\n{row} (ping ponging concern: idx = {idx}, prev_indices = {prev_indices})')
-                        break
-                    if idx < 0 or idx >= len(DROP_ORDER):
-                        logger.warning(
-                            f'no solution found for:\n{row} (exceeded array bounds: idx = {idx})')
-                        break
-
-                    prev_indices.append(idx)
-
-                    count = 0
-                    result = None
-
-                    try:
-                        results = get_queries(row, idx, len(
-                            DROP_ORDER)).query_result_paged()
-                    except ValidationError:
-                        count = 2
-                    else:
-                        for result in results:
-                            count += result['result_count']
-                            if count > 1:
-                                break
-
-                    if count == 0:
-                        idx += 1
-                        logger.debug(
-                            f'too restrictive, increasing floor to {DROP_ORDER[idx:]} (idx = {idx})')
-                    elif count == 1:
-                        npi = result['results'][0]['number']
-                        logger.info(f'found {npi} for:\n{row}')
-                        df.at[df_index, 'npi'] = npi
-                        break
-                    elif count > 1:
-                        idx -= 1
-                        logger.debug(
-                            f'not restrictive enough, decreasing floor to {DROP_ORDER[idx:]} (idx = {idx})')
-                except KeyError as e:
-                    logger.critical('exception:', exc_info=e)
-    except:
-        pass
+    resolver = NpiResolver(transport, workers=WORKERS, strategy=STRATEGY)
+
+    try:
+        with StageRun('npi') as run:
+            with journal:
+                for i, (df_index, result) in enumerate(resolver.resolve(todo.iterrows())):
+                    journal.append(keys[df_index], result)
+                    run.rows()
+                    run.progress(i + 1, len(todo))
+
+            records = journal.load()
+            journaled = {k: r.npi for k, r in records.items() if r.done}
+            if len(journaled) < len(records):
+                logger.warning(f'{len(records) - len(journaled)} rows failed, rerun to retry them')
+            in_journal = keys.isin(journaled.keys())
+            df.loc[in_journal, 'npi'] = keys[in_journal].map(journaled)
+            write_table(df, DF_DEST, ROSTER_SCHEMA)  # materialized once, atomically
+    except KeyboardInterrupt:
+        logger.warning(f'interrupted, rerun to resume from {JOURNAL_PATH}')
+    finally:
+        logger.info(f'{resolver.calls} api calls for {resolver.resolved} npis '
+                    f'({resolver.calls / max(resolver.resolved, 1):.2f} per npi, strategy {STRATEGY})')
+        cache.close()
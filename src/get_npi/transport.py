@@ -0,0 +1,30 @@
+from typing import Any, Dict, Optional, Protocol
+
+from util.http import RateLimiter, ThreadLocalSession, get_with_backoff
+
+__doc__ = """Ways of sending a `DoctorQuery` somewhere that answers like the NPI registry API."""
+
+NPI_REGISTRY_URL = 'https://npiregistry.cms.hhs.gov/api'
+
+
+class NpiTransport(Protocol):
+    def get(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Send one page request, return the decoded JSON body."""
+        ...
+
+
+class RequestsTransport:
+    """Pooled, rate limited HTTP transport with retries. Point `url` at a local stand-in to test against it."""
+
+    def __init__(self, url: str = NPI_REGISTRY_URL, requests_per_second: Optional[float] = None,
+                 pool_size: int = 10, timeout: float = 30):
+        self.url = url
+        self.timeout = timeout
+        self.rate_limiter = RateLimiter(requests_per_second)
+        self._sessions = ThreadLocalSession(pool_size)
+
+    def get(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        resp = get_with_backoff(self._sessions.get(), self.url, self.rate_limiter,
+                                timeout=self.timeout, params=params)
+        resp.raise_for_status()
+        return resp.json()
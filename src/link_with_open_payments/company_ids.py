@@ -0,0 +1,209 @@
+import argparse
+import logging
+import os
+import time
+from io import StringIO
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import pandas
+
+from get_npi.cache import ResponseCache
+from util.http import get_with_backoff, make_session
+from util.instrumentation import StageRun
+
+__doc__ = """
+Resolve manufacturer names (e.g. from `compareToCompanies.csv`) to Open Payments entity ids.
+
+Rather than one or two datastore queries per name, the company rows of the profile
+table are downloaded once and every name is matched locally. The profile table, the
+resolved name -> id mapping and metastore lookups are kept under `cache_dir` and
+refreshed once they're older than `max_age`. Names matching several companies are
+reported as ambiguous, with their candidates, instead of being dropped.
+"""
+
+logger = logging.getLogger(__name__)
+
+METASTORE_URL = 'https://openpaymentsdata.cms.gov/api/1/metastore/schemas/dataset/items/{dataset_id}'
+DOWNLOAD_URL = 'https://openpaymentsdata.cms.gov/api/1/datastore/query/{dataset_id}/0/download'
+PROFILE_DATASET_ID = 'yjhd-k7tx'
+CACHE_DIR = 'data/cache/open_payments'
+MAX_AGE = 30 * 24 * 60 * 60  # CMS republishes at most a few times a year
+
+
+class CompanyMatch(NamedTuple):
+    name: str
+    entity_id: Optional[str]  # None unless exactly one company matched
+    matched_on: Optional[str]  # the search term that gave the unique match
+    candidates: Tuple[str, ...]  # entity ids, when ambiguous
+
+    @property
+    def status(self) -> str:
+        if self.entity_id is not None:
+            return 'matched'
+        return 'ambiguous' if self.candidates else 'unmatched'
+
+
+def search_terms(name: str) -> List[str]:
+    # the full name, then just its first word ("Horizon Therapeutics" -> "Horizon")
+    name = name.strip()
+    terms = [name]
+    if len(name.split()) > 1:
+        terms.append(name.split()[0])
+    return terms
+
+
+def match_companies(names: Iterable[str], profiles: pandas.DataFrame) -> Dict[str, CompanyMatch]:
+    """
+    Case-insensitive substring match of each name against `profiles['entity_name']`.
+    A search term matching exactly one company resolves the name; otherwise the next
+    term is tried, and the first term's candidates are kept if none is unique.
+    """
+    entity_names = profiles['entity_name'].astype('string').str.upper().fillna('')
+    entity_ids = profiles['entity_id'].astype('string')
+
+    out = {}
+    for name in names:
+        match = CompanyMatch(name, None, None, ())
+        for term in search_terms(name):
+            found = tuple(entity_ids[entity_names.str.contains(term.upper(), regex=False)].unique())
+            if len(found) == 1:
+                match = CompanyMatch(name, found[0], term, ())
+                break
+            if found and not match.candidates:
+                match = match._replace(candidates=found)
+        out[name] = match
+    return out
+
+
+def unresolved(matches: Dict[str, CompanyMatch]) -> pandas.DataFrame:
+    """The ambiguous and unmatched names, for review."""
+    rows = [(m.name, m.status, len(m.candidates), '|'.join(m.candidates))
+            for m in matches.values() if m.entity_id is None]
+    return pandas.DataFrame(rows, columns=['name', 'status', 'candidate_count', 'candidates'])
+
+
+class CompanyIdResolver:
+    """
+    `max_age` (seconds) is the refresh policy for everything cached; `refresh=True`
+    refetches each cached item once, the first time it's needed.
+    """
+
+    def __init__(self, cache_dir: str = CACHE_DIR, max_age: Optional[float] = MAX_AGE, refresh: bool = False):
+        self.cache_dir = cache_dir
+        self.max_age = max_age
+        self.refresh = refresh
+        self._refreshed = set()
+        self._session = make_session(pool_size=1)
+        self._profiles_path = os.path.join(cache_dir, 'company_profiles.csv')
+        self._mapping_path = os.path.join(cache_dir, 'company_ids.csv')
+        self._metastore = ResponseCache(os.path.join(cache_dir, 'metastore.sqlite'), ttl=max_age)
+
+    def _must_refresh(self, key: str) -> bool:
+        return self.refresh and key not in self._refreshed
+
+    def _fresh(self, path: str) -> bool:
+        if self._must_refresh(path) or not os.path.exists(path):
+            return False
+        return self.max_age is None or time.time() - os.path.getmtime(path) <= self.max_age
+
+    def _write_atomic(self, df: pandas.DataFrame, path: str) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        df.to_csv(f'{path}.tmp', index=False)
+        os.replace(f'{path}.tmp', path)
+        self._refreshed.add(path)
+
+    def _get(self, url: str, **kwargs):
+        resp = get_with_backoff(self._session, url, **kwargs)
+        resp.raise_for_status()
+        return resp
+
+    def dataset_key(self, dataset_id: str) -> str:
+        """The datastore distribution id behind a dataset id, from the metastore."""
+        params = {'dataset_id': dataset_id}
+        body = None if self._must_refresh(dataset_id) else self._metastore.get(params)
+        if body is None:
+            body = self._get(METASTORE_URL.format(dataset_id=dataset_id),
+                             params={'show-reference-ids': 'false'}).json()
+            self._metastore.put(params, body)
+            self._refreshed.add(dataset_id)
+        return body['distribution'][0]['identifier']
+
+    def profiles(self) -> pandas.DataFrame:
+        """`entity_id` and `entity_name` of every company in the profile table."""
+        if not self._fresh(self._profiles_path):
+            logger.info('downloading company profiles')
+            params = {
+                'conditions[0][property]': 'entity_type',
+                'conditions[0][value]': 'c',
+                'conditions[0][operator]': '=',
+                'format': 'csv',
+            }
+            resp = self._get(DOWNLOAD_URL.format(dataset_id=PROFILE_DATASET_ID), params=params, timeout=300)
+            profiles = pandas.read_csv(StringIO(resp.text), dtype=str, usecols=['entity_id', 'entity_name'])
+            self._write_atomic(profiles, self._profiles_path)
+            return profiles
+        return pandas.read_csv(self._profiles_path, dtype=str)
+
+    def _cached_matches(self) -> Dict[str, CompanyMatch]:
+        # a mapping older than the profiles it was matched against is stale
+        if not self._fresh(self._mapping_path) or \
+                os.path.getmtime(self._mapping_path) < os.path.getmtime(self._profiles_path):
+            return {}
+        df = pandas.read_csv(self._mapping_path, dtype=str, keep_default_na=False)
+        return {row.name: CompanyMatch(row.name, row.entity_id or None, row.matched_on or None,
+                                       tuple(filter(None, row.candidates.split('|'))))
+                for row in df.itertuples(index=False)}
+
+    def resolve(self, names: Iterable[str]) -> Dict[str, CompanyMatch]:
+        names = list(dict.fromkeys(n.strip() for n in names))
+        profiles = self.profiles()  # downloaded first, so the mapping's freshness is judged against it
+        matches = self._cached_matches()
+
+        missing = [n for n in names if n not in matches]
+        if missing:
+            matches.update(match_companies(missing, profiles))
+            self._write_atomic(pandas.DataFrame(
+                [(m.name, m.entity_id or '', m.matched_on or '', '|'.join(m.candidates)) for m in matches.values()],
+                columns=['name', 'entity_id', 'matched_on', 'candidates']), self._mapping_path)
+
+        out = {n: matches[n] for n in names}
+        for m in out.values():
+            if m.status == 'ambiguous':
+                logger.warning(f"{m.name!r} matches {len(m.candidates)} companies: {', '.join(m.candidates)}")
+            elif m.status == 'unmatched':
+                logger.warning(f"{m.name!r} matches no company")
+        return out
+
+    def close(self) -> None:
+        self._metastore.close()
+        self._session.close()
+
+    def __enter__(self) -> 'CompanyIdResolver':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description='Resolve company names to Open Payments entity ids.')
+    parser.add_argument('companies_csv', nargs='?', default='src/link_with_open_payments/compareToCompanies.csv')
+    parser.add_argument('--out', default='data/processed/company_ids.txt',
+                        help='resolved ids, one per line (for download_open_payments --company-ids-file)')
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    parser.add_argument('--refresh', action='store_true', help='ignore and overwrite the cache')
+    args = parser.parse_args()
+
+    names = pandas.read_csv(args.companies_csv, encoding='utf-8-sig')['Company'].dropna()
+    with StageRun('company_ids') as run, CompanyIdResolver(args.cache_dir, refresh=args.refresh) as resolver:
+        matches = resolver.resolve(names)
+        run.rows(len(matches))
+        run.metrics.incr('unresolved', len(unresolved(matches)))
+
+    ids = sorted({m.entity_id for m in matches.values() if m.entity_id is not None})
+    os.makedirs(os.path.dirname(args.out) or '.', exist_ok=True)
+    with open(args.out, 'w') as f:
+        f.writelines(f'{i}\n' for i in ids)
+    logger.info(f"{len(ids)} ids for {len(matches)} names, {len(unresolved(matches))} unresolved")
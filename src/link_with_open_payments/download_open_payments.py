@@ -0,0 +1,256 @@
+import argparse
+import glob
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, List, Optional
+
+import pandas
+import pyarrow
+import pyarrow.dataset
+import pyarrow.parquet
+import requests
+
+from util.http import ThreadLocalSession, get_with_backoff
+from util.instrumentation import METRICS, StageRun
+from util.schema import PAYMENTS_SCHEMA, coerce, csv_dtypes
+
+__doc__ = """
+Download Open Payments records for a set of manufacturers into partitioned Parquet.
+
+Each (dataset, manufacturer) download is streamed to disk, parsed in chunks with
+explicit dtypes and only the needed columns, and written under
+`<out>/<kind>/program_year=<year>/manufacturer_id=<id>/`. Finished downloads are
+marked done and skipped on rerun. Failed requests are retried with backoff, and a
+download interrupted partway, in this run or an earlier one, resumes with a Range
+request from the partial file's size when the server supports it. `read_payments` reads a kind back with the
+union of every part's columns, since research files name different numbers of
+principal investigators.
+"""
+
+logger = logging.getLogger(__name__)
+
+DOWNLOAD_URL = 'https://openpaymentsdata.cms.gov/api/1/datastore/query/{dataset_id}/0/download'
+SEARCH_COL = 'applicable_manufacturer_or_applicable_gpo_making_payment_id'
+
+GENERAL_MASTER_IDS = ('ud7t-2ipu', 'qsys-b88w', 'txng-a8vj')
+RESEARCH_MASTER_IDS = ('nvfc-jcr4', '94mj-bpz5', '29v2-guh5')
+DATASETS = {'general': GENERAL_MASTER_IDS, 'research': RESEARCH_MASTER_IDS}
+
+TARGET_COLUMNS = [
+    'physician_profile_id',
+    'physician_first_name',
+    'physician_middle_name',
+    'physician_last_name',
+    'physician_name_suffix',
+    'physician_specialty',
+    'recipient_primary_business_street_address_line1',
+    'recipient_primary_business_street_address_line2',
+    'recipient_city',
+    'recipient_state',
+    'recipient_zip_code',
+    'recipient_country',
+    'recipient_postal_code',
+    'physician_primary_type',
+    'total_amount_of_payment_usdollars',
+    'date_of_payment',
+    'number_of_payments_included_in_total_amount',
+    'form_of_payment_or_transfer_of_value',
+    'nature_of_payment_or_transfer_of_value',
+    'record_id',
+    'program_year',
+    'payment_publication_date',
+    'applicable_manufacturer_or_applicable_gpo_making_payment_name',
+    'applicable_manufacturer_or_applicable_gpo_making_payment_id'
+]
+_PRINCIPAL_INVESTIGATORS = 5
+# a connection dropped or stalled mid-body; get_with_backoff only covers getting the response
+_STREAM_ERRORS = (requests.ConnectionError, requests.exceptions.ChunkedEncodingError, requests.Timeout)
+# categories differ between parts, so they're stored as strings and applied by read_payments
+_STORAGE_SCHEMA = {c: 'string' if t == 'category' else t for c, t in PAYMENTS_SCHEMA.items()}
+_PARTITIONING = pyarrow.dataset.partitioning(
+    pyarrow.schema([('program_year', pyarrow.string()), ('manufacturer_id', pyarrow.string())]), flavor='hive')
+
+
+def _is_target_column(kind: str) -> Callable[[str], bool]:
+    if kind == 'general':
+        return lambda col: col in TARGET_COLUMNS
+    # research rows name up to five principal investigators instead of one physician
+    return lambda col: col.startswith('principal_investigator') or \
+        (col in TARGET_COLUMNS and not col.startswith(('physician', 'recipient')))
+
+
+def _dtypes(columns: Iterable[str]) -> Dict[str, str]:
+    # principal investigator columns aren't in the schema; they're all text
+    return {**{c: 'string' for c in columns}, **csv_dtypes(PAYMENTS_SCHEMA, columns)}
+
+
+class OpenPaymentsDownloader:
+    def __init__(self, out_dir: str, workers: int = 4, chunksize: int = 100_000,
+                 download_url: str = DOWNLOAD_URL, max_resumes: int = 5):
+        self.out_dir = out_dir
+        self.workers = workers
+        self.chunksize = chunksize
+        self.download_url = download_url
+        self.max_resumes = max_resumes
+        self._sessions = ThreadLocalSession(workers)
+
+    def _paths(self, kind: str, dataset_id: str, company_id: str) -> Dict[str, str]:
+        name = f'{dataset_id}_{company_id}'
+        return {
+            'download': os.path.join(self.out_dir, '_downloads', f'{name}.csv'),
+            'done': os.path.join(self.out_dir, '_done', kind, name),
+        }
+
+    def _stream_to_disk(self, dataset_id: str, company_id: str, path: str) -> None:
+        part_path = f'{path}.part'
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        params = {
+            'conditions[0][property]': SEARCH_COL,
+            'conditions[0][value]': company_id,
+            'conditions[0][operator]': '=',
+            'format': 'csv'
+        }
+        url = self.download_url.format(dataset_id=dataset_id)
+
+        for resume in range(self.max_resumes + 1):
+            have = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            headers = {'Range': f'bytes={have}-'} if have else {}
+            try:
+                with get_with_backoff(self._sessions.get(), url, params=params, headers=headers,
+                                      stream=True, timeout=60) as r:
+                    if have and r.status_code == 416:  # the part already has every byte
+                        break
+                    r.raise_for_status()
+                    mode = 'ab' if have and r.status_code == 206 else 'wb'  # 200 means no resume support
+                    with open(part_path, mode) as f, METRICS.timer('download.seconds'):
+                        for block in r.iter_content(chunk_size=1 << 20):
+                            f.write(block)
+                            METRICS.incr('download.bytes', len(block))
+                break
+            except _STREAM_ERRORS as e:
+                if resume == self.max_resumes:
+                    raise
+                METRICS.incr('download.resumes')
+                logger.warning(f'{dataset_id} {company_id} interrupted, resuming: {e!r}')
+
+        os.replace(part_path, path)
+
+    def _write_partitions(self, kind: str, dataset_id: str, company_id: str, csv_path: str) -> int:
+        kind_dir = os.path.join(self.out_dir, kind)
+        prefix = f'{dataset_id}-{company_id}-'
+        # a previous attempt may have died halfway through writing this download's parts
+        for stale in glob.glob(os.path.join(kind_dir, '*', f'manufacturer_id={company_id}', f'{prefix}*')):
+            os.remove(stale)
+
+        header = pandas.read_csv(csv_path, nrows=0).columns
+        usecols = [c for c in header if _is_target_column(kind)(c)]
+
+        rows = 0
+        chunks = pandas.read_csv(csv_path, usecols=usecols, dtype=_dtypes(usecols), chunksize=self.chunksize)
+        for chunk_no, chunk in enumerate(chunks):
+            chunk = coerce(chunk, _STORAGE_SCHEMA)
+            for year, part in chunk.groupby('program_year', dropna=False):
+                part_dir = os.path.join(kind_dir, f'program_year={year}', f'manufacturer_id={company_id}')
+                os.makedirs(part_dir, exist_ok=True)
+                pyarrow.parquet.write_table(
+                    # program_year comes back from the directory name on read
+                    pyarrow.Table.from_pandas(part.drop(columns='program_year'), preserve_index=False),
+                    os.path.join(part_dir, f'{prefix}{chunk_no:05d}.parquet'))
+            rows += len(chunk)
+        return rows
+
+    def download_one(self, kind: str, dataset_id: str, company_id: str) -> int:
+        paths = self._paths(kind, dataset_id, company_id)
+        if os.path.exists(paths['done']):
+            logger.info(f'{kind} {dataset_id} {company_id} already done')
+            return 0
+
+        self._stream_to_disk(dataset_id, company_id, paths['download'])
+        rows = self._write_partitions(kind, dataset_id, company_id, paths['download'])
+
+        os.makedirs(os.path.dirname(paths['done']), exist_ok=True)
+        open(paths['done'], 'w').close()
+        os.remove(paths['download'])
+        METRICS.incr('rows', rows)
+        logger.info(f'{kind} {dataset_id} {company_id}: {rows} rows')
+        return rows
+
+    def download(self, company_ids: Iterable[str], kinds: Iterable[str] = tuple(DATASETS)) -> List[str]:
+        """Download every dataset of `kinds` for every company. Returns the downloads that failed."""
+        jobs = [(kind, dataset_id, company_id)
+                for kind in kinds for dataset_id in DATASETS[kind] for company_id in company_ids]
+        failed = []
+        with ThreadPoolExecutor(max_workers=self.workers) as tpe:
+            futs_to_jobs = {tpe.submit(self.download_one, *job): job for job in jobs}
+            for fut in as_completed(futs_to_jobs):
+                try:
+                    fut.result()
+                except Exception as e:
+                    logger.error(f'failed to download {futs_to_jobs[fut]}', exc_info=e)
+                    failed.append(futs_to_jobs[fut])
+        return failed
+
+
+def _dataset_schema(kind_dir: str) -> pyarrow.Schema:
+    # without it, pyarrow takes the first file's schema and drops columns only later files have
+    files = glob.glob(os.path.join(kind_dir, '*', '*', '*.parquet'))
+    return pyarrow.unify_schemas([pyarrow.parquet.read_schema(f) for f in files] + [_PARTITIONING.schema])
+
+
+def read_payments(out_dir: str, kind: str, columns: Optional[List[str]] = None,
+                  filters: Optional[list] = None) -> pandas.DataFrame:
+    """Partition values are strings, e.g. `filters=[('manufacturer_id', '=', '100000131389')]`."""
+    kind_dir = os.path.join(out_dir, kind)
+    df = pandas.read_parquet(kind_dir, columns=columns, filters=filters,
+                             schema=_dataset_schema(kind_dir), partitioning=_PARTITIONING)
+    return coerce(df, PAYMENTS_SCHEMA)
+
+
+def flatten_principal_investigators(df_research: pandas.DataFrame) -> pandas.DataFrame:
+    """One row per (research payment, named principal investigator), renamed to the general columns."""
+    flattened = []
+    for i in range(1, _PRINCIPAL_INVESTIGATORS + 1):
+        key = f'principal_investigator_{i}'
+        own = [c for c in df_research.columns if c.startswith(key)]
+        if f'{key}_profile_id' not in own:
+            continue
+        shared = [c for c in df_research.columns if not c.startswith('principal_investigator')]
+        renamed = {}
+        for c in own:
+            col = c.replace(key, 'principal_investigator')
+            for s in ('physician', 'recipient'):
+                if (replaced := col.replace('principal_investigator', s)) in TARGET_COLUMNS:
+                    renamed[c] = replaced
+        part = df_research[shared + list(renamed)].rename(columns=renamed)
+        flattened.append(part[part['physician_profile_id'].notna()])
+    return pandas.concat(flattened, ignore_index=True)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description='Download Open Payments data into partitioned Parquet.')
+    parser.add_argument('company_ids', nargs='*', help='manufacturer/GPO ids to download')
+    parser.add_argument('--company-ids-file', help='file with one manufacturer/GPO id per line')
+    parser.add_argument('--kind', choices=tuple(DATASETS), action='append')
+    parser.add_argument('--out', default='data/open_payments')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--chunksize', type=int, default=100_000)
+    args = parser.parse_args()
+
+    company_ids = list(args.company_ids)
+    if args.company_ids_file:
+        with open(args.company_ids_file) as f:
+            company_ids += [line.strip() for line in f if line.strip()]
+    assert company_ids, 'no company ids given'
+
+    with StageRun('download_open_payments') as run:
+        failed = OpenPaymentsDownloader(args.out, args.workers, args.chunksize)\
+            .download(company_ids, args.kind or tuple(DATASETS))
+        run.metrics.incr('failures', len(failed))
+    if failed:
+        raise SystemExit(f'{len(failed)} downloads failed, rerun to resume: {failed}')
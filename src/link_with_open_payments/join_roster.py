@@ -0,0 +1,129 @@
+import logging
+from typing import Optional, Sequence, Union
+
+import numpy
+import pandas
+
+from util.schema import PAYMENTS_SCHEMA, ROSTER_SCHEMA, read_table
+
+__doc__ = """
+Join Open Payments records onto the doctor roster without a full-table merge.
+
+Name keys are normalized once and encoded against the roster's own categories, so
+payments whose names aren't on the roster are dropped with one vectorized `isin`
+before anything is joined. Joining additionally on state, or on NPI where the
+payments table has it, keeps common names from fanning out.
+"""
+
+logger = logging.getLogger(__name__)
+
+MANUFACTURER_ID_COL = 'applicable_manufacturer_or_applicable_gpo_making_payment_id'
+PROFILE_ID_COL = 'physician_profile_id'
+PAYMENT_NAME_COLS = ('physician_first_name', 'physician_last_name')
+ROSTER_NAME_COLS = ('first_name', 'last_name')
+
+
+def normalize_names(ser: pandas.Series) -> pandas.Series:
+    # non-strings (NaN, stray numbers) become missing, as the notebook's apply_func did
+    return ser.where(ser.map(type) == str).str.strip().str.upper()
+
+
+def collapse_roster(roster: pandas.DataFrame) -> pandas.DataFrame:
+    """Upper-case names and keep one row per (first, last, state), remembering the roster row in `index`."""
+    roster = roster.copy()
+    for col in ROSTER_NAME_COLS:
+        roster[col] = normalize_names(roster[col])
+    return roster\
+        .reset_index()\
+        .groupby([*ROSTER_NAME_COLS, 'state'], observed=True)\
+        .first()\
+        .reset_index()
+
+
+def _encode_keys(payments: pandas.DataFrame, roster: pandas.DataFrame) -> pandas.Series:
+    """Single int64 name key per payment, -1 where the name isn't on the roster."""
+    codes = []
+    for pay_col, roster_col in zip(PAYMENT_NAME_COLS, ROSTER_NAME_COLS):
+        categories = pandas.Index(roster[roster_col].dropna().unique())
+        codes.append((pandas.Categorical(normalize_names(payments[pay_col]), categories=categories).codes,
+                      len(categories)))
+
+    (first, _), (last, n_last) = codes
+    key = first.astype(numpy.int64) * n_last + last
+    key[(first < 0) | (last < 0)] = -1
+    return pandas.Series(key, index=payments.index)
+
+
+def join_payments_to_roster(payments: pandas.DataFrame, roster: pandas.DataFrame,
+                            manufacturer_ids: Optional[Sequence[Union[str, int]]] = None,
+                            on_state: bool = False, npi_col: Optional[str] = None,
+                            keep_unpaid: bool = False) -> pandas.DataFrame:
+    """
+    Inner join of `payments` onto a `collapse_roster`ed roster by first and last name
+    (plus `recipient_state` if `on_state`). If `npi_col` names an NPI column in
+    `payments`, rows whose NPI is on the roster join on it instead of on name; the
+    rest, including NPIs the roster never resolved, still join by name. With
+    `keep_unpaid`, roster rows no payment joined to are added with empty payment
+    columns, like the right merge `all_transactions` used to be built with.
+    """
+    if manufacturer_ids is not None:
+        wanted = {str(i) for i in manufacturer_ids}
+        payments = payments[payments[MANUFACTURER_ID_COL].astype(str).isin(wanted)]
+
+    roster = roster.assign(_roster_row=numpy.arange(len(roster)))
+    roster_keys = roster.copy()
+    roster_keys['_name_key'] = _encode_keys(
+        roster_keys.rename(columns=dict(zip(ROSTER_NAME_COLS, PAYMENT_NAME_COLS))), roster)
+
+    joined = []
+    by_name = payments
+    if npi_col is not None and 'npi' in roster:
+        roster_npi = pandas.to_numeric(roster['npi'], errors='coerce')
+        payment_npi = pandas.to_numeric(payments[npi_col], errors='coerce')
+        on_roster = payment_npi.notna() & payment_npi.isin(roster_npi.dropna())
+
+        by_npi = payments[on_roster].assign(_npi=payment_npi)
+        joined.append(by_npi.merge(roster.assign(_npi=roster_npi).dropna(subset=['_npi']), on='_npi',
+                                   suffixes=('_open_payments', None)).drop(columns='_npi'))
+        by_name = payments[~on_roster]
+
+    keys = _encode_keys(by_name, roster)
+    by_name = by_name.assign(_name_key=keys)[keys >= 0]
+
+    left_on, right_on = ['_name_key'], ['_name_key']
+    if on_state:
+        left_on.append('recipient_state')
+        right_on.append('state')
+    joined.append(by_name.merge(roster_keys, left_on=left_on, right_on=right_on,
+                                suffixes=('_open_payments', None)).drop(columns='_name_key'))
+
+    if keep_unpaid:
+        paid_rows = pandas.concat([j['_roster_row'] for j in joined])
+        joined.append(roster[~roster['_roster_row'].isin(paid_rows)])
+    return pandas.concat(joined, ignore_index=True).drop(columns='_roster_row')
+
+
+def doctors_on_take(joined: pandas.DataFrame, roster: pandas.DataFrame) -> pandas.DataFrame:
+    """Per roster source: doctors on the roster, distinct paid doctors, and the percentage."""
+    likely_prescribers = roster['src'].value_counts()
+    on_take = joined.dropna(subset=[PROFILE_ID_COL]).drop_duplicates(PROFILE_ID_COL)['src'].value_counts()
+    out = pandas.DataFrame({
+        'likely_prescribers_count': likely_prescribers,
+        'on_take': on_take.reindex(likely_prescribers.index, fill_value=0),
+    })
+    out['on_take_pct'] = out['on_take'] / out['likely_prescribers_count'] * 100
+    return out
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+
+    HORIZON_ID = 100000131389
+
+    open_payments = read_table('data/processed/open_payments', PAYMENTS_SCHEMA)
+    all_doctors = collapse_roster(read_table('data/processed/all', ROSTER_SCHEMA))
+
+    horizon = join_payments_to_roster(open_payments, all_doctors, manufacturer_ids=[HORIZON_ID])
+    for source, row in doctors_on_take(horizon, all_doctors).iterrows():
+        logger.info(f"For data from {source}, % of doctors on take is {round(row['on_take_pct'], 5)}% "
+                    f"out of {row['likely_prescribers_count']}")
@@ -0,0 +1,206 @@
+import argparse
+import ast
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Dict, Iterable, List, Optional, Sequence, Set
+
+from pipeline.stages import STAGES, Stage
+from util.instrumentation import PROFILE_ENV, PROFILERS
+
+__doc__ = """
+Run the project's stages in dependency order, skipping any whose script, the
+modules under src/ it imports (directly or through each other) and input files
+hash the same as at their last successful run (and whose outputs still exist).
+Stages that don't depend on each other, like the four scrapers, run at the same
+time as separate processes. Script stages write their run reports to
+`data/cache/reports/<stage>.json`; `--profile` turns on their profiling hook.
+"""
+
+logger = logging.getLogger(__name__)
+
+STATE_PATH = 'data/cache/pipeline_state.json'
+SRC_DIR = 'src'
+
+
+def file_digest(path: str) -> Optional[str]:
+    if not os.path.exists(path):
+        return None
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _imported_modules(path: str) -> Set[str]:
+    """Every module an import statement in a .py or a notebook's code cells could name."""
+    with open(path) as f:
+        text = f.read()
+    if path.endswith('.ipynb'):
+        sources = [''.join(c['source']) for c in json.loads(text)['cells'] if c['cell_type'] == 'code']
+    else:
+        sources = [text]
+
+    modules = set()
+    for source in sources:
+        try:
+            tree = ast.parse(source)
+        except SyntaxError:  # cells with magics
+            continue
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                modules.update(alias.name for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                # `from util import http` imports a module too
+                modules.add(node.module)
+                modules.update(f'{node.module}.{alias.name}' for alias in node.names)
+    return modules
+
+
+def local_imports(script: str, src_dir: str = SRC_DIR) -> List[str]:
+    """The .py files under `src_dir` that `script` imports, directly or through each other."""
+    seen: Set[str] = set()
+    todo = [script]
+    while todo:
+        path = todo.pop()
+        if not os.path.exists(path):
+            continue
+        for module in _imported_modules(path):
+            module_path = os.path.join(src_dir, *module.split('.')) + '.py'
+            if module_path not in seen and os.path.exists(module_path):
+                seen.add(module_path)
+                todo.append(module_path)
+    return sorted(seen - {script})
+
+
+def fingerprint(stage: Stage) -> str:
+    h = hashlib.sha256()
+    for path in (stage.script, *stage.inputs, *local_imports(stage.script)):
+        h.update(f'{path}:{file_digest(path)}\n'.encode())
+    return h.hexdigest()
+
+
+def upstream(stages: Sequence[Stage]) -> Dict[str, Set[str]]:
+    """Names of the stages producing each stage's inputs."""
+    producers = {out: s.name for s in stages for out in s.outputs}
+    return {s.name: {producers[i] for i in s.inputs if i in producers and producers[i] != s.name}
+            for s in stages}
+
+
+def _command(stage: Stage) -> List[str]:
+    if stage.script.endswith('.ipynb'):
+        # notebooks use paths relative to their own directory
+        return ['jupyter', 'nbconvert', '--to', 'notebook', '--execute', '--inplace',
+                os.path.basename(stage.script)]
+    return [sys.executable, stage.script]
+
+
+class PipelineRunner:
+    def __init__(self, stages: Sequence[Stage] = STAGES, state_path: str = STATE_PATH, jobs: int = 4,
+                 profile: Sequence[str] = ()):
+        self.stages = {s.name: s for s in stages}
+        self.deps = upstream(stages)
+        self.state_path = state_path
+        self.jobs = jobs
+        self.profile = profile
+        self.state: Dict[str, str] = {}
+        if os.path.exists(state_path):
+            with open(state_path) as f:
+                self.state = json.load(f)
+
+    def _save_state(self) -> None:
+        os.makedirs(os.path.dirname(self.state_path) or '.', exist_ok=True)
+        tmp_path = f'{self.state_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.state_path)
+
+    def with_upstream(self, names: Iterable[str]) -> Set[str]:
+        selected, todo = set(), list(names)
+        while todo:
+            name = todo.pop()
+            if name not in selected:
+                selected.add(name)
+                todo += self.deps[name]
+        return selected
+
+    def is_fresh(self, stage: Stage) -> bool:
+        return self.state.get(stage.name) == fingerprint(stage) and all(map(os.path.exists, stage.outputs))
+
+    def _run_stage(self, stage: Stage) -> None:
+        logger.info(f'running {stage.name}: {" ".join(_command(stage))}')
+        cwd = os.path.dirname(stage.script) if stage.script.endswith('.ipynb') else None
+        env = {**os.environ, 'PYTHONPATH': os.pathsep.join(
+            filter(None, [os.path.abspath('src'), os.environ.get('PYTHONPATH')]))}
+        if self.profile:
+            env[PROFILE_ENV] = ','.join(self.profile)
+        start = time.perf_counter()
+        subprocess.run(_command(stage), cwd=cwd, env=env, check=True)
+        logger.info(f'{stage.name} finished in {time.perf_counter() - start:.1f}s')
+
+    def run(self, targets: Optional[Iterable[str]] = None, force: Iterable[str] = (),
+            dry_run: bool = False) -> Dict[str, str]:
+        """Returns each selected stage's outcome: ran, skipped, failed or blocked."""
+        selected = self.with_upstream(targets or self.stages)
+        force = set(force)
+        outcome: Dict[str, str] = {}
+        running: Dict[Future, str] = {}
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as tpe:
+            while len(outcome) < len(selected):
+                for name in sorted(selected - set(outcome) - set(running.values())):
+                    deps = self.deps[name] & selected
+                    if any(outcome.get(d) in ('failed', 'blocked') for d in deps):
+                        outcome[name] = 'blocked'
+                    elif all(d in outcome for d in deps):
+                        stage = self.stages[name]
+                        # in a dry run nothing upstream actually changes, so its would-runs carry down
+                        upstream_runs = any(outcome[d] == 'would run' for d in deps)
+                        if name not in force and not upstream_runs and self.is_fresh(stage):
+                            outcome[name] = 'skipped'
+                        elif dry_run:
+                            outcome[name] = 'would run'
+                        else:
+                            running[tpe.submit(self._run_stage, stage)] = name
+                if not running:
+                    continue
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    name = running.pop(fut)
+                    try:
+                        fut.result()
+                    except Exception as e:
+                        logger.error(f'{name} failed', exc_info=e)
+                        outcome[name] = 'failed'
+                        continue
+                    outcome[name] = 'ran'
+                    self.state[name] = fingerprint(self.stages[name])
+                    self._save_state()
+
+        for name, result in outcome.items():
+            logger.info(f'{name}: {result}')
+        return outcome
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description='Rebuild whatever is out of date.')
+    parser.add_argument('targets', nargs='*', help='stages to bring up to date (with their upstream); default all')
+    parser.add_argument('--force', nargs='*', default=[], help='stages to rerun even if fresh')
+    parser.add_argument('--jobs', type=int, default=4)
+    parser.add_argument('--dry-run', action='store_true')
+    parser.add_argument('--profile', choices=PROFILERS, action='append', default=[],
+                        help='profile script stages (see util/instrumentation.py)')
+    args = parser.parse_args()
+
+    outcome = PipelineRunner(jobs=args.jobs, profile=args.profile).run(args.targets, args.force, args.dry_run)
+    if any(v in ('failed', 'blocked') for v in outcome.values()):
+        raise SystemExit(1)
@@ -0,0 +1,59 @@
+from typing import NamedTuple, Tuple
+
+__doc__ = """
+What each stage of the project runs, reads and writes. Paths are relative to the repo root.
+The modules a script imports from src/ needn't be listed: the runner hashes them itself.
+"""
+
+
+class Stage(NamedTuple):
+    name: str
+    script: str  # a .py run with the repo root as cwd, or a .ipynb executed in its own directory
+    inputs: Tuple[str, ...] = ()
+    outputs: Tuple[str, ...] = ()
+
+
+STAGES: Tuple[Stage, ...] = (
+    # scrapers: no file inputs, so they only rerun when their code changes or they're forced
+    Stage('asoprs', 'src/basic_data/asoprs.py',
+          outputs=('data/raw/_basic_asoprs_raw.csv', 'data/raw/_asoprs_raw.csv')),
+    Stage('endocrinologists', 'src/basic_data/endocrinologists.py',
+          outputs=('data/raw/_endocrinologists_raw.csv',)),
+    Stage('iteds', 'src/basic_data/iteds.py',
+          outputs=('data/raw/_basic_iteds_raw.csv', 'data/_iteds_raw.csv')),
+    Stage('tepezza', 'src/basic_data/tepezza_.py',
+          outputs=('data/raw/_tepezza_raw.csv',)),
+
+    Stage('clean', 'src/clean_basic_data/clean_all.py',
+          inputs=('data/raw/_asoprs_raw.csv', 'data/raw/_endocrinologists_raw.csv',
+                  'data/raw/_tepezza_raw.csv', 'data/raw/_tepezza_raw_old.csv',
+                  'data/util/specialty_codes.csv'),
+          outputs=('data/processed/asoprs.csv', 'data/processed/endocrinologists.csv',
+                   'data/processed/tepezza.csv', 'data/processed/all_with_duplicates.csv',
+                   'data/processed/all.csv')),
+    Stage('npi', 'src/get_npi/query_npi_database.py',
+          inputs=('data/processed/all.csv',),
+          outputs=('data/processed/all_with_npi3.csv',)),
+    Stage('open_payments', 'src/link_with_open_payments/get_open_payments_data.ipynb',
+          inputs=('src/link_with_open_payments/compareToCompanies.csv', 'data/util/specialty_codes.csv'),
+          outputs=('data/processed/open_payments.parquet', 'data/processed/open_payments.csv')),
+    Stage('merge', 'src/link_with_open_payments/merge.ipynb',
+          inputs=('data/processed/open_payments.parquet', 'data/processed/all.csv'),
+          outputs=('data/processed/all_transactions.parquet', 'data/processed/all_transactions.csv')),
+
+    Stage('dot_maps', 'src/vizualize/dot_maps.ipynb',
+          inputs=('data/processed/all_with_duplicates.csv',),
+          outputs=('src/vizualize/images/source_map.png',)),
+    Stage('kaplan_meier', 'src/vizualize/kaplan_meier.ipynb',
+          inputs=('data/processed/all_transactions.csv',),
+          outputs=('src/vizualize/images/doctor_count_curve.png', 'src/vizualize/images/payment_count_curve.png',
+                   'src/vizualize/images/dollars_curve.png')),
+    Stage('payment_cube', 'src/vizualize/payment_cube.py',
+          inputs=('data/processed/all_transactions.csv', 'data/processed/all_with_duplicates.csv'),
+          outputs=('data/processed/payment_cube.parquet',)),
+    Stage('state_level_comparison', 'src/vizualize/state_level_comparison.ipynb',
+          inputs=('data/processed/payment_cube.parquet',),
+          outputs=('src/vizualize/images/corrupt_doctors_by_state.png', 'src/vizualize/images/dollars_by_state.png',
+                   'src/vizualize/images/doctors_by_state.png',
+                   'src/vizualize/images/not_corrupt_doctors_by_state.png')),
+)
@@ -0,0 +1,6 @@
+__doc__ = """XPath helpers for the lxml scrapers."""
+
+
+def has_class(name: str) -> str:
+    """XPath predicate body matching elements with `name` among their classes, like `.name` in CSS."""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
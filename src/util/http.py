@@ -0,0 +1,127 @@
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from util.instrumentation import METRICS
+
+__doc__ = """Shared HTTP plumbing for the scrapers: pooled sessions, a request-rate budget and retries."""
+
+
+class RateLimiter:
+    """Token bucket shared between threads. `requests_per_second=None` disables limiting."""
+
+    def __init__(self, requests_per_second: Optional[float] = None, burst: int = 1):
+        self.requests_per_second = requests_per_second
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if not self.requests_per_second:
+            return
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._last) * self.requests_per_second)
+                self._last = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.requests_per_second
+            time.sleep(wait)
+
+
+def make_session(pool_size: int = 10) -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class ThreadLocalSession:
+    """One pooled `requests.Session` per thread, since sessions aren't guaranteed thread safe."""
+
+    def __init__(self, pool_size: int = 10):
+        self.pool_size = pool_size
+        self._local = threading.local()
+
+    def get(self) -> requests.Session:
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = make_session(self.pool_size)
+        return session
+
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class FetchError(Exception):
+    def __init__(self, url: str, attempts: int, status: Optional[int] = None, reason: str = ''):
+        super().__init__(f'{url}: gave up after {attempts} attempts ({status or reason})')
+        self.url = url
+        self.attempts = attempts
+        self.status = status
+        self.reason = reason
+
+
+def _retry_after(resp: requests.Response) -> Optional[float]:
+    value = resp.headers.get('Retry-After')
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def get_with_backoff(session: requests.Session, url: str, rate_limiter: Optional[RateLimiter] = None,
+                     max_retries: int = 5, backoff: float = 1.0, max_backoff: float = 60,
+                     timeout: float = 30, **kwargs) -> requests.Response:
+    """
+    GET with capped exponential backoff and full jitter on connection errors and
+    `RETRY_STATUSES`, honoring `Retry-After`. Raises `FetchError` once retries run out.
+    Every attempt is recorded in `METRICS`.
+    """
+    status, reason, retry_after = None, '', None
+    for attempt in range(max_retries + 1):
+        if attempt:
+            delay = random.uniform(0, min(max_backoff, backoff * 2 ** (attempt - 1)))
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+            time.sleep(delay)
+
+        if rate_limiter is not None:
+            with METRICS.timer('http.rate_limit_wait'):
+                rate_limiter.acquire()
+
+        retry_after = None
+        start = time.perf_counter()
+        try:
+            resp = session.get(url, timeout=timeout, **kwargs)
+        except requests.RequestException as e:
+            METRICS.record_http(None, time.perf_counter() - start, retry=attempt > 0)
+            status, reason = None, repr(e)
+            continue
+        METRICS.record_http(resp.status_code, time.perf_counter() - start, retry=attempt > 0)
+
+        if resp.status_code not in RETRY_STATUSES:
+            return resp
+        status, retry_after = resp.status_code, _retry_after(resp)
+
+    METRICS.incr('http.failures')
+    raise FetchError(url, max_retries + 1, status, reason)
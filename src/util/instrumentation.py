@@ -0,0 +1,254 @@
+import bisect
+import cProfile
+import json
+import logging
+import math
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+try:
+    import resource
+except ImportError:  # windows
+    resource = None
+
+__doc__ = """
+Counters, timers and a per-stage JSON run report, shared by every script.
+
+`METRICS` is process-wide: `get_with_backoff` records each HTTP attempt in it
+(status, latency, retries, 429s), and caches record their hits and misses. A
+script's `__main__` wraps its work in `StageRun(name)`, which times it, logs
+throttled progress with a rows/sec rate, and on exit writes
+`<report_dir>/<name>.json` with every counter and histogram, the memory high-water
+mark and how the stage ended.
+
+Profiling is opt in with `HT_PROFILE=cprofile`, `tracemalloc` or both
+(comma-separated). cProfile stats go to `<report_dir>/<name>.prof` with the top
+functions in the report (it only sees the main thread, so worker pools show up as
+waits); tracemalloc adds the peak and the top allocation sites.
+"""
+
+logger = logging.getLogger(__name__)
+
+REPORT_DIR = 'data/cache/reports'
+PROFILE_ENV = 'HT_PROFILE'
+PROFILERS = ('cprofile', 'tracemalloc')
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, math.inf)  # seconds, upper bounds
+QUANTILES = (0.5, 0.9, 0.99)  # reported per histogram, to bucket resolution
+_TOP = 15
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def observe(self, value: float) -> None:
+        self.counts[min(bisect.bisect_left(self.buckets, value), len(self.buckets) - 1)] += 1
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the `q` quantile, capped at the largest value seen."""
+        if not self.count:
+            return None
+        rank = max(math.ceil(q * self.count), 1)
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else None,
+            'min': self.min if self.count else None,
+            'max': self.max if self.count else None,
+            **{f'p{q * 100:g}': self.quantile(q) for q in QUANTILES},
+            'buckets': {('+inf' if math.isinf(b) else f'<={b:g}'): c for b, c in zip(self.buckets, self.counts)},
+        }
+
+
+class Metrics:
+    """Thread-safe named counters and histograms."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Counter = Counter()
+        self.histograms: Dict[str, Histogram] = {}
+
+    def incr(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += n
+
+    def observe(self, name: str, value: float, buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        with self._lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram(buckets)
+            self.histograms[name].observe(value)
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def record_http(self, status: Optional[int], seconds: float, retry: bool = False) -> None:
+        """One HTTP attempt; `status` is None when no response came back."""
+        self.incr('http.requests')
+        self.incr(f"http.status.{status or 'error'}")
+        if status == 429:
+            self.incr('http.429')
+        if retry:
+            self.incr('http.retries')
+        self.observe('http.latency', seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'counters': dict(sorted(self.counters.items())),
+                'histograms': {k: h.to_dict() for k, h in sorted(self.histograms.items())},
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+
+METRICS = Metrics()
+
+
+def peak_rss_mb() -> Optional[float]:
+    """This process's resident memory high-water mark."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10  # bytes on macOS, KiB elsewhere
+
+
+def _profilers_from_env() -> List[str]:
+    requested = [p.strip().lower() for p in os.environ.get(PROFILE_ENV, '').split(',') if p.strip()]
+    unknown = set(requested) - set(PROFILERS)
+    assert not unknown, f'invalid {PROFILE_ENV} {sorted(unknown)}: must be in {PROFILERS}'
+    return requested
+
+
+def _top_functions(profiler: cProfile.Profile) -> List[Dict[str, Any]]:
+    stats = pstats.Stats(profiler).stats  # {(file, line, function): (calls, ncalls, tottime, cumtime, callers)}
+    top = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:_TOP]
+    return [{'function': f'{file}:{line}({func})',
+             'calls': ncalls, 'tottime': tottime, 'cumtime': cumtime}
+            for (file, line, func), (_, ncalls, tottime, cumtime, _) in top]
+
+
+class StageRun:
+    """
+    Context manager around one stage's work. Report throughput with `rows` (and,
+    optionally, `progress`); everything in `metrics` ends up in the report.
+    """
+
+    def __init__(self, name: str, report_dir: str = REPORT_DIR, metrics: Metrics = METRICS,
+                 profile: Optional[Iterable[str]] = None, progress_interval: float = 10):
+        self.name = name
+        self.report_dir = report_dir
+        self.metrics = metrics
+        self.profile = list(profile) if profile is not None else _profilers_from_env()
+        self.progress_interval = progress_interval
+        self.report: Optional[Dict[str, Any]] = None
+        self._profiler: Optional[cProfile.Profile] = None
+        self._last_progress = -math.inf
+
+    def rows(self, n: int = 1) -> None:
+        self.metrics.incr('rows', n)
+
+    def progress(self, done: int, total: Optional[int] = None, force: bool = False) -> None:
+        """Log `done/total` and the rows/sec so far, at most every `progress_interval` seconds."""
+        now = time.perf_counter()
+        if not force and now - self._last_progress < self.progress_interval:
+            return
+        self._last_progress = now
+        rate = done / max(now - self._start, 1e-9)
+        of_total = f'/{total} ({done / total:.0%})' if total else ''
+        logger.info(f'{self.name}: {done}{of_total} rows, {rate:,.1f} rows/s')
+
+    def __enter__(self) -> 'StageRun':
+        self.metrics.reset()
+        self._started = datetime.now(timezone.utc)
+        if 'tracemalloc' in self.profile:
+            tracemalloc.start()
+        if 'cprofile' in self.profile:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        seconds = time.perf_counter() - self._start
+        if self._profiler is not None:
+            self._profiler.disable()
+
+        snapshot = self.metrics.snapshot()
+        rows = snapshot['counters'].get('rows', 0)
+        if exc_type is None:
+            status = 'ok'
+        else:
+            status = 'interrupted' if issubclass(exc_type, KeyboardInterrupt) else 'failed'
+
+        self.report = {
+            'stage': self.name,
+            'status': status,
+            'error': None if exc is None else repr(exc),
+            'started': self._started.isoformat(timespec='seconds'),
+            'seconds': seconds,
+            'rows': rows,
+            'rows_per_second': rows / seconds if seconds else None,
+            'peak_rss_mb': peak_rss_mb(),
+            **snapshot,
+        }
+        os.makedirs(self.report_dir, exist_ok=True)
+
+        if self._profiler is not None:
+            profile_path = os.path.join(self.report_dir, f'{self.name}.prof')
+            self._profiler.dump_stats(profile_path)
+            self.report['cprofile'] = {'path': profile_path, 'top': _top_functions(self._profiler)}
+        if tracemalloc.is_tracing() and 'tracemalloc' in self.profile:
+            _, peak = tracemalloc.get_traced_memory()
+            top = tracemalloc.take_snapshot().statistics('lineno')[:_TOP]
+            tracemalloc.stop()
+            self.report['tracemalloc'] = {
+                'peak_mb': peak / 2 ** 20,
+                'top': [{'where': str(s.traceback), 'mb': s.size / 2 ** 20, 'blocks': s.count} for s in top],
+            }
+
+        path = os.path.join(self.report_dir, f'{self.name}.json')
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(self.report, f, indent=2, default=str)
+        os.replace(f'{path}.tmp', path)
+
+        http = snapshot['histograms'].get('http.latency')
+        logger.info(
+            f"{self.name} {status} in {seconds:.1f}s: {rows} rows"
+            + (f" ({rows / seconds:,.1f}/s)" if rows and seconds else '')
+            + (f", {http['count']} http requests (mean {http['mean']:.2f}s, "
+               f"{snapshot['counters'].get('http.retries', 0)} retries, "
+               f"{snapshot['counters'].get('http.429', 0)} 429s)" if http else '')
+            + (f", peak rss {self.report['peak_rss_mb']:.0f} MB" if self.report['peak_rss_mb'] else '')
+            + f"; report in {path}")
@@ -0,0 +1,61 @@
+import json
+import logging
+import os
+from typing import Any, Dict, Iterator
+
+__doc__ = """Append-only JSON-lines files that survive being killed mid-write."""
+
+logger = logging.getLogger(__name__)
+
+
+def read_jsonl(path: str) -> Iterator[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return
+    with open(path) as f:
+        for line_no, line in enumerate(f, 1):
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # a kill mid-write tears the last line; `JsonlSink` cuts it off before appending again
+                logger.warning(f'skipping unreadable line {line_no} in {path}')
+
+
+def truncate_torn_line(path: str, block_size: int = 1 << 16) -> None:
+    """Cut `path` back to its last newline, so the next append starts a line of its own."""
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb+') as f:
+        end = f.seek(0, os.SEEK_END)
+        pos = end
+        while pos > 0:
+            start = max(pos - block_size, 0)
+            f.seek(start)
+            newline = f.read(pos - start).rfind(b'\n')
+            if newline != -1:
+                pos = start + newline + 1
+                break
+            pos = start
+        if pos != end:
+            logger.warning(f'dropping {end - pos} bytes of a torn last line in {path}')
+            f.truncate(pos)
+
+
+class JsonlSink:
+    """Appends one record per line, flushed and fsynced before `append` returns."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def __enter__(self) -> 'JsonlSink':
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        truncate_torn_line(self.path)
+        self._f = open(self.path, 'a')
+        return self
+
+    def append(self, record: Dict[str, Any]) -> None:
+        self._f.write(json.dumps(record) + '\n')
+        self._f.flush()
+        os.fsync(self._f.fileno())
+
+    def __exit__(self, *args) -> None:
+        self._f.close()
@@ -0,0 +1,136 @@
+import os
+from typing import Dict, Iterable, Optional
+
+import pandas
+
+__doc__ = """
+Explicit dtypes for the tables passed between stages, and Parquet-first IO for them.
+
+`write_table` writes `<stem>.parquet` (and a CSV export unless told otherwise) and
+`read_table` prefers the Parquet file, falling back to a legacy CSV. Either way the
+frame comes back coerced to its schema, so e.g. ZIPs are always 5-character strings
+and `npi` is always a nullable integer (-1 still meaning "not attempted").
+"""
+
+ROSTER_SCHEMA: Dict[str, str] = {
+    'first_name': 'string',
+    'last_name': 'string',
+    'city': 'string',
+    'postal_code': 'string',
+    'state': 'category',
+    'specialty_code': 'category',
+    'src': 'category',
+    'npi': 'Int64',
+    'specialty': 'string',
+}
+
+PAYMENTS_SCHEMA: Dict[str, str] = {
+    'physician_profile_id': 'string',
+    'physician_first_name': 'string',
+    'physician_middle_name': 'string',
+    'physician_last_name': 'string',
+    'physician_name_suffix': 'string',
+    'physician_specialty': 'category',
+    'recipient_primary_business_street_address_line1': 'string',
+    'recipient_primary_business_street_address_line2': 'string',
+    'recipient_city': 'string',
+    'recipient_state': 'category',
+    'recipient_zip_code': 'string',
+    'recipient_country': 'category',
+    'recipient_postal_code': 'string',
+    'physician_primary_type': 'category',
+    'total_amount_of_payment_usdollars': 'float64',
+    'date_of_payment': 'string',
+    'number_of_payments_included_in_total_amount': 'Int64',
+    'form_of_payment_or_transfer_of_value': 'category',
+    'nature_of_payment_or_transfer_of_value': 'category',
+    'record_id': 'string',
+    'program_year': 'Int64',
+    'payment_publication_date': 'string',
+    'applicable_manufacturer_or_applicable_gpo_making_payment_name': 'category',
+    'applicable_manufacturer_or_applicable_gpo_making_payment_id': 'string',
+    'specialty_code': 'category',
+    'is_research': 'boolean',
+}
+
+# payments joined onto the collapsed roster (`join_payments_to_roster(..., keep_unpaid=True)`)
+TRANSACTIONS_SCHEMA: Dict[str, str] = {
+    **PAYMENTS_SCHEMA,
+    'specialty_code_open_payments': 'category',  # the payment's; `specialty_code` is the roster's
+    **ROSTER_SCHEMA,
+    'index': 'Int64',  # roster row
+}
+
+PAYMENT_CUBE_SCHEMA: Dict[str, str] = {
+    'state_fips': 'uint8',  # 0: unknown
+    'county_fips': 'int32',  # 5-digit county GEOID as a number, 0: unknown
+    'src': 'category',
+    'manufacturer_id': 'category',
+    'year': 'int16',  # 0: all years, -1: unknown
+    'doctors': 'Int32',  # only on the all-manufacturers, all-years rows
+    'paid_doctors': 'int32',
+    'payments': 'int32',
+    'dollars': 'float64',
+}
+
+_ZIP_COLUMNS = ('postal_code',)
+
+
+def csv_dtypes(schema: Dict[str, str], columns: Optional[Iterable[str]] = None) -> Dict[str, str]:
+    """
+    Dtypes to hand `read_csv`: text columns as strings (keeping leading zeros), numbers
+    left to the parser and fixed up by `coerce`. Categories are read as strings too,
+    since separately read chunks would disagree on them.
+    """
+    columns = schema if columns is None else [c for c in columns if c in schema]
+    return {c: 'string' for c in columns if schema[c] in ('string', 'category')}
+
+
+def normalize_zip5(ser: pandas.Series) -> pandas.Series:
+    # floats from type inference ("60612.0"), ZIP+4 and NPPES's bare 9 digits all become "60612"
+    # .str.split gives back object, so the result is cast to string again
+    return ser.astype('string').str.replace(r'\.0$', '', regex=True)\
+        .str.split('-').str[0].str.zfill(5).str[:5].astype('string')
+
+
+def coerce(df: pandas.DataFrame, schema: Dict[str, str]) -> pandas.DataFrame:
+    df = df.copy()
+    for col, dtype in schema.items():
+        if col not in df:
+            continue
+        if col in _ZIP_COLUMNS:
+            df[col] = normalize_zip5(df[col])
+        elif dtype == 'Int64':
+            df[col] = pandas.to_numeric(df[col], errors='coerce').round().astype('Int64')
+        else:
+            df[col] = df[col].astype(dtype)
+    return df
+
+
+def write_table(df: pandas.DataFrame, stem: str, schema: Dict[str, str], csv: bool = True) -> None:
+    """Atomically write `<stem>.parquet`, and `<stem>.csv` too if `csv`."""
+    df = coerce(df, schema)
+    os.makedirs(os.path.dirname(stem) or '.', exist_ok=True)
+
+    tmp_path = f'{stem}.parquet.tmp'
+    df.to_parquet(tmp_path)
+    os.replace(tmp_path, f'{stem}.parquet')
+
+    if csv:
+        tmp_path = f'{stem}.csv.tmp'
+        df.to_csv(tmp_path)
+        os.replace(tmp_path, f'{stem}.csv')
+
+
+def read_table(stem: str, schema: Dict[str, str], columns: Optional[Iterable[str]] = None) -> pandas.DataFrame:
+    if os.path.exists(f'{stem}.parquet'):
+        return coerce(pandas.read_parquet(f'{stem}.parquet', columns=columns), schema)
+
+    df = pandas.read_csv(f'{stem}.csv', index_col=0, comment='#', dtype=csv_dtypes(schema, _csv_header(stem)))
+    if columns is not None:
+        df = df[list(columns)]
+    return coerce(df, schema)
+
+
+def _csv_header(stem: str) -> Iterable[str]:
+    return pandas.read_csv(f'{stem}.csv', nrows=0, comment='#').columns
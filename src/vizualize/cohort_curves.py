@@ -0,0 +1,74 @@
+from typing import Dict, Iterable, Optional
+
+import pandas
+
+__doc__ = """
+Per-manufacturer cohort curves over the joined payments table: when each roster
+doctor was first paid, how many had been reached by each date, and cumulative
+payment counts and dollars. Everything is a handful of vectorized passes, so it
+scales to the national multi-year table.
+"""
+
+ID_COL = 'applicable_manufacturer_or_applicable_gpo_making_payment_id'
+NAME_COL = 'applicable_manufacturer_or_applicable_gpo_making_payment_name'
+PROFILE_COL = 'physician_profile_id'
+DATE_FORMAT = '%m/%d/%Y'
+
+
+def prepare_payments(df: pandas.DataFrame, start_date: pandas.Timestamp,
+                     exclude_src: Iterable[str] = ()) -> pandas.DataFrame:
+    """Roster subset (dropping `exclude_src`), with a parsed `payment_ts` after `start_date`."""
+    exclude_src = list(exclude_src)
+    if exclude_src:
+        df = df[~df['src'].isin(exclude_src)]
+    df = df.assign(payment_ts=pandas.to_datetime(df['date_of_payment'], format=DATE_FORMAT, errors='coerce'))
+    return df[df['payment_ts'] > start_date]
+
+
+def manufacturer_names(df: pandas.DataFrame) -> Dict[str, str]:
+    firsts = df.dropna(subset=[ID_COL]).drop_duplicates(ID_COL)
+    return dict(zip(firsts[ID_COL], firsts[NAME_COL]))
+
+
+def _with_start_rows(grouped: pandas.DataFrame, start_date: pandas.Timestamp) -> pandas.DataFrame:
+    """Add an all-zero row at `start_date` for every manufacturer, so every curve starts at 0."""
+    ids = grouped.index.get_level_values(0).unique()
+    zeros = pandas.DataFrame(
+        0, columns=grouped.columns,
+        index=pandas.MultiIndex.from_arrays([ids, [start_date] * len(ids)], names=grouped.index.names))
+    return pandas.concat([grouped, zeros]).sort_index()
+
+
+def first_contact_counts(df: pandas.DataFrame, start_date: pandas.Timestamp) -> pandas.DataFrame:
+    """
+    Indexed by (manufacturer, date): `physician_count` doctors paid for the first time
+    by that manufacturer that day, and `physician_count_cumulative` up to that day.
+    """
+    firsts = df.dropna(subset=[PROFILE_COL])\
+        .sort_values('payment_ts', kind='stable')\
+        .drop_duplicates([ID_COL, PROFILE_COL])  # each doctor's first payment from each manufacturer
+
+    counts = firsts.groupby([ID_COL, 'payment_ts'], observed=True).size().to_frame('physician_count')
+    counts = _with_start_rows(counts, start_date)
+    counts['physician_count_cumulative'] = counts.groupby(level=0, observed=True)['physician_count'].cumsum()
+    return counts
+
+
+def survival_curves(counts: pandas.DataFrame, initial_doctors: int) -> pandas.Series:
+    """Doctors not yet paid by each manufacturer, by date."""
+    return initial_doctors - counts['physician_count_cumulative']
+
+
+def payment_curves(df: pandas.DataFrame, start_date: pandas.Timestamp,
+                   amount_col: str = 'total_amount_of_payment_usdollars') -> pandas.DataFrame:
+    """Indexed by (manufacturer, date): cumulative `payment_count` and `payment_amount`."""
+    grouped = df.dropna(subset=[PROFILE_COL])\
+        .groupby([ID_COL, 'payment_ts'], observed=True)[amount_col]\
+        .agg(payment_count='size', payment_amount='sum')
+    grouped = _with_start_rows(grouped, start_date)
+    return grouped.groupby(level=0, observed=True).cumsum()
+
+
+def initial_doctor_count(df: pandas.DataFrame, profile_col: Optional[str] = PROFILE_COL) -> int:
+    """Distinct paid doctors, plus one per row without a profile id (as the notebook counted)."""
+    return df[profile_col].nunique() + int(df[profile_col].isna().sum())
@@ -0,0 +1,63 @@
+from typing import Optional
+
+import geopandas as gpd
+import numpy as np
+import pandas
+
+from vizualize.reference_data import ReferenceData
+
+__doc__ = """
+Vectorized ZIP -> point -> county assignment for the roster.
+
+ZCTA centroids are computed once into a table sorted by ZIP, so the nearest ZCTA for
+every roster ZIP comes from a single `searchsorted`. Counties are then assigned with
+one spatial join. Both tables come from `ReferenceData`, so the TIGER shapefiles
+are only downloaded the first time.
+"""
+
+MAX_ZIP_DISTANCE = 10  # give up rather than snap a ZIP to a ZCTA further away than this
+
+
+def load_zcta_centroids(ref: Optional[ReferenceData] = None) -> gpd.GeoDataFrame:
+    """ZCTA centroids as points, indexed by ZIP (int) in ascending order."""
+    return (ref or ReferenceData()).zcta_centroids()
+
+
+def load_counties(ref: Optional[ReferenceData] = None) -> gpd.GeoDataFrame:
+    """Lower-48 counties in EPSG:2163."""
+    return (ref or ReferenceData()).counties()
+
+
+def nearest_zips(postal_codes: pandas.Series, zips: np.ndarray,
+                 max_distance: int = MAX_ZIP_DISTANCE) -> pandas.Series:
+    """For each postal code, the numerically closest of the sorted `zips` (NA if none is close enough)."""
+    codes = pandas.to_numeric(postal_codes, errors='coerce').to_numpy(dtype=float)
+    valid = ~np.isnan(codes)
+
+    pos = np.searchsorted(zips, codes[valid])
+    left = zips[np.clip(pos - 1, 0, len(zips) - 1)]
+    right = zips[np.clip(pos, 0, len(zips) - 1)]
+    closest = np.where(np.abs(codes[valid] - left) <= np.abs(right - codes[valid]), left, right)
+
+    out = pandas.Series(pandas.NA, index=postal_codes.index, dtype='Int64')
+    out[valid] = np.where(np.abs(closest - codes[valid]) <= max_distance, closest, -1)
+    return out.mask(out == -1)
+
+
+def zip_points(postal_codes: pandas.Series, centroids: Optional[gpd.GeoDataFrame] = None) -> gpd.GeoSeries:
+    """Point for each postal code (empty where unmatched), in the centroids' crs."""
+    centroids = load_zcta_centroids() if centroids is None else centroids
+    zips = nearest_zips(postal_codes, centroids.index.to_numpy())
+
+    geometry = centroids.geometry.reindex(zips.fillna(-1).astype(int).to_numpy())
+    return gpd.GeoSeries(geometry.to_numpy(), index=postal_codes.index, crs=centroids.crs)
+
+
+def assign_counties(points: gpd.GeoSeries, counties: Optional[gpd.GeoDataFrame] = None) -> pandas.Series:
+    """County GEOID containing each point, from one bulk spatial join."""
+    counties = load_counties() if counties is None else counties
+    counties = counties.to_crs(points.crs)[['GEOID', 'geometry']]
+
+    joined = gpd.sjoin(gpd.GeoDataFrame(geometry=points), counties, how='left', predicate='intersects')
+    joined = joined[~joined.index.duplicated()]  # a point on a shared border lands in both
+    return joined['GEOID'].reindex(points.index)
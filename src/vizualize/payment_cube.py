@@ -0,0 +1,212 @@
+import argparse
+import itertools
+import logging
+from typing import Iterable, Optional
+
+import geopandas as gpd
+import numpy as np
+import pandas
+import us
+
+from util.instrumentation import StageRun
+from util.schema import PAYMENT_CUBE_SCHEMA, ROSTER_SCHEMA, read_table, write_table
+from vizualize.cohort_curves import DATE_FORMAT, ID_COL, PROFILE_COL
+from vizualize.geocode import assign_counties, zip_points
+from vizualize.reference_data import ReferenceData
+
+__doc__ = """
+A small pre-aggregated cube of the joined payments, so the state and county maps are
+slices of it rather than rescans of the transactions.
+
+Cells are state FIPS x county x roster source x manufacturer x program year, holding
+roster doctors, distinct paid doctors, payments and dollars. Distinct doctor counts
+don't add up across manufacturers or years, so those two dimensions also have an
+`ALL_MANUFACTURERS` / `ALL_YEARS` level computed up front. Payments with neither a program
+year nor a parseable date are filed under `UNKNOWN_YEAR`, not `ALL_YEARS`, so the all-years
+level counts them once. Each doctor has a single state, county and source (the first roster
+row they appear in), so those three do add up.
+"""
+
+logger = logging.getLogger(__name__)
+
+CUBE_PATH = 'data/processed/payment_cube'
+CUBE_DIMENSIONS = ('state_fips', 'county_fips', 'src', 'manufacturer_id', 'year')
+ALL_MANUFACTURERS = '*'
+ALL_YEARS = 0
+UNKNOWN_YEAR = -1
+AMOUNT_COL = 'total_amount_of_payment_usdollars'
+_KEY_COLUMNS = ('first_name', 'last_name', 'state')
+
+
+def _abbr_codes(abbrs: np.ndarray) -> np.ndarray:
+    """'AA'..'ZZ' -> 0..675"""
+    letters = abbrs.astype('U2').view(np.uint32).reshape(-1, 2).astype(np.int64) - ord('A')
+    return letters[:, 0] * 26 + letters[:, 1]
+
+
+_STATES = {st.abbr: st for st in [*us.states.STATES_AND_TERRITORIES, us.states.DC] if st.fips}
+
+# state FIPS indexed by the two-letter abbreviation's code, 0 where there's no such state
+STATE_FIPS_BY_ABBR = np.zeros(26 * 26, dtype=np.uint8)
+STATE_FIPS_BY_ABBR[_abbr_codes(np.array(list(_STATES)))] = [int(st.fips) for st in _STATES.values()]
+STATE_FIPS_BY_NAME = {st.name.upper(): int(st.fips) for st in _STATES.values()}
+
+
+def state_fips(states: pandas.Series) -> pandas.Series:
+    """FIPS code (uint8, 0 if unknown) for each state abbreviation or full state name."""
+    normalized = states.astype('string').str.strip().str.upper()
+    is_abbr = normalized.str.fullmatch('[A-Z]{2}').fillna(False).to_numpy(dtype=bool)
+
+    out = np.zeros(len(states), dtype=np.uint8)
+    out[is_abbr] = STATE_FIPS_BY_ABBR[_abbr_codes(normalized[is_abbr].to_numpy(dtype=str))]
+    out[~is_abbr] = normalized[~is_abbr].map(STATE_FIPS_BY_NAME).fillna(0).to_numpy(dtype=np.uint8)
+    return pandas.Series(out, index=states.index, name='state_fips')
+
+
+def _doctor_keys(df: pandas.DataFrame) -> pandas.Series:
+    parts = [df[c].astype('string').str.strip().str.upper().fillna('') for c in _KEY_COLUMNS]
+    return parts[0].str.cat(parts[1:], sep='|')
+
+
+def roster_doctors(roster: pandas.DataFrame, counties: Optional[gpd.GeoDataFrame] = None,
+                   centroids: Optional[gpd.GeoDataFrame] = None) -> pandas.DataFrame:
+    """
+    One row per roster doctor (first name, last name, state), indexed by that key, with the
+    source and state/county FIPS of the first row they appear in. Without `counties` the
+    county is left at 0.
+    """
+    roster = roster.assign(key=_doctor_keys(roster)).drop_duplicates('key')
+    doctors = pandas.DataFrame({
+        'src': roster['src'].astype('string').fillna('unknown'),
+        'state_fips': state_fips(roster['state']),
+        'county_fips': np.zeros(len(roster), dtype=np.int32),
+    }, index=roster.index)
+
+    if counties is not None:
+        geoids = assign_counties(zip_points(roster['postal_code'], centroids), counties)
+        doctors['county_fips'] = pandas.to_numeric(geoids, errors='coerce').fillna(0).astype(np.int32)
+
+    return doctors.set_axis(roster['key'].to_numpy())
+
+
+def _payment_years(transactions: pandas.DataFrame) -> pandas.Series:
+    if 'program_year' in transactions:
+        years = pandas.to_numeric(transactions['program_year'], errors='coerce')
+    else:
+        years = pandas.Series(np.nan, index=transactions.index)
+    dates = pandas.to_datetime(transactions['date_of_payment'], format=DATE_FORMAT, errors='coerce')
+    return years.fillna(dates.dt.year).fillna(UNKNOWN_YEAR).astype(np.int16)
+
+
+def manufacturer_ids(ids: pandas.Series) -> pandas.Series:
+    """
+    Ids as strings of their integer value: a merge that leaves unpaid doctors' rows empty
+    stores them as floats, so the csv reads back '100000131389.0'. Non-numeric ids are kept.
+    """
+    numeric = pandas.to_numeric(ids, errors='coerce').round().astype('Int64').astype('string')
+    return numeric.fillna(ids.astype('string').str.strip())
+
+
+def build_cube(transactions: pandas.DataFrame, roster: pandas.DataFrame,
+               counties: Optional[gpd.GeoDataFrame] = None,
+               centroids: Optional[gpd.GeoDataFrame] = None) -> pandas.DataFrame:
+    """
+    `transactions` is the roster right-joined to Open Payments (`all_transactions`), so every
+    payment row carries the roster doctor's name and state; `roster` is the roster with duplicates.
+    """
+    doctors = roster_doctors(roster, counties, centroids)
+
+    paid = transactions.dropna(subset=[PROFILE_COL, ID_COL, AMOUNT_COL])
+    paid = pandas.DataFrame({
+        PROFILE_COL: paid[PROFILE_COL].astype('string'),
+        'manufacturer_id': manufacturer_ids(paid[ID_COL]),
+        'year': _payment_years(paid),
+        AMOUNT_COL: paid[AMOUNT_COL].astype(float),
+        'key': _doctor_keys(paid),
+    })
+    paid = paid[paid['key'].isin(doctors.index)]
+
+    # every payment to a doctor lands in the state, county and source of their first roster row
+    firsts = paid.drop_duplicates(PROFILE_COL)
+    geo = doctors.loc[firsts['key']].set_axis(firsts[PROFILE_COL].to_numpy())
+    paid = paid.drop(columns='key').join(geo, on=PROFILE_COL)
+
+    dims = list(CUBE_DIMENSIONS)
+    parts = []
+    for all_manufacturers, all_years in itertools.product((False, True), repeat=2):
+        rollup = paid
+        if all_manufacturers:
+            rollup = rollup.assign(manufacturer_id=ALL_MANUFACTURERS)
+        if all_years:
+            rollup = rollup.assign(year=np.int16(ALL_YEARS))
+        parts.append(rollup.groupby(dims, sort=False).agg(
+            paid_doctors=(PROFILE_COL, 'nunique'),
+            payments=(AMOUNT_COL, 'size'),
+            dollars=(AMOUNT_COL, 'sum'),
+        ))
+
+    roster_counts = doctors.assign(manufacturer_id=ALL_MANUFACTURERS, year=np.int16(ALL_YEARS))\
+        .groupby(dims, sort=False).size().rename('doctors')
+
+    cube = pandas.concat(parts).join(roster_counts, how='outer').reset_index()
+    cube[['paid_doctors', 'payments', 'dollars']] = cube[['paid_doctors', 'payments', 'dollars']].fillna(0)
+    return cube.sort_values(dims, ignore_index=True)
+
+
+def write_cube(cube: pandas.DataFrame, stem: str = CUBE_PATH) -> None:
+    write_table(cube, stem, PAYMENT_CUBE_SCHEMA, csv=False)
+
+
+def read_cube(stem: str = CUBE_PATH) -> pandas.DataFrame:
+    return read_table(stem, PAYMENT_CUBE_SCHEMA)
+
+
+def slice_cube(cube: pandas.DataFrame, manufacturer_id: str = ALL_MANUFACTURERS, year: int = ALL_YEARS,
+               exclude_src: Iterable[str] = ()) -> pandas.DataFrame:
+    """Rows for one manufacturer (or all of them) and one program year (or all of them)."""
+    mask = (cube['manufacturer_id'] == str(manufacturer_id)) & (cube['year'] == year)
+    exclude_src = list(exclude_src)
+    if exclude_src:
+        mask &= ~cube['src'].isin(exclude_src)
+    return cube[mask]
+
+
+def totals(cube: pandas.DataFrame, by: str, manufacturer_id: str = ALL_MANUFACTURERS, year: int = ALL_YEARS,
+           exclude_src: Iterable[str] = ()) -> pandas.DataFrame:
+    """
+    Roster doctors, paid doctors and dollars per `by` ('state_fips' or 'county_fips').
+    Roster doctors don't depend on the manufacturer or year.
+    """
+    exclude_src = list(exclude_src)
+    doctors = slice_cube(cube, exclude_src=exclude_src).groupby(by)['doctors'].sum()
+    paid = slice_cube(cube, manufacturer_id, year, exclude_src).groupby(by)[['paid_doctors', 'dollars']].sum()
+    out = paid.join(doctors, how='outer')
+    out[['paid_doctors', 'dollars']] = out[['paid_doctors', 'dollars']].fillna(0)
+    return out
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--transactions', default='data/processed/all_transactions.csv')
+    parser.add_argument('--roster', default='data/processed/all_with_duplicates', help='table stem')
+    parser.add_argument('--out', default=CUBE_PATH, help='table stem')
+    parser.add_argument('--no-counties', action='store_true', help="skip geocoding, leaving every county at 0")
+    args = parser.parse_args()
+
+    with StageRun('payment_cube') as run:
+        columns = {*_KEY_COLUMNS, PROFILE_COL, ID_COL, AMOUNT_COL, 'program_year', 'date_of_payment'}
+        transactions = pandas.read_csv(args.transactions, usecols=lambda c: c in columns,
+                                       dtype={c: 'string' for c in (*_KEY_COLUMNS, PROFILE_COL, ID_COL)})
+        roster = read_table(args.roster, ROSTER_SCHEMA)
+
+        counties = centroids = None
+        if not args.no_counties:
+            ref = ReferenceData()
+            counties, centroids = ref.counties(), ref.zcta_centroids()
+
+        with run.metrics.timer('build_cube'):
+            cube = build_cube(transactions, roster, counties, centroids)
+        write_cube(cube, args.out)
+        run.rows(len(transactions))
+        logger.info(f"{len(cube)} cells from {len(transactions)} transactions and {len(roster)} roster rows")
@@ -0,0 +1,160 @@
+import hashlib
+import json
+import logging
+import os
+from typing import Callable, Dict, NamedTuple, Optional
+
+import geopandas as gpd
+import pandas
+import pyarrow.parquet
+import requests
+
+__doc__ = """
+Census reference data for the visualizations, downloaded once and kept locally.
+
+Raw assets are fetched into `<data_dir>/raw` and checked against a sha256: the one
+pinned in `ASSETS` if there is one, otherwise the one recorded when the asset was
+first downloaded. Derived geometries (lower-48 crops in EPSG:2163, dissolved states,
+ZCTA centroids) are built from those once and stored as (Geo)Parquet
+under `<data_dir>/processed`. Point `data_dir` at a directory of small fixture files
+to use it without the network.
+"""
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'data', 'cache', 'reference')
+PROJECTED_EPSG = 2163
+LOWER_48_BOUNDS = (-130, -68, None, 55)  # lon min, lon max, lat min, lat max
+
+
+class Asset(NamedTuple):
+    url: str
+    filename: str
+    sha256: Optional[str] = None  # None: trust on first download, verify afterwards
+
+
+ASSETS: Dict[str, Asset] = {
+    'county': Asset('https://www2.census.gov/geo/tiger/GENZ2018/shp/cb_2018_us_county_500k.zip',
+                    'cb_2018_us_county_500k.zip'),
+    'zcta': Asset('https://www2.census.gov/geo/tiger/GENZ2018/shp/cb_2018_us_zcta510_500k.zip',
+                  'cb_2018_us_zcta510_500k.zip'),
+    'state': Asset('https://www2.census.gov/geo/tiger/GENZ2018/shp/cb_2018_us_state_500k.zip',
+                   'cb_2018_us_state_500k.zip'),
+    'apportionment': Asset(
+        'https://www2.census.gov/programs-surveys/decennial/2020/data/apportionment/apportionment-2020-table02.xlsx',
+        'apportionment-2020-table02.xlsx'),
+}
+
+
+class ChecksumMismatch(ValueError):
+    pass
+
+
+def crop_lower_48(gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+    old_crs = gdf.crs
+    lon_min, lon_max, lat_min, lat_max = LOWER_48_BOUNDS
+    return gdf.to_crs(4269).cx[lon_min:lon_max, lat_min:lat_max].to_crs(old_crs)
+
+
+def _sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class ReferenceData:
+    def __init__(self, data_dir: str = DATA_DIR, offline: bool = False):
+        self.data_dir = data_dir
+        self.offline = offline
+        self._manifest_path = os.path.join(data_dir, 'raw', 'manifest.json')
+
+    def _manifest(self) -> Dict[str, str]:
+        if not os.path.exists(self._manifest_path):
+            return {}
+        with open(self._manifest_path) as f:
+            return json.load(f)
+
+    def _record(self, name: str, digest: str) -> None:
+        manifest = self._manifest()
+        manifest[name] = digest
+        with open(self._manifest_path, 'w') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+
+    def path(self, name: str) -> str:
+        """Local path of raw asset `name`, downloading it if needed, after checking its checksum."""
+        asset = ASSETS[name]
+        path = os.path.join(self.data_dir, 'raw', asset.filename)
+
+        if not os.path.exists(path):
+            if self.offline:
+                raise FileNotFoundError(f'{path} (offline, so not downloading {asset.url})')
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            logger.info(f'downloading {asset.url}')
+            with requests.get(asset.url, stream=True, timeout=60) as r:
+                r.raise_for_status()
+                with open(f'{path}.part', 'wb') as f:
+                    for block in r.iter_content(chunk_size=1 << 20):
+                        f.write(block)
+            os.replace(f'{path}.part', path)
+
+        digest = _sha256(path)
+        expected = asset.sha256 or self._manifest().get(name)
+        if expected is None:
+            self._record(name, digest)
+        elif digest != expected:
+            raise ChecksumMismatch(f'{path}: sha256 {digest}, expected {expected}; delete it to redownload')
+        return path
+
+    def _cached(self, name: str, build: Callable[[], pandas.DataFrame]) -> pandas.DataFrame:
+        path = os.path.join(self.data_dir, 'processed', f'{name}.parquet')
+        if os.path.exists(path):
+            return gpd.read_parquet(path) if _is_geo(path) else pandas.read_parquet(path)
+
+        df = build()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        df.to_parquet(f'{path}.tmp')
+        os.replace(f'{path}.tmp', path)
+        return df
+
+    def _read_shapes(self, name: str) -> gpd.GeoDataFrame:
+        return gpd.read_file(f'zip://{self.path(name)}')
+
+    def counties(self) -> gpd.GeoDataFrame:
+        """Lower-48 counties in EPSG:2163."""
+        return self._cached('counties', lambda: crop_lower_48(
+            self._read_shapes('county')).to_crs(epsg=PROJECTED_EPSG))
+
+    def county_states(self) -> gpd.GeoDataFrame:
+        """Lower-48 states dissolved from `counties`, indexed by STATEFP."""
+        return self._cached('county_states', lambda: self.counties().dissolve('STATEFP'))
+
+    def country(self) -> gpd.GeoDataFrame:
+        return self._cached('country', lambda: self.county_states().dissolve(lambda _: True))
+
+    def states(self) -> gpd.GeoDataFrame:
+        """Lower-48 state boundaries from the state shapefile, in EPSG:2163."""
+        return self._cached('states', lambda: crop_lower_48(
+            self._read_shapes('state').to_crs(epsg=PROJECTED_EPSG)))
+
+    def zcta_centroids(self) -> gpd.GeoDataFrame:
+        """ZCTA centroids as points in the shapefile's crs, indexed by ZIP (int), ascending."""
+        def build() -> gpd.GeoDataFrame:
+            zipcodes = self._read_shapes('zcta')
+            return gpd.GeoDataFrame(
+                {'zip': zipcodes['ZCTA5CE10'].astype(int).to_numpy()},
+                geometry=zipcodes.geometry.centroid.to_numpy(), crs=zipcodes.crs
+            ).set_index('zip').sort_index()
+        return self._cached('zcta_centroids', build)
+
+    def apportionment(self) -> pandas.DataFrame:
+        """
+        2020 apportionment population table, as read from the Census spreadsheet. Read from
+        the local copy each time: it's small, and its columns mix numbers and footnotes.
+        """
+        return pandas.read_excel(self.path('apportionment'), header=3)
+
+
+def _is_geo(path: str) -> bool:
+    return b'geo' in (pyarrow.parquet.read_schema(path).metadata or {})
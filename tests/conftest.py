@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the scripts import each other as top-level packages from src/ (see run_me_first.py)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, 'src'))
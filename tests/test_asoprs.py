@@ -0,0 +1,36 @@
+import os
+
+import pandas
+import pytest
+
+pytest.importorskip('inflection')
+
+from basic_data.asoprs import AsoprsAdvancedDataApi
+from clean_basic_data.clean_all import clean_asoprs
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures', 'asoprs')
+
+
+@pytest.fixture
+def profile():
+    with open(os.path.join(FIXTURES, 'profile.html')) as f:
+        return AsoprsAdvancedDataApi.parse_profile(f.read())
+
+
+def test_parse_profile(profile):
+    assert profile['Full Name_firstName'] == 'Jane'
+    assert profile['Full Name_lastName'] == 'Doe'
+    assert profile['Address - Practice/Institution_zip'] == '60611-4012'
+    assert profile['Fellowship - Domestic or International_values'] == ['Domestic']
+    assert not any(k.endswith(('_label', '_attributeId', '_maxLength')) for k in profile)
+
+
+def test_parsed_profile_cleans(profile):
+    cleaned = clean_asoprs(pandas.DataFrame([profile]))
+
+    assert cleaned.iloc[0].to_list()[:5] == ['Jane', 'Doe', 'Chicago', '60611', 'IL']
+
+
+def test_page_without_attributes():
+    with pytest.raises(ValueError, match='no attributesView'):
+        AsoprsAdvancedDataApi.parse_profile('<html></html>', 'https://example.org/profile')
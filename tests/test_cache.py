@@ -0,0 +1,98 @@
+import sqlite3
+
+import pytest
+
+from get_npi.cache import CacheMiss, CachingTransport, ResponseCache, params_key
+
+
+class _Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class _CountingTransport:
+    def __init__(self):
+        self.calls = []
+
+    def get(self, params):
+        self.calls.append(params)
+        return {'result_count': 1, 'results': [{'number': len(self.calls)}]}
+
+
+def _keys(path):
+    with sqlite3.connect(path) as conn:
+        return {key for key, in conn.execute('SELECT key FROM responses')}
+
+
+def test_params_are_canonicalized():
+    assert params_key({'last_name': ' doe ', 'city': None, 'state': ''}) == params_key({'last_name': 'DOE'})
+
+
+def test_ttl_expiry(tmp_path):
+    clock = _Clock()
+    path = str(tmp_path / 'npi.sqlite')
+    with ResponseCache(path, ttl=60, clock=clock) as cache:
+        cache.put({'last_name': 'DOE'}, {'result_count': 0})
+        clock.now += 60
+        assert cache.get({'last_name': 'DOE'}) == {'result_count': 0}
+        clock.now += 1
+        assert cache.get({'last_name': 'DOE'}) is None
+        assert (cache.hits, cache.misses) == (1, 1)
+    # closing evicts what has expired
+    assert _keys(path) == set()
+
+
+def test_max_bytes_evicts_least_recently_read(tmp_path):
+    clock = _Clock()
+    path = str(tmp_path / 'npi.sqlite')
+    body = {'results': ['x' * 10]}
+    with ResponseCache(path, clock=clock) as cache:
+        for name in ('A', 'B', 'C'):
+            clock.now += 1
+            cache.put({'last_name': name}, body)
+        size, = sqlite3.connect(path).execute('SELECT MAX(size) FROM responses').fetchone()
+
+    clock.now += 1
+    with ResponseCache(path, max_bytes=2 * size, clock=clock) as cache:
+        assert cache.get({'last_name': 'A'}) == body  # A is now the most recently read
+    assert _keys(path) == {params_key({'last_name': 'A'}), params_key({'last_name': 'C'})}
+
+
+def test_read_only_never_writes(tmp_path):
+    path = str(tmp_path / 'npi.sqlite')
+    with ResponseCache(path) as cache:
+        cache.put({'last_name': 'DOE'}, {'result_count': 1})
+
+    with ResponseCache(path, ttl=0, max_bytes=0, read_only=True, clock=_Clock(2e9)) as cache:
+        cache.put({'last_name': 'ROE'}, {'result_count': 1})
+        assert cache.get({'last_name': 'ROE'}) is None
+    assert _keys(path) == {params_key({'last_name': 'DOE'})}
+
+
+def test_caching_transport(tmp_path):
+    inner = _CountingTransport()
+    with ResponseCache(str(tmp_path / 'npi.sqlite')) as cache:
+        transport = CachingTransport(inner, cache)
+        first = transport.get({'last_name': 'DOE', 'skip': 0})
+        assert transport.get({'last_name': 'doe', 'skip': '0'}) == first
+        assert len(inner.calls) == 1
+
+
+def test_offline_miss_raises(tmp_path):
+    path = str(tmp_path / 'npi.sqlite')
+    with ResponseCache(path) as cache:
+        CachingTransport(_CountingTransport(), cache).get({'last_name': 'DOE'})
+
+    with ResponseCache(path, read_only=True) as cache:
+        transport = CachingTransport(None, cache, offline=True)
+        assert transport.get({'last_name': 'DOE'})['result_count'] == 1
+        with pytest.raises(CacheMiss):
+            transport.get({'last_name': 'ROE'})
+
+
+def test_inner_transport_required_unless_offline(tmp_path):
+    with ResponseCache(str(tmp_path / 'npi.sqlite')) as cache, pytest.raises(AssertionError):
+        CachingTransport(None, cache)
@@ -0,0 +1,70 @@
+import pandas
+
+from get_npi.checkpoint import NpiJournal, row_keys
+from get_npi.resolver import NpiResolver, ResolveResult
+
+
+class _FlakyTransport:
+    """Answers every query with one match, except for `fail_last_names`, which raise."""
+
+    def __init__(self, fail_last_names=()):
+        self.fail_last_names = set(fail_last_names)
+
+    def get(self, params):
+        if params.get('last_name') in self.fail_last_names:
+            raise ConnectionError('registry unavailable')
+        if params['skip']:
+            return {'result_count': 0, 'results': []}
+        return {'result_count': 1, 'results': [{'number': 1000000000 + len(params['last_name'])}]}
+
+
+def _roster():
+    return pandas.DataFrame({
+        'first_name': ['ANN', 'BOB'],
+        'last_name': ['LEE', 'SMITHSON'],
+        'city': ['CHICAGO', 'BOSTON'],
+        'postal_code': ['60601', '02108'],
+        'state': ['IL', 'MA'],
+        'specialty_code': ['207W00000X', '207W00000X'],
+    })
+
+
+def _run(df, journal, transport):
+    keys = row_keys(df)
+    todo = df[~keys.isin(journal.done().keys())]
+    with journal:
+        for idx, result in NpiResolver(transport, workers=2).resolve(todo.iterrows()):
+            journal.append(keys[idx], result)
+    return todo
+
+
+def test_failed_rows_are_retried_on_resume(tmp_path):
+    df = _roster()
+    journal = NpiJournal(str(tmp_path / 'journal.jsonl'))
+
+    _run(df, journal, _FlakyTransport(fail_last_names={'SMITHSON'}))
+    records = journal.load()
+    assert len(records) == 2
+    failed, = [r for r in records.values() if not r.done]
+    assert 'registry unavailable' in failed.error
+    assert list(journal.done()) == [row_keys(df)[0]]
+
+    retried = _run(df, journal, _FlakyTransport())
+    assert retried['last_name'].to_list() == ['SMITHSON']
+    assert {r.npi for r in journal.done().values()} == {1000000003, 1000000008}
+
+
+def test_no_match_rows_stay_done(tmp_path):
+    journal = NpiJournal(str(tmp_path / 'journal.jsonl'))
+    with journal:
+        journal.append('a|b|c|d|e', ResolveResult(None, [3, 4], 0, 2))
+
+    record, = journal.done().values()
+    assert record.npi is None and record.calls == 2
+
+
+def test_reads_journals_without_errors(tmp_path):
+    path = tmp_path / 'journal.jsonl'
+    path.write_text('{"key": "k", "npi": 1234567890, "indices": [3], "count": 1, "calls": 1}\n')
+
+    assert NpiJournal(str(path)).done()['k'].npi == 1234567890
@@ -0,0 +1,28 @@
+import warnings
+
+import pandas
+
+from clean_basic_data.clean_all import COLUMNS, GENERIC_OPHTHALMOLOGY_CODE, clean_asoprs
+
+
+def test_clean_asoprs_takes_first_address_per_subfield():
+    raw = pandas.DataFrame({
+        'Full Name_firstName': ['Ann', 'Bob'],
+        'Full Name_lastName': ['Lee', 'Smith'],
+        'Primary Address_city': [None, 'Boston'],
+        'Primary Address_zip': [None, '02108-1234'],
+        'Primary Address_state': [None, None],
+        'Other Address_city': ['Chicago', 'Cambridge'],
+        'Other Address_zip': ['60612', None],
+        'Other Address_state': ['IL', None],
+    }, dtype=object)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', FutureWarning)
+        out = clean_asoprs(raw)
+
+    assert out.columns.to_list() == COLUMNS
+    assert out['city'].to_list() == ['Chicago', 'Boston']
+    assert out['postal_code'].to_list() == ['60612', '02108']
+    assert out['state'].to_list()[0] == 'IL' and pandas.isna(out['state'].to_list()[1])
+    assert (out['specialty_code'] == GENERIC_OPHTHALMOLOGY_CODE).all()
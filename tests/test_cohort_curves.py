@@ -0,0 +1,87 @@
+import datetime as dt
+
+import numpy as np
+import pandas
+
+from vizualize.cohort_curves import (
+    ID_COL, NAME_COL, PROFILE_COL, first_contact_counts, initial_doctor_count, manufacturer_names,
+    payment_curves, prepare_payments, survival_curves)
+
+START_DATE = pandas.Timestamp(year=2018, day=1, month=1) - dt.timedelta(days=1)
+HORIZON, ACME = 100000131389, 100000000042
+
+
+def _transactions(n=300, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pandas.Timestamp('2017-12-01') + pandas.to_timedelta(rng.integers(0, 120, n), unit='D')
+    df = pandas.DataFrame({
+        PROFILE_COL: rng.integers(1, 40, n).astype(float),
+        ID_COL: rng.choice([HORIZON, ACME], n),
+        'date_of_payment': dates.strftime('%m/%d/%Y'),
+        'total_amount_of_payment_usdollars': rng.integers(1, 500, n).astype(float),
+        'src': rng.choice(['asoprs', 'tepezza', 'endocrinologists'], n),
+    })
+    df[NAME_COL] = df[ID_COL].map({HORIZON: 'Horizon', ACME: 'Acme'})
+    df.loc[::11, PROFILE_COL] = np.nan
+    df.loc[::17, 'date_of_payment'] = np.nan
+    return df
+
+
+def _baseline(df):
+    """kaplan_meier.ipynb's cells before they were moved into cohort_curves, minus the plotting."""
+    df = df[df['src'] != 'endocrinologists'].copy()
+    df.loc[:, 'payment_ts'] = df['date_of_payment'].dropna().apply(lambda s: dt.datetime.strptime(s, '%m/%d/%Y'))
+    df = df[df['payment_ts'] > START_DATE]
+
+    ids_to_names = {k: df.loc[df[ID_COL] == k, NAME_COL].iloc[0] for k in df[ID_COL].dropna().unique()}
+
+    doctor_counts = df.dropna(subset=[PROFILE_COL]).groupby([ID_COL, PROFILE_COL]).agg({'payment_ts': 'min'})
+    doctor_counts['physician_count'] = 1
+    doctor_counts = doctor_counts.groupby([ID_COL, 'payment_ts']).sum()
+    for i in doctor_counts.index.get_level_values(0):
+        doctor_counts.loc[(i, START_DATE), :] = 0
+    doctor_counts.sort_index(inplace=True)
+    doctor_counts['physician_count_cumulative'] = pandas.concat(
+        [g.sort_index().cumsum() for _, g in doctor_counts.groupby(ID_COL)])['physician_count']
+
+    initial_doctors = len(df.groupby(PROFILE_COL)) + pandas.isna(df[PROFILE_COL]).sum()
+
+    _df_tmp = df.copy()
+    _df_tmp['payment_count'] = 0
+    payments = _df_tmp.dropna(subset=[PROFILE_COL])\
+        .rename(columns={'total_amount_of_payment_usdollars': 'payment_amount'})\
+        .groupby([ID_COL, 'payment_ts'])\
+        .agg({'payment_count': 'count', 'payment_amount': 'sum'})
+    for i in payments.index.get_level_values(0):
+        payments.loc[(i, START_DATE), :] = [0, 0]
+    payments.sort_index(inplace=True)
+    payments = pandas.concat([g.cumsum() for _, g in payments.groupby(ID_COL)])
+
+    return ids_to_names, doctor_counts, initial_doctors, payments
+
+
+def test_curves_match_the_notebook_loops():
+    raw = _transactions()
+    names, counts, initial_doctors, payments = _baseline(raw)
+
+    df = prepare_payments(raw, START_DATE, exclude_src=['endocrinologists'])
+    new_counts = first_contact_counts(df, START_DATE)
+
+    assert manufacturer_names(df) == names
+    assert initial_doctor_count(df) == initial_doctors
+    pandas.testing.assert_frame_equal(new_counts, counts, check_dtype=False)
+    pandas.testing.assert_series_equal(survival_curves(new_counts, initial_doctor_count(df)),
+                                       initial_doctors - counts['physician_count_cumulative'], check_dtype=False)
+    pandas.testing.assert_frame_equal(payment_curves(df, START_DATE), payments, check_dtype=False)
+
+
+def test_curves_start_at_zero():
+    df = prepare_payments(_transactions(seed=1), START_DATE)
+
+    cumulative = (first_contact_counts(df, START_DATE)[['physician_count_cumulative']],
+                  payment_curves(df, START_DATE))
+    for curves in cumulative:
+        starts = curves.xs(START_DATE, level=1)
+        assert sorted(starts.index) == [ACME, HORIZON]
+        assert (starts == 0).all().all()
+        assert (curves.groupby(level=0).diff().dropna() >= 0).all().all()
@@ -0,0 +1,151 @@
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+from urllib.parse import urlparse
+
+import pandas
+import pytest
+
+from link_with_open_payments import company_ids
+from link_with_open_payments.company_ids import CompanyIdResolver, match_companies, unresolved
+
+PROFILES = pandas.DataFrame({
+    'entity_id': ['100000131389', '100000131390', '100000000001', '100000000002', '100000000001'],
+    'entity_name': ['Horizon Therapeutics USA, Inc.', 'Horizon Pharma Ireland Ltd',
+                    'Amgen Inc', 'Viridian Therapeutics, Inc.', 'Amgen Inc'],
+})
+
+
+def test_substring_match_is_case_insensitive():
+    matches = match_companies(['amgen', 'Viridian'], PROFILES)
+
+    # two profile rows, one entity
+    assert matches['amgen'].entity_id == '100000000001'
+    assert matches['amgen'].matched_on == 'amgen'
+    assert matches['Viridian'].entity_id == '100000000002'
+
+
+def test_first_word_is_tried_after_the_full_name():
+    matches = match_companies(['Viridian Pharmaceuticals', 'Horizon Therapeutics'], PROFILES)
+
+    assert matches['Viridian Pharmaceuticals'].entity_id == '100000000002'
+    assert matches['Viridian Pharmaceuticals'].matched_on == 'Viridian'
+    assert matches['Horizon Therapeutics'].entity_id == '100000131389'
+    assert matches['Horizon Therapeutics'].matched_on == 'Horizon Therapeutics'
+
+
+def test_ambiguous_and_unmatched_names_are_reported():
+    matches = match_companies(['Horizon', 'Therapeutics', 'Nobody Pharma'], PROFILES)
+
+    assert matches['Horizon'].status == 'ambiguous'
+    assert matches['Horizon'].candidates == ('100000131389', '100000131390')
+    assert matches['Therapeutics'].candidates == ('100000131389', '100000000002')
+    assert matches['Nobody Pharma'].status == 'unmatched'
+
+    report = unresolved(matches)
+    assert report['name'].to_list() == ['Horizon', 'Therapeutics', 'Nobody Pharma']
+    assert report['candidate_count'].to_list() == [2, 2, 0]
+    assert report.loc[0, 'candidates'] == '100000131389|100000131390'
+
+
+class _OpenPayments(BaseHTTPRequestHandler):
+    """The profile download as csv, and a metastore item per dataset."""
+
+    requests: List[str] = []
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        self.requests.append(path)
+        if path.endswith('/download'):
+            body, content_type = PROFILES.to_csv(index=False).encode(), 'text/csv'
+        else:
+            body = json.dumps({'distribution': [{'identifier': f'key-of-{path.rsplit("/", 1)[-1]}'}]}).encode()
+            content_type = 'application/json'
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(monkeypatch):
+    _OpenPayments.requests = []
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), _OpenPayments)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    base_url = f'http://127.0.0.1:{httpd.server_port}'
+    monkeypatch.setattr(company_ids, 'DOWNLOAD_URL', base_url + '/datastore/{dataset_id}/download')
+    monkeypatch.setattr(company_ids, 'METASTORE_URL', base_url + '/metastore/{dataset_id}')
+    yield base_url
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _downloads():
+    return sum(p.endswith('/download') for p in _OpenPayments.requests)
+
+
+def _age(path, seconds):
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+
+def test_profiles_are_downloaded_once_within_max_age(tmp_path, server):
+    with CompanyIdResolver(str(tmp_path), max_age=60) as resolver:
+        assert resolver.resolve(['Amgen'])['Amgen'].entity_id == '100000000001'
+    with CompanyIdResolver(str(tmp_path), max_age=60) as resolver:
+        assert resolver.resolve(['Amgen', 'Viridian'])['Viridian'].entity_id == '100000000002'
+
+    assert _downloads() == 1
+    mapping = pandas.read_csv(tmp_path / 'company_ids.csv', dtype=str)
+    assert mapping['name'].to_list() == ['Amgen', 'Viridian']
+
+
+def test_profiles_older_than_max_age_are_downloaded_again(tmp_path, server):
+    with CompanyIdResolver(str(tmp_path), max_age=60) as resolver:
+        resolver.resolve(['Amgen'])
+    _age(tmp_path / 'company_profiles.csv', 120)
+    _age(tmp_path / 'company_ids.csv', 120)
+
+    with CompanyIdResolver(str(tmp_path), max_age=60) as resolver:
+        resolver.resolve(['Amgen'])
+    assert _downloads() == 2
+
+    _age(tmp_path / 'company_profiles.csv', 10 ** 9)
+    with CompanyIdResolver(str(tmp_path), max_age=None) as resolver:
+        resolver.resolve(['Amgen'])
+    assert _downloads() == 2
+
+
+def test_mapping_older_than_the_profiles_is_rematched(tmp_path, server):
+    with CompanyIdResolver(str(tmp_path)) as resolver:
+        resolver.resolve(['Amgen'])
+    # a stale entry the current profiles would not give
+    pandas.DataFrame([('Amgen', 'stale', 'Amgen', '')], columns=['name', 'entity_id', 'matched_on', 'candidates'])\
+        .to_csv(tmp_path / 'company_ids.csv', index=False)
+    _age(tmp_path / 'company_ids.csv', 120)
+
+    with CompanyIdResolver(str(tmp_path)) as resolver:
+        assert resolver.resolve(['Amgen'])['Amgen'].entity_id == '100000000001'
+
+
+def test_refresh_refetches_once(tmp_path, server):
+    with CompanyIdResolver(str(tmp_path)) as resolver:
+        resolver.resolve(['Amgen'])
+        assert resolver.dataset_key('abcd-1234') == 'key-of-abcd-1234'
+
+    with CompanyIdResolver(str(tmp_path), refresh=True) as resolver:
+        resolver.resolve(['Amgen'])
+        resolver.resolve(['Viridian'])
+        resolver.dataset_key('abcd-1234')
+        resolver.dataset_key('abcd-1234')
+
+    assert _downloads() == 2
+    assert _OpenPayments.requests.count('/metastore/abcd-1234') == 2
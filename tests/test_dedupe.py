@@ -0,0 +1,65 @@
+import numpy
+import pandas
+import pytest
+
+from clean_basic_data.dedupe import cluster, drop_near_duplicates, soundex
+
+
+@pytest.mark.parametrize('name, code', [
+    ('ROBERT', 'R163'), ('RUPERT', 'R163'), ('ASHCRAFT', 'A261'), ('TYMCZAK', 'T522'),
+    ('PFISTER', 'P236'), ('LEE', 'L000'), ('', ''),
+])
+def test_soundex(name, code):
+    assert soundex(name) == code
+
+
+COLUMNS = ['first_name', 'last_name', 'city', 'postal_code', 'state']
+ROSTER = pandas.DataFrame([
+    # (first, last, city, zip, state); rows in the same pair are duplicates
+    ('Robert', 'Smith', 'Chicago', '60612', 'IL'),       # 0
+    ('Bob', 'Smith', 'Chicago', '60612', 'IL'),          # 1  nickname of 0
+    ('Maria', 'Garcia-Lopez', 'Boston', '02108', 'MA'),  # 2
+    ('Maria', 'Lopez', 'Boston', '02108', 'MA'),         # 3  one part of 2's last name
+    ('Ann', 'Lee', 'Peoria', '61602', 'IL'),             # 4
+    ('Ann', 'Lee', 'Peoria', '61603', 'IL'),             # 5  zip typo of 4
+    ('Amy', 'Lee', 'Peoria', '61602', 'IL'),             # 6  different first name
+    ('Ann', 'Lee', 'Newark', '07102', 'NJ'),             # 7  different state and zip3
+    ('Dev', None, None, None, 'NJ'),                     # 8
+    ('Dev', None, None, None, 'NJ'),                     # 9  exact duplicate of 8, in no block
+    ('Carl', 'Jones', 'Denver', '80202', 'CO'),          # 10
+    ('Carl', 'Jones', 'Denver', '80202', 'CO'),          # 11 exact duplicate of 10
+], columns=COLUMNS)
+DUPLICATES = {1: 0, 3: 2, 5: 4, 9: 8, 11: 10}
+
+
+def test_cluster_links_known_pairs():
+    clusters = cluster(ROSTER)
+
+    expected = numpy.array([DUPLICATES.get(i, i) for i in range(len(ROSTER))])
+    assert clusters.tolist() == expected.tolist()
+
+
+def test_blocks_require_a_shared_state_or_zip3():
+    clusters = cluster(ROSTER)
+
+    assert clusters[7] != clusters[4]
+    assert clusters[6] != clusters[4]
+
+
+def test_drop_near_duplicates_keeps_most_complete_row():
+    df = pandas.DataFrame([
+        ('Robert', 'Smith', None, '60612', 'IL'),
+        ('Bob', 'Smith', 'Chicago', '60612', 'IL'),
+        ('Ann', 'Lee', 'Peoria', '61602', 'IL'),
+    ], columns=COLUMNS, index=[10, 20, 30])
+
+    out = drop_near_duplicates(df)
+
+    assert out.index.to_list() == [20, 30]
+
+
+def test_drops_at_least_exact_duplicates():
+    out = drop_near_duplicates(ROSTER)
+
+    assert len(out) == len(ROSTER) - len(DUPLICATES)
+    assert len(out) <= len(ROSTER.drop_duplicates())
@@ -0,0 +1,125 @@
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+import pandas
+import pytest
+import requests
+
+from link_with_open_payments.download_open_payments import (
+    OpenPaymentsDownloader, flatten_principal_investigators, read_payments)
+
+SHARED = {
+    'record_id': ['1', '2'],
+    'program_year': ['2020', '2020'],
+    'total_amount_of_payment_usdollars': ['100.0', '250.5'],
+    'applicable_manufacturer_or_applicable_gpo_making_payment_id': ['100000131389'] * 2,
+}
+
+
+def _investigator(i, profile_ids, last_names):
+    return {f'principal_investigator_{i}_profile_id': profile_ids,
+            f'principal_investigator_{i}_last_name': last_names,
+            f'principal_investigator_{i}_city': ['CHICAGO', 'BOSTON']}
+
+
+def _write(downloader, tmp_path, dataset_id, company_id, columns):
+    csv_path = tmp_path / f'{dataset_id}.csv'
+    pandas.DataFrame(columns).to_csv(csv_path, index=False)
+    return downloader._write_partitions('research', dataset_id, company_id, str(csv_path))
+
+
+def test_research_parts_with_different_investigator_columns(tmp_path):
+    out_dir = str(tmp_path / 'open_payments')
+    downloader = OpenPaymentsDownloader(out_dir)
+    # the first file only names one investigator, the second names two
+    _write(downloader, tmp_path, 'nvfc-jcr4', '100000131389',
+           {**SHARED, **_investigator(1, ['11', '12'], ['LEE', 'KIM'])})
+    _write(downloader, tmp_path, '94mj-bpz5', '100000131390',
+           {**SHARED, 'program_year': ['2021', '2021'], 'record_id': ['3', '4'],
+            **_investigator(1, ['13', None], ['PARK', None]), **_investigator(2, ['14', '15'], ['DOE', 'ROE'])})
+
+    df = read_payments(out_dir, 'research')
+    assert 'principal_investigator_2_profile_id' in df.columns
+    assert sorted(df['program_year'].to_list()) == [2020, 2020, 2021, 2021]
+
+    flat = flatten_principal_investigators(df)
+    assert sorted(flat['physician_profile_id']) == ['11', '12', '13', '14', '15']
+    assert flat.set_index('physician_profile_id').loc['14', 'physician_last_name'] == 'DOE'
+    assert flat.set_index('physician_profile_id').loc['14', 'recipient_city'] == 'CHICAGO'
+
+
+def test_filters_on_partitions(tmp_path):
+    out_dir = str(tmp_path / 'open_payments')
+    downloader = OpenPaymentsDownloader(out_dir)
+    _write(downloader, tmp_path, 'nvfc-jcr4', '100000131389', {**SHARED, **_investigator(1, ['11', '12'], ['LEE', 'KIM'])})
+    _write(downloader, tmp_path, '94mj-bpz5', '100000131390', {**SHARED, **_investigator(1, ['13', '16'], ['PARK', 'HO'])})
+
+    df = read_payments(out_dir, 'research', filters=[('manufacturer_id', '=', '100000131390')])
+    assert sorted(df['principal_investigator_1_profile_id']) == ['13', '16']
+
+
+CSV = b''.join(b'%d,%d\n' % (i, i * i) for i in range(300_000))  # a few 1 MB blocks
+
+
+class _FlakyDownloads(BaseHTTPRequestHandler):
+    """Serves CSV with Range support. `script` says what each request gets: 'ok', '503' or 'drop' (half a body)."""
+
+    script: List[str] = []
+    ranges: List[Optional[str]] = []
+
+    def do_GET(self):
+        self.ranges.append(self.headers.get('Range'))
+        action = self.script.pop(0) if self.script else 'ok'
+        if action == '503':
+            self.send_error(503)
+            return
+
+        start = int(self.headers['Range'][len('bytes='):-1]) if self.headers.get('Range') else 0
+        body = CSV[start:]
+        self.send_response(206 if start else 200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if action == 'drop':
+            self.wfile.write(body[:len(body) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    _FlakyDownloads.script, _FlakyDownloads.ranges = [], []
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), _FlakyDownloads)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{httpd.server_port}/{{dataset_id}}'
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_download_retries_and_resumes(tmp_path, server):
+    _FlakyDownloads.script = ['503', 'drop', 'drop']
+    path = str(tmp_path / 'dl.csv')
+
+    OpenPaymentsDownloader(str(tmp_path), download_url=server)._stream_to_disk('ud7t-2ipu', '100000131389', path)
+
+    with open(path, 'rb') as f:
+        assert f.read() == CSV
+    # whole blocks written before each drop are kept, and the next request picks up after them
+    assert _FlakyDownloads.ranges[:2] == [None, None]
+    offsets = [int(r[len('bytes='):-1]) for r in _FlakyDownloads.ranges[2:]]
+    assert len(offsets) == 2 and 0 < offsets[0] < offsets[1] < len(CSV)
+
+
+def test_download_gives_up_after_max_resumes(tmp_path, server):
+    _FlakyDownloads.script = ['drop'] * 3
+    path = str(tmp_path / 'dl.csv')
+
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        OpenPaymentsDownloader(str(tmp_path), download_url=server, max_resumes=2)\
+            ._stream_to_disk('ud7t-2ipu', '100000131389', path)
+    assert not os.path.exists(path) and os.path.exists(f'{path}.part')
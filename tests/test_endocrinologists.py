@@ -0,0 +1,115 @@
+import glob
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from basic_data.endocrinologists import EndocrinologistCrawler, EndocrinologistPageParser, compare_parsers
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures', 'endocrinologists')
+PAGES = sorted(glob.glob(os.path.join(FIXTURES, '*.html')))
+
+
+def _read(name):
+    with open(os.path.join(FIXTURES, name)) as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('path', PAGES, ids=os.path.basename)
+def test_lxml_parser_matches_bs4(path):
+    with open(path) as f:
+        assert compare_parsers(f.read()) == []
+
+
+def test_parse_results_page():
+    items = EndocrinologistPageParser.parse(_read('results_page_0.html'))
+
+    assert [d['full_name'] for d in items] == [
+        'Dr. Jane A Doe, MD', 'Dr. John Smith-Jones, MD, PhD', "Mary O'Neil, DO"]
+    doe = items[0]
+    assert (doe['first_name'], doe['middle_name'], doe['last_name']) == ('Jane', ['A'], ['Doe'])
+    assert (doe['city'], doe['state'], doe['zipcode']) == ('Los Angeles', 'CA', '90089-0080')
+    assert doe['languages'] == ['English', 'Spanish', 'German']
+    assert doe['areas_of_concentration'] == ['Thyroid', 'General Endocrine Practice']
+    assert doe['board_cert'] == 'Internal Medicine'
+    assert items[1]['degrees'] == ['MD', 'PhD']
+    assert items[1]['telehealth availability'] == 'Yes'
+    assert items[2]['prefix'] is None and items[2]['board_cert'] is None
+
+
+def test_missing_and_inline_areas_of_concentration():
+    no_areas, inline = EndocrinologistPageParser.parse(_read('results_page_1.html'))
+
+    assert no_areas['areas_of_concentration'] is None
+    assert inline['areas_of_concentration'] == ['Diabetes Mellitus', 'Obesity', 'Pituitary']
+    assert all(type(v) is str for v in inline['areas_of_concentration'])
+
+
+def test_empty_page():
+    assert EndocrinologistPageParser.parse(_read('results_empty.html')) == []
+
+
+class _RecordedPages(BaseHTTPRequestHandler):
+    """Serves the fixture pages by `page`; `failures[(specialty, page)]` requests 404 first."""
+
+    failures: Dict[Tuple[str, int], int] = {}
+    requests: List[Tuple[str, int]] = []
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        specialty, page = query['specialty'][0], int(query['page'][0])
+        self.requests.append((specialty, page))
+
+        if self.failures.get((specialty, page), 0) > 0:
+            self.failures[specialty, page] -= 1
+            self.send_error(404)
+            return
+        name = f'results_page_{page}.html' if page < 2 else 'results_empty.html'
+        body = _read(name).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    _RecordedPages.failures, _RecordedPages.requests = {}, []
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), _RecordedPages)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{httpd.server_port}/results'
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_crawl_recorded_pages(server):
+    result = EndocrinologistCrawler(server, specialties=('Thyroid', 'Diabetes', 'Lipids'), workers=4).crawl()
+
+    assert result.failed_pages == []
+    assert len(result.listings) == 5  # the same listings under every specialty
+    assert all(sorted(s) == ['Diabetes', 'Lipids', 'Thyroid'] for s in result.listings['specialties'])
+    # nothing past a specialty's first empty page, give or take pages already in flight
+    assert max(page for _, page in _RecordedPages.requests) < 2 + 4
+
+
+def test_failed_pages_are_retried_then_reported(server):
+    _RecordedPages.failures = {('Thyroid', 1): 1, ('Diabetes', 0): 10}
+
+    result = EndocrinologistCrawler(server, specialties=('Thyroid', 'Diabetes'), workers=2,
+                                    page_retries=2).crawl()
+
+    assert result.failed_pages == [('Diabetes', 0)]
+    assert _RecordedPages.requests.count(('Diabetes', 0)) == 3
+    assert _RecordedPages.requests.count(('Thyroid', 1)) == 2
+    assert len(result.listings) == 5
+    thyroid_only = result.listings['specialties'].map(len) == 1
+    assert sorted(result.listings.loc[thyroid_only, 'full_name']) == [
+        'Dr. Jane A Doe, MD', 'Dr. John Smith-Jones, MD, PhD', "Mary O'Neil, DO"]
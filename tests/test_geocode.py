@@ -0,0 +1,84 @@
+from typing import Optional
+
+import numpy as np
+import pandas
+import pytest
+
+gpd = pytest.importorskip('geopandas')
+
+from shapely.geometry import Point, box
+
+from vizualize.geocode import MAX_ZIP_DISTANCE, assign_counties, nearest_zips, zip_points
+
+ZIPS = np.array([1001, 2115, 2118, 60601, 60612, 60614, 99950])
+
+CENTROIDS = gpd.GeoDataFrame({'zip': ZIPS}, geometry=[Point(i, i) for i in range(len(ZIPS))],
+                             crs=4269).set_index('zip')
+
+# a 3x3 grid of unit squares, county i spanning x in [i % 3, i % 3 + 1], y in [i // 3, i // 3 + 1]
+COUNTIES = gpd.GeoDataFrame({'GEOID': [f'{17000 + i:05d}' for i in range(9)]},
+                            geometry=[box(i % 3, i // 3, i % 3 + 1, i // 3 + 1) for i in range(9)], crs=4269)
+
+
+def _closest_zip(postal_code: float) -> Optional[int]:
+    """dot_maps' original `closest_search` loop, returning the ZIP rather than its centroid."""
+    if pandas.isna(postal_code):
+        return None
+    postal_code = int(postal_code)
+    if postal_code in ZIPS:
+        return postal_code
+    int_idx = np.abs(ZIPS - postal_code).argmin()
+    # the loop compared the position `int_idx` to the ZIP here; the distance was what was meant
+    if abs(ZIPS[int_idx] - postal_code) > MAX_ZIP_DISTANCE:
+        return None
+    return int(ZIPS[int_idx])
+
+
+def _get_county(point: Point) -> Optional[str]:
+    """dot_maps' original `get_county` loop."""
+    int_indices = COUNTIES.sindex.query(point)
+    if len(int_indices) == 0:
+        return None
+    return COUNTIES.at[COUNTIES.index[int_indices[0]], 'GEOID']
+
+
+def _as_list(ser: pandas.Series) -> list:
+    return ser.astype(object).where(ser.notna(), None).to_list()
+
+
+POSTAL_CODES = pandas.Series(['60612', '60610', '60613', '02116', '2117', '01000', '00990', '99999',
+                              '99960', '12345', None, 'n/a', 60601.0, '60614-1234'])
+
+
+def test_nearest_zips_matches_the_loop():
+    expected = [_closest_zip(pandas.to_numeric(c, errors='coerce')) for c in POSTAL_CODES]
+
+    assert _as_list(nearest_zips(POSTAL_CODES, ZIPS)) == expected
+
+
+def test_nearest_zips_random_codes_match_the_loop():
+    codes = pandas.Series(np.random.default_rng(0).integers(0, 100_000, 2000)).astype(float)
+    codes[::7] = np.nan
+
+    expected = [_closest_zip(c) for c in codes]
+
+    assert _as_list(nearest_zips(codes, ZIPS)) == expected
+
+
+def test_zip_points_are_the_matched_centroids():
+    points = zip_points(POSTAL_CODES, CENTROIDS)
+
+    for code, point in zip(POSTAL_CODES, points):
+        zipcode = _closest_zip(pandas.to_numeric(code, errors='coerce'))
+        if zipcode is None:
+            assert point is None or point.is_empty
+        else:
+            assert point.equals(CENTROIDS.at[zipcode, 'geometry'])
+    assert points.crs == CENTROIDS.crs
+
+
+def test_assign_counties_matches_the_loop():
+    rng = np.random.default_rng(0)
+    points = gpd.GeoSeries([Point(x, y) for x, y in rng.uniform(-0.5, 3.5, (200, 2))], crs=4269)
+
+    assert _as_list(assign_counties(points, COUNTIES)) == [_get_county(p) for p in points]
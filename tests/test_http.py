@@ -0,0 +1,132 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+
+import pytest
+import requests
+
+from util import http
+from util.http import FetchError, RateLimiter, get_with_backoff, make_session
+
+
+class _Scripted(BaseHTTPRequestHandler):
+    """Answers each path with the next (status, headers) in `script[path]`, then 200."""
+
+    script: Dict[str, List[Tuple[int, Dict[str, str]]]] = {}
+    requests: List[str] = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        status, headers = self.script.get(self.path, []).pop(0) if self.script.get(self.path) else (200, {})
+        body = b'ok' if status == 200 else b''
+        self.send_response(status)
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    _Scripted.script, _Scripted.requests = {}, []
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), _Scripted)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{httpd.server_port}'
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Records the backoff delays instead of sleeping; jitter always picks the upper bound."""
+    delays = []
+    monkeypatch.setattr(http.time, 'sleep', delays.append)
+    monkeypatch.setattr(http.random, 'uniform', lambda low, high: high)
+    return delays
+
+
+def _response(retry_after):
+    resp = requests.Response()
+    resp.headers['Retry-After'] = retry_after
+    return resp
+
+
+def test_retry_after_seconds_and_http_dates():
+    assert http._retry_after(requests.Response()) is None
+    assert http._retry_after(_response('7')) == 7
+    assert http._retry_after(_response('-3')) == 0
+    assert http._retry_after(_response('soon')) is None
+
+    later = http._retry_after(_response(format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30),
+                                                        usegmt=True)))
+    assert 25 < later <= 30
+    assert http._retry_after(_response('Wed, 21 Oct 2015 07:28:00 GMT')) == 0
+
+
+def test_retries_until_success(server, sleeps):
+    _Scripted.script['/page'] = [(503, {}), (429, {'Retry-After': '9'}), (500, {})]
+
+    resp = get_with_backoff(make_session(), f'{server}/page', backoff=1, max_backoff=60)
+
+    assert resp.status_code == 200 and resp.text == 'ok'
+    assert len(_Scripted.requests) == 4
+    assert sleeps == [1, 9, 4]  # Retry-After wins over a shorter backoff
+
+
+def test_backoff_is_capped(server, sleeps):
+    _Scripted.script['/page'] = [(503, {})] * 5
+
+    get_with_backoff(make_session(), f'{server}/page', max_retries=5, backoff=1, max_backoff=5)
+
+    assert sleeps == [1, 2, 4, 5, 5]
+
+
+def test_gives_up_after_max_retries(server, sleeps):
+    _Scripted.script['/page'] = [(502, {})] * 10
+
+    with pytest.raises(FetchError) as e:
+        get_with_backoff(make_session(), f'{server}/page', max_retries=2)
+
+    assert e.value.attempts == 3 and e.value.status == 502
+    assert len(_Scripted.requests) == 3
+
+
+def test_other_errors_are_not_retried(server, sleeps):
+    _Scripted.script['/page'] = [(404, {})]
+
+    assert get_with_backoff(make_session(), f'{server}/page').status_code == 404
+    assert sleeps == []
+
+
+def test_connection_errors_are_retried(sleeps):
+    with pytest.raises(FetchError) as e:
+        get_with_backoff(make_session(), 'http://127.0.0.1:1/page', max_retries=1, timeout=1)
+
+    assert e.value.status is None and 'ConnectionError' in e.value.reason
+    assert len(sleeps) == 1
+
+
+def test_rate_limiter_spaces_requests():
+    limiter = RateLimiter(requests_per_second=50, burst=2)
+
+    start = time.monotonic()
+    for _ in range(7):
+        limiter.acquire()
+
+    # the burst goes at once, the other five wait 1/50 s each
+    assert 5 / 50 * 0.9 <= time.monotonic() - start < 1
+
+
+def test_unlimited_rate_limiter_never_waits(monkeypatch):
+    monkeypatch.setattr(http.time, 'sleep', lambda s: pytest.fail('slept'))
+    limiter = RateLimiter()
+    for _ in range(100):
+        limiter.acquire()
@@ -0,0 +1,98 @@
+import json
+import logging
+
+import pytest
+
+from util.instrumentation import Histogram, Metrics, StageRun
+
+
+def test_histogram_buckets_and_quantiles():
+    h = Histogram(buckets=(1, 2, 5, float('inf')))
+    for value in [0.5] * 50 + [1] * 10 + [1.5] * 30 + [4] * 9 + [100]:
+        h.observe(value)
+
+    assert h.counts == [60, 30, 9, 1]  # a value on a bound goes in that bound's bucket
+    assert h.quantile(0.5) == 1
+    assert h.quantile(0.6) == 1
+    assert h.quantile(0.61) == 2
+    assert h.quantile(0.99) == 5
+    assert h.quantile(1) == 100  # the +inf bucket reports the largest value seen
+    assert h.quantile(0) == 1
+
+    d = h.to_dict()
+    assert (d['count'], d['min'], d['max']) == (100, 0.5, 100)
+    assert (d['p50'], d['p90'], d['p99']) == (1, 2, 5)
+    assert d['buckets'] == {'<=1': 60, '<=2': 30, '<=5': 9, '+inf': 1}
+
+
+def test_quantiles_never_exceed_the_largest_value():
+    h = Histogram()
+    for value in (0.01, 0.02, 0.2):
+        h.observe(value)
+
+    assert h.quantile(0.5) == 0.05
+    assert h.quantile(0.99) == 0.2
+
+
+def test_empty_histogram():
+    d = Histogram().to_dict()
+
+    assert d['count'] == 0
+    assert d['mean'] is d['min'] is d['p50'] is d['p99'] is None
+
+
+def _report(tmp_path, name):
+    with open(tmp_path / f'{name}.json') as f:
+        return json.load(f)
+
+
+def test_stage_run_writes_a_report(tmp_path):
+    metrics = Metrics()
+    metrics.incr('left over from an earlier stage')
+
+    with StageRun('clean', report_dir=str(tmp_path), metrics=metrics, profile=[]) as run:
+        run.rows(3)
+        run.rows()
+        metrics.record_http(200, 0.07)
+        metrics.record_http(429, 0.3, retry=True)
+
+    report = _report(tmp_path, 'clean')
+    assert report == run.report
+    assert report['stage'] == 'clean' and report['status'] == 'ok' and report['error'] is None
+    assert report['rows'] == 4
+    assert report['counters'] == {'http.429': 1, 'http.requests': 2, 'http.retries': 1, 'http.status.200': 1,
+                                  'http.status.429': 1, 'rows': 4}
+    assert report['histograms']['http.latency']['count'] == 2
+    assert report['histograms']['http.latency']['p50'] == 0.1
+    assert not list(tmp_path.glob('*.tmp'))
+
+
+def test_failed_stage_still_writes_its_report(tmp_path):
+    with pytest.raises(ValueError):
+        with StageRun('npi', report_dir=str(tmp_path), metrics=Metrics(), profile=[]):
+            raise ValueError('bad row')
+
+    report = _report(tmp_path, 'npi')
+    assert report['status'] == 'failed'
+    assert report['error'] == "ValueError('bad row')"
+
+
+def test_profilers_add_to_the_report(tmp_path):
+    with StageRun('cube', report_dir=str(tmp_path), metrics=Metrics(), profile=['cprofile', 'tracemalloc']):
+        sorted(str(i) for i in range(10_000))
+
+    report = _report(tmp_path, 'cube')
+    assert (tmp_path / 'cube.prof').exists()
+    assert report['cprofile']['top']
+    assert report['tracemalloc']['peak_mb'] > 0
+
+
+def test_progress_is_throttled(tmp_path, caplog):
+    with caplog.at_level(logging.INFO, logger='util.instrumentation'):
+        with StageRun('npi', report_dir=str(tmp_path), metrics=Metrics(), profile=[],
+                      progress_interval=3600) as run:
+            for i in range(100):
+                run.progress(i + 1, 100)
+            run.progress(100, 100, force=True)
+
+    assert sum('rows/s' in r.message for r in caplog.records) == 2
@@ -0,0 +1,30 @@
+import os
+
+from basic_data.iteds import _is_interesting, _parse_profile_tables
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures', 'iteds')
+
+
+def _parse(name):
+    with open(os.path.join(FIXTURES, name)) as f:
+        return {'__DOCTOR_NAME_FROM_CSV': 'Doe, Jane', **_parse_profile_tables(f.read())}
+
+
+def test_parse_profile_tables():
+    out = _parse('profile.html')
+
+    assert out == {'__DOCTOR_NAME_FROM_CSV': 'Doe, Jane', 'Name': 'Jane Doe',
+                   'Practice': 'Eye Associates of Chicago', 'City': 'Chicago',
+                   'Specialty': 'Oculoplastic Surgery'}
+    assert _is_interesting(out)
+
+
+def test_name_only_profile_is_not_interesting():
+    assert not _is_interesting(_parse('profile_name_only.html'))
+
+
+def test_page_without_tables_is_not_interesting():
+    out = _parse('profile_no_tables.html')
+
+    assert out == {'__DOCTOR_NAME_FROM_CSV': 'Doe, Jane'}
+    assert not _is_interesting(out)
@@ -0,0 +1,74 @@
+import pandas
+
+from link_with_open_payments.join_roster import (
+    MANUFACTURER_ID_COL, PROFILE_ID_COL, collapse_roster, doctors_on_take, join_payments_to_roster)
+
+ROSTER = pandas.DataFrame({
+    'first_name': ['Ann', 'Bob', 'Cara'],
+    'last_name': ['Lee', 'Smith', 'Jones'],
+    'state': ['IL', 'MA', 'CO'],
+    'src': ['asoprs', 'tepezza', 'tepezza'],
+    'npi': [1000000001, None, 1000000003],  # Bob's NPI never resolved
+})
+
+
+def _payments(rows):
+    return pandas.DataFrame(rows, columns=[PROFILE_ID_COL, 'physician_first_name', 'physician_last_name',
+                                           'recipient_state', 'npi', MANUFACTURER_ID_COL])
+
+
+def test_join_by_name():
+    payments = _payments([
+        ('1', 'ann ', 'LEE', 'IL', None, '100000131389'),
+        ('2', 'Dan', 'Lee', 'IL', None, '100000131389'),
+        ('3', 'Ann', 'Lee', 'IL', None, '999'),
+    ])
+
+    joined = join_payments_to_roster(payments, collapse_roster(ROSTER), manufacturer_ids=[100000131389])
+
+    assert joined[PROFILE_ID_COL].to_list() == ['1']
+    assert joined['src'].to_list() == ['asoprs']
+
+
+def test_npis_not_on_the_roster_fall_back_to_names():
+    payments = _payments([
+        ('1', 'Someone', 'Else', 'IL', 1000000001, '100000131389'),  # on the roster by npi
+        ('2', 'Bob', 'Smith', 'MA', 1000000002, '100000131389'),  # npi unresolved on the roster
+        ('3', 'Cara', 'Jones', 'CO', None, '100000131389'),  # no npi
+        ('4', 'Nobody', 'Known', 'TX', 1000000009, '100000131389'),
+    ])
+
+    joined = join_payments_to_roster(payments, collapse_roster(ROSTER), npi_col='npi')
+
+    assert sorted(joined[PROFILE_ID_COL]) == ['1', '2', '3']
+    assert joined.set_index(PROFILE_ID_COL).loc['1', 'first_name'] == 'ANN'
+
+
+def test_doctors_on_take_ignores_missing_profile_ids():
+    payments = _payments([
+        ('1', 'Ann', 'Lee', 'IL', None, '100000131389'),
+        ('1', 'Ann', 'Lee', 'IL', None, '100000131389'),
+        (None, 'Bob', 'Smith', 'MA', None, '100000131389'),
+    ])
+    roster = collapse_roster(ROSTER)
+
+    out = doctors_on_take(join_payments_to_roster(payments, roster), roster)
+
+    assert out.loc['asoprs', 'on_take'] == 1
+    assert out.loc['tepezza', 'on_take'] == 0
+    assert out.loc['tepezza', 'likely_prescribers_count'] == 2
+
+
+def test_keep_unpaid_adds_roster_rows_without_payments():
+    payments = _payments([
+        ('1', 'Ann', 'Lee', 'IL', None, '100000131389'),
+        ('2', 'Ann', 'Lee', 'IL', None, '100000131389'),
+    ])
+    roster = collapse_roster(ROSTER)
+
+    joined = join_payments_to_roster(payments, roster, keep_unpaid=True)
+
+    assert len(joined) == 4
+    assert sorted(joined['first_name']) == ['ANN', 'ANN', 'BOB', 'CARA']
+    assert joined[PROFILE_ID_COL].isna().sum() == 2
+    assert '_roster_row' not in joined
@@ -0,0 +1,42 @@
+from util.jsonl import JsonlSink, read_jsonl, truncate_torn_line
+
+
+def test_append_after_torn_line(tmp_path):
+    path = str(tmp_path / 'sink.jsonl')
+    with JsonlSink(path) as sink:
+        sink.append({'id': 1})
+    with open(path, 'a') as f:
+        f.write('{"id": 2, "attr')  # killed mid-write
+
+    with JsonlSink(path) as sink:
+        sink.append({'id': 3})
+
+    assert list(read_jsonl(path)) == [{'id': 1}, {'id': 3}]
+
+
+def test_torn_first_line(tmp_path):
+    path = tmp_path / 'sink.jsonl'
+    path.write_text('{"id"')
+
+    with JsonlSink(str(path)) as sink:
+        sink.append({'id': 1})
+
+    assert path.read_text() == '{"id": 1}\n'
+
+
+def test_intact_file_untouched(tmp_path):
+    path = str(tmp_path / 'sink.jsonl')
+    for i in range(3):
+        with JsonlSink(path) as sink:
+            sink.append({'id': i})
+
+    assert [r['id'] for r in read_jsonl(path)] == [0, 1, 2]
+
+
+def test_torn_line_longer_than_a_block(tmp_path):
+    path = tmp_path / 'sink.jsonl'
+    path.write_text('{"id": 1}\n{"id": 2, "attrs": {"a"')
+
+    truncate_torn_line(str(path), block_size=4)
+
+    assert path.read_text() == '{"id": 1}\n'
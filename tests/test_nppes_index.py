@@ -0,0 +1,62 @@
+import os
+
+import pytest
+
+from get_npi.nppes_index import NppesTransport, build_index
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+@pytest.fixture
+def transport(tmp_path):
+    db_path = str(tmp_path / 'nppes.sqlite')
+    assert build_index(os.path.join(FIXTURES, 'nppes_sample.csv'), db_path, chunksize=2) == 4
+    return NppesTransport(db_path)
+
+
+def _npis(res):
+    return [r['number'] for r in res['results']]
+
+
+def test_deactivated_providers_are_dropped(transport):
+    assert _npis(transport.get({'last_name': 'SMITH', 'first_name': 'BOB'})) == []
+    assert _npis(transport.get({'last_name': 'JONES', 'first_name': 'CARA'})) == [1000000004]  # reactivated
+
+
+def test_organizations_are_not_indexed(transport):
+    assert _npis(transport.get({'city': 'CHICAGO', 'state': 'IL'})) == [1000000001]
+
+
+def test_zip5_lookups(transport):
+    # the file has ZIP+4 as bare 9 digits; roster zips come as ZIP+4 or through a float column
+    for postal_code in ('60612', '60612-1234', '60612.0', '606121234'):
+        assert _npis(transport.get({'last_name': 'LEE', 'postal_code': postal_code})) == [1000000001]
+    assert _npis(transport.get({'last_name': 'LEE', 'postal_code': '2108'})) == []
+    assert _npis(transport.get({'last_name': 'JONES', 'postal_code': '2108'})) == [1000000004]
+
+
+def test_names_are_normalized(transport):
+    res = transport.get({'first_name': 'ann ', 'last_name': 'lee', 'state': 'il', 'specialty_code': '207R00000X'})
+    assert _npis(res) == [1000000002]
+    assert {t['code'] for t in res['results'][0]['taxonomies']} == {'207RE0101X', '207R00000X'}
+
+
+def test_taxonomies_per_result(transport):
+    res = transport.get({'last_name': 'LEE'})
+    assert {r['number']: sorted(t['code'] for t in r['taxonomies']) for r in res['results']} == {
+        1000000001: ['207W00000X'], 1000000002: ['207R00000X', '207RE0101X']}
+
+
+def test_paging(transport):
+    assert _npis(transport.get({'last_name': 'LEE', 'limit': 1})) == [1000000001]
+    assert _npis(transport.get({'last_name': 'LEE', 'limit': 1, 'skip': 1})) == [1000000002]
+
+
+def test_update_file_deactivates_and_moves(tmp_path, transport):
+    # as in the real files, the deactivated row has no entity type, name or address
+    build_index(os.path.join(FIXTURES, 'nppes_update.csv'), transport.db_path)
+    transport = NppesTransport(transport.db_path)  # fresh read-only connection
+
+    assert _npis(transport.get({'last_name': 'PATEL'})) == []
+    assert _npis(transport.get({'last_name': 'LEE', 'city': 'CHICAGO'})) == []
+    assert _npis(transport.get({'last_name': 'LEE', 'postal_code': '60201'})) == [1000000001]
@@ -0,0 +1,71 @@
+import numpy as np
+import pandas
+import pytest
+
+pytest.importorskip('geopandas')
+pytest.importorskip('us')
+
+from vizualize.payment_cube import ALL_YEARS, UNKNOWN_YEAR, build_cube, manufacturer_ids, slice_cube, totals
+
+IL, MA = 17, 25
+HORIZON_ID = '100000131389'
+
+ROSTER = pandas.DataFrame({
+    'first_name': ['Jane', 'John'],
+    'last_name': ['Doe', 'Smith'],
+    'state': ['IL', 'MA'],
+    'postal_code': ['60612', '02115'],
+    'src': ['asoprs', 'endocrinologists'],
+})
+
+TRANSACTIONS = pandas.DataFrame({
+    'first_name': ['JANE', 'JANE', 'JOHN'],
+    'last_name': ['DOE', 'DOE', 'SMITH'],
+    'state': ['IL', 'IL', 'MA'],
+    'physician_profile_id': ['1', '1', '2'],
+    'applicable_manufacturer_or_applicable_gpo_making_payment_id': [HORIZON_ID] * 3,
+    'total_amount_of_payment_usdollars': [10.0, 20.0, 5.0],
+    'program_year': [2019, None, 2020],
+    'date_of_payment': ['03/01/2019', None, None],
+})
+
+
+@pytest.fixture
+def cube():
+    return build_cube(TRANSACTIONS, ROSTER)
+
+
+def test_unknown_year_is_counted_once(cube):
+    by_state = totals(cube, 'state_fips')
+
+    assert by_state.loc[IL, ['paid_doctors', 'dollars', 'doctors']].to_list() == [1, 30.0, 1]
+    assert by_state.loc[MA, ['paid_doctors', 'dollars', 'doctors']].to_list() == [1, 5.0, 1]
+    assert totals(cube, 'state_fips', HORIZON_ID).equals(by_state)
+
+
+def test_year_slices(cube):
+    assert totals(cube, 'state_fips', year=2019).loc[IL, 'dollars'] == 10.0
+    assert totals(cube, 'state_fips', year=UNKNOWN_YEAR).loc[IL, 'dollars'] == 20.0
+    assert set(cube['year']) == {ALL_YEARS, UNKNOWN_YEAR, 2019, 2020}
+
+
+def test_float_ids_from_the_merge_csv(tmp_path):
+    # the right merge leaves unpaid doctors' payment columns empty, so the ids went through float
+    merged = pandas.concat([TRANSACTIONS, pandas.DataFrame({
+        'first_name': ['NOBODY'], 'last_name': ['PAID'], 'state': ['IL']})], ignore_index=True)
+    merged['applicable_manufacturer_or_applicable_gpo_making_payment_id'] = [
+        float(HORIZON_ID)] * 3 + [np.nan]
+    merged.to_csv(tmp_path / 'all_transactions.csv')
+
+    for dtype in ('string', None):
+        transactions = pandas.read_csv(tmp_path / 'all_transactions.csv', index_col=0, dtype={
+            'applicable_manufacturer_or_applicable_gpo_making_payment_id': dtype})
+        cube = build_cube(transactions, ROSTER)
+
+        assert slice_cube(cube, HORIZON_ID)['dollars'].sum() == 35.0
+
+
+def test_manufacturer_ids():
+    ids = pandas.Series(['100000131389.0', '100000131389', ' 42 ', 'GPO-7', None], dtype='string')
+
+    assert manufacturer_ids(ids).to_list() == ['100000131389', '100000131389', '42', 'GPO-7', pandas.NA]
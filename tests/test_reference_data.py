@@ -0,0 +1,134 @@
+import hashlib
+import os
+import threading
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+
+import pandas
+import pytest
+
+gpd = pytest.importorskip('geopandas')
+
+from vizualize import reference_data
+from vizualize.reference_data import Asset, ChecksumMismatch, ReferenceData
+
+BODY = b'not really a spreadsheet'
+
+
+class _Asset(BaseHTTPRequestHandler):
+    requests: List[str] = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    _Asset.requests = []
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), _Asset)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{httpd.server_port}'
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def asset(server, monkeypatch):
+    """An asset served locally, trusted on first download."""
+    monkeypatch.setitem(reference_data.ASSETS, 'test', Asset(f'{server}/asset.bin', 'asset.bin'))
+    return 'test'
+
+
+def test_download_once_and_record_checksum(tmp_path, asset):
+    ref = ReferenceData(str(tmp_path))
+
+    path = ref.path(asset)
+    assert ref.path(asset) == path
+    assert _Asset.requests == ['/asset.bin']
+    with open(path, 'rb') as f:
+        assert f.read() == BODY
+    assert not os.path.exists(f'{path}.part')
+    assert ref._manifest() == {asset: hashlib.sha256(BODY).hexdigest()}
+
+
+def test_changed_file_fails_the_recorded_checksum(tmp_path, asset):
+    ref = ReferenceData(str(tmp_path))
+    path = ref.path(asset)
+    with open(path, 'ab') as f:
+        f.write(b'!')
+
+    with pytest.raises(ChecksumMismatch):
+        ref.path(asset)
+
+
+def test_pinned_checksum(tmp_path, server, monkeypatch):
+    monkeypatch.setitem(reference_data.ASSETS, 'pinned', Asset(f'{server}/asset.bin', 'asset.bin', '0' * 64))
+
+    with pytest.raises(ChecksumMismatch):
+        ReferenceData(str(tmp_path)).path('pinned')
+
+
+def test_offline_uses_fixture_files_only(tmp_path, asset):
+    ref = ReferenceData(str(tmp_path), offline=True)
+    with pytest.raises(FileNotFoundError):
+        ref.path(asset)
+
+    os.makedirs(tmp_path / 'raw')
+    (tmp_path / 'raw' / 'asset.bin').write_bytes(b'fixture')
+    assert ref.path(asset) == os.path.join(str(tmp_path), 'raw', 'asset.bin')
+    assert _Asset.requests == []
+
+
+def test_derived_tables_are_built_once(tmp_path):
+    ref = ReferenceData(str(tmp_path), offline=True)
+    builds = []
+
+    def build():
+        builds.append(1)
+        return pandas.DataFrame({'a': [1, 2]})
+
+    first = ref._cached('table', build)
+    second = ref._cached('table', build)
+
+    assert len(builds) == 1
+    assert first.equals(second)
+
+
+def _zcta_fixture(data_dir):
+    """A two-ZCTA shapefile, zipped where `ReferenceData` expects the census download."""
+    from shapely.geometry import box
+
+    shapes = gpd.GeoDataFrame({'ZCTA5CE10': ['60612', '02115']},
+                              geometry=[box(-87.7, 41.8, -87.6, 41.9), box(-71.1, 42.3, -71.0, 42.4)],
+                              crs=4269)
+    shapes.to_file(data_dir / 'zcta.shp')
+    os.makedirs(data_dir / 'raw')
+    with zipfile.ZipFile(data_dir / 'raw' / reference_data.ASSETS['zcta'].filename, 'w') as z:
+        for ext in ('shp', 'shx', 'dbf', 'prj', 'cpg'):
+            if os.path.exists(data_dir / f'zcta.{ext}'):
+                z.write(data_dir / f'zcta.{ext}', f'zcta.{ext}')
+
+
+def test_zcta_centroids_from_fixture_dir(tmp_path, monkeypatch):
+    _zcta_fixture(tmp_path)
+    ref = ReferenceData(str(tmp_path), offline=True)
+
+    centroids = ref.zcta_centroids()
+
+    assert centroids.index.to_list() == [2115, 60612]
+    assert centroids.loc[60612].geometry.x == pytest.approx(-87.65)
+
+    # the second time it's read back from processed/, geometry and all
+    monkeypatch.setattr(ReferenceData, '_read_shapes', lambda self, name: pytest.fail('read shapes again'))
+    cached = ReferenceData(str(tmp_path), offline=True).zcta_centroids()
+    assert isinstance(cached, gpd.GeoDataFrame)
+    assert cached.geom_equals(centroids).all()
@@ -0,0 +1,127 @@
+import pandas
+
+from get_npi.resolver import NpiResolver, ProbeMemo
+
+
+def _params(last_name, city='CHICAGO', first_name='ANN'):
+    return {'first_name': first_name, 'last_name': last_name, 'city': city, 'state': 'IL'}
+
+
+def test_memo_groups_by_name_free_params():
+    memo = ProbeMemo()
+    memo.put(_params('LEE'), (1, 1234567890))
+    memo.put(_params('KIM'), (0, None))
+
+    assert memo.get(_params('LEE')) == (1, 1234567890)
+    assert memo.get(_params('KIM')) == (0, None)
+    assert memo.get(_params('LEE', city='PEORIA')) is None
+    assert len(memo._groups) == 1 and memo.size == 2
+
+
+def test_memo_evicts_least_recently_used_group():
+    memo = ProbeMemo(max_size=2)
+    memo.put(_params('LEE', city='CHICAGO'), (1, 1))
+    memo.put(_params('LEE', city='PEORIA'), (1, 2))
+    memo.get(_params('LEE', city='CHICAGO'))
+    memo.put(_params('LEE', city='URBANA'), (1, 3))
+
+    assert memo.get(_params('LEE', city='PEORIA')) is None
+    assert memo.get(_params('LEE', city='CHICAGO')) == (1, 1)
+    assert memo.size == 2
+
+
+def test_memo_bounds_a_single_group():
+    memo = ProbeMemo(max_size=2)
+    for name in ('LEE', 'KIM', 'PARK'):
+        memo.put(_params(name), (0, None))
+
+    assert memo.size == 2
+    assert memo.get(_params('LEE')) is None
+
+
+class _Registry:
+    """One doctor per last name; counts every request."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def get(self, params):
+        self.calls += 1
+        return {'result_count': 1, 'results': [{'number': 1000000000 + len(params['last_name'])}]}
+
+
+def test_bisect_reuses_probes_for_repeated_rows():
+    row = {'first_name': 'ANN', 'last_name': 'LEE', 'city': 'CHICAGO', 'postal_code': '60601',
+           'state': 'IL', 'specialty_code': '207W00000X'}
+    df = pandas.DataFrame([row, row, {**row, 'src': 'tepezza'}])
+    registry = _Registry()
+
+    results = dict(NpiResolver(registry, workers=1, strategy='bisect').resolve(df.iterrows()))
+
+    assert {r.npi for r in results.values()} == {1000000003}
+    assert registry.calls == 1
+
+
+_MATCHED = ('first_name', 'last_name', 'city', 'state', 'postal_code', 'specialty_code')
+
+_DOCTORS = pandas.DataFrame([
+    # the only ANN LEE in the country
+    {'number': 1, 'first_name': 'ANN', 'last_name': 'LEE', 'city': 'CHICAGO', 'state': 'IL',
+     'postal_code': '60601', 'specialty_code': '207W00000X'},
+    # two JOHN SMITHs in Boston, told apart by specialty; a third in Chicago
+    {'number': 2, 'first_name': 'JOHN', 'last_name': 'SMITH', 'city': 'BOSTON', 'state': 'MA',
+     'postal_code': '02108', 'specialty_code': '207W00000X'},
+    {'number': 3, 'first_name': 'JOHN', 'last_name': 'SMITH', 'city': 'BOSTON', 'state': 'MA',
+     'postal_code': '02108', 'specialty_code': '207RE0101X'},
+    {'number': 4, 'first_name': 'JOHN', 'last_name': 'SMITH', 'city': 'CHICAGO', 'state': 'IL',
+     'postal_code': '60601', 'specialty_code': '207W00000X'},
+    # twins at the same practice: never unique
+    {'number': 5, 'first_name': 'MARY', 'last_name': 'JONES', 'city': 'DENVER', 'state': 'CO',
+     'postal_code': '80202', 'specialty_code': '207W00000X'},
+    {'number': 6, 'first_name': 'MARY', 'last_name': 'JONES', 'city': 'DENVER', 'state': 'CO',
+     'postal_code': '80202', 'specialty_code': '207W00000X'},
+    # moved since the roster was made
+    {'number': 7, 'first_name': 'RAJ', 'last_name': 'PATEL', 'city': 'AUSTIN', 'state': 'TX',
+     'postal_code': '73301', 'specialty_code': '207W00000X'},
+])
+
+
+class _SearchableRegistry:
+    """Answers like the registry: doctors matching every non-blank param, paged by skip/limit."""
+
+    def get(self, params):
+        match = pandas.Series(True, index=_DOCTORS.index)
+        for k in _MATCHED:
+            if params.get(k):
+                match &= _DOCTORS[k] == params[k]
+        numbers = _DOCTORS.loc[match, 'number'].to_list()[params['skip']:params['skip'] + params['limit']]
+        return {'result_count': len(numbers), 'results': [{'number': n} for n in numbers]}
+
+
+def test_bisect_and_linear_agree():
+    roster = pandas.DataFrame([
+        {'first_name': 'ANN', 'last_name': 'LEE', 'city': 'EVANSTON', 'state': 'IL',
+         'postal_code': '60201', 'specialty_code': '207W00000X'},
+        {'first_name': 'JOHN', 'last_name': 'SMITH', 'city': 'BOSTON', 'state': 'MA',
+         'postal_code': '02108', 'specialty_code': '207RE0101X'},
+        {'first_name': 'JOHN', 'last_name': 'SMITH', 'city': 'BOSTON', 'state': 'MA',
+         'postal_code': '02108', 'specialty_code': None},
+        {'first_name': 'JOHN', 'last_name': 'SMITH', 'city': 'CHICAGO', 'state': 'IL',
+         'postal_code': '60601', 'specialty_code': '207W00000X'},
+        {'first_name': 'MARY', 'last_name': 'JONES', 'city': 'DENVER', 'state': 'CO',
+         'postal_code': '80202', 'specialty_code': '207W00000X'},
+        {'first_name': 'RAJ', 'last_name': 'PATEL', 'city': 'DALLAS', 'state': 'TX',
+         'postal_code': '75201', 'specialty_code': '207W00000X'},
+        {'first_name': 'NOBODY', 'last_name': 'HERE', 'city': 'DALLAS', 'state': 'TX',
+         'postal_code': '75201', 'specialty_code': '207W00000X'},
+        {'first_name': 'ANN', 'last_name': None, 'city': 'CHICAGO', 'state': 'IL',
+         'postal_code': '60601', 'specialty_code': '207W00000X'},
+    ])
+    registry = _SearchableRegistry()
+
+    npis = {strategy: {idx: result.npi for idx, result in
+                       NpiResolver(registry, workers=2, strategy=strategy).resolve(roster.iterrows())}
+            for strategy in ('linear', 'bisect')}
+
+    assert npis['linear'] == npis['bisect']
+    assert [npis['linear'][i] for i in roster.index] == [1, 3, None, 4, None, 7, None, None]
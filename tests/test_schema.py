@@ -0,0 +1,61 @@
+import pandas
+import pytest
+
+from util.schema import PAYMENTS_SCHEMA, ROSTER_SCHEMA, normalize_zip5, read_table, write_table
+
+ROSTER = pandas.DataFrame({
+    'first_name': ['JANE', 'JOHN', None],
+    'last_name': ['DOE', 'SMITH', 'ROE'],
+    'city': ['BOSTON', 'CHICAGO', None],
+    'postal_code': ['02115-1234', 60612.0, None],
+    'state': ['MA', 'IL', 'IL'],
+    'specialty_code': ['207RE0101X', None, '207W00000X'],
+    'src': ['endocrinologists', 'asoprs', 'tepezza'],
+    'npi': [1234567893, -1, None],
+    'specialty': ['Endocrinology', None, 'Ophthalmology'],
+})
+
+
+def test_normalize_zip5():
+    zips = normalize_zip5(pandas.Series(['60612.0', '2115', '02115-1234', '606120001', None]))
+
+    assert str(zips.dtype) == 'string'
+    assert zips.to_list()[:4] == ['60612', '02115', '02115', '60612']
+    assert zips.isna().to_list() == [False] * 4 + [True]
+
+
+@pytest.mark.parametrize('csv_only', [False, True])
+def test_roster_round_trip(tmp_path, csv_only):
+    stem = str(tmp_path / 'all')
+    write_table(ROSTER, stem, ROSTER_SCHEMA)
+    if csv_only:
+        (tmp_path / 'all.parquet').unlink()
+
+    df = read_table(stem, ROSTER_SCHEMA)
+
+    assert {c: str(t) for c, t in df.dtypes.items()} == ROSTER_SCHEMA
+    assert df['postal_code'].to_list()[:2] == ['02115', '60612']
+    assert df['npi'].to_list()[:2] == [1234567893, -1]
+
+
+@pytest.mark.parametrize('csv_only', [False, True])
+def test_payments_round_trip(tmp_path, csv_only):
+    payments = pandas.DataFrame({
+        'physician_profile_id': ['1083708', '42'],
+        'recipient_state': ['IL', 'MA'],
+        'recipient_zip_code': ['06011', '60612-0001'],
+        'total_amount_of_payment_usdollars': [12.5, 1000.0],
+        'program_year': [2019, 2020],
+        'applicable_manufacturer_or_applicable_gpo_making_payment_id': ['100000131389', '100000131389'],
+        'is_research': [False, True],
+    })
+    stem = str(tmp_path / 'open_payments')
+    write_table(payments, stem, PAYMENTS_SCHEMA)
+    if csv_only:
+        (tmp_path / 'open_payments.parquet').unlink()
+
+    df = read_table(stem, PAYMENTS_SCHEMA)
+
+    assert {c: str(t) for c, t in df.dtypes.items()} == {c: PAYMENTS_SCHEMA[c] for c in payments}
+    assert df['recipient_zip_code'].to_list() == ['06011', '60612-0001']
+    assert df['physician_profile_id'].to_list() == ['1083708', '42']
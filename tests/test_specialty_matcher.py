@@ -0,0 +1,57 @@
+import gc
+import weakref
+from difflib import SequenceMatcher
+
+import pandas
+
+from clean_basic_data.specialty_matcher import SpecialtyMatcher
+
+CROSSWALK = pandas.DataFrame({
+    'Code': ['207W00000X', '207RE0101X', '207R00000X', '152W00000X', '207WX0200X', '207WX0107X', '261QM0801X'],
+    'Classification': ['Ophthalmology', 'Internal Medicine', 'Internal Medicine', 'Optometrist',
+                       'Ophthalmology', 'Ophthalmology', 'Clinic/Center'],
+    'Specialization': [None, 'Endocrinology, Diabetes & Metabolism', None, None,
+                       'Ophthalmic Plastic and Reconstructive Surgery', 'Retina Specialist', None],
+})
+REPLACEMENTS = {'Optometry': 'Optometrist', 'OPR': 'Ophthalmic Plastic and Reconstructive Surgery'}
+
+
+def _scan(specialty, threshold=0.95):
+    specialty = REPLACEMENTS.get(specialty, specialty)
+    names = CROSSWALK['Specialization'].fillna(CROSSWALK['Classification'])
+    for name, code in zip(names, CROSSWALK['Code']):
+        if SequenceMatcher(None, name, specialty).ratio() >= threshold:
+            return code
+
+
+def test_matches_the_row_by_row_scan():
+    matcher = SpecialtyMatcher(CROSSWALK, replacements=REPLACEMENTS)
+    specialties = ['Ophthalmology', 'Opthalmology', 'Internal Medicine', 'Internal Medicin', 'Optometry',
+                   'OPR', 'Retina Specialist', 'Endocrinology', 'Clinic/Center', 'Dermatology', '']
+
+    assert [matcher.match(s) for s in specialties] == [_scan(s) for s in specialties]
+
+
+def test_earlier_near_match_beats_exact_name():
+    crosswalk = pandas.DataFrame({
+        'Code': ['A', 'B'], 'Classification': ['Ophthalmology ', 'Ophthalmology'], 'Specialization': [None, None]})
+
+    assert SpecialtyMatcher(crosswalk).match('Ophthalmology') == 'A'
+
+
+def test_match_series_and_missing_values():
+    matcher = SpecialtyMatcher(CROSSWALK, replacements=REPLACEMENTS)
+    out = matcher.match_series(pandas.Series(['Optometry', None, 'Dermatology', 'Optometry']))
+
+    assert out.to_list()[0] == '152W00000X' and out.to_list()[3] == '152W00000X'
+    assert pandas.isna(out[1]) and pandas.isna(out[2])
+
+
+def test_cache_does_not_keep_the_matcher_alive():
+    matcher = SpecialtyMatcher(CROSSWALK)
+    matcher.match('Ophthalmology')
+    ref = weakref.ref(matcher)
+
+    del matcher
+    gc.collect()
+    assert ref() is None